@@ -1,94 +1,170 @@
 import os
-import bcrypt
+import cProfile
 import datetime
-os.environ["JAVA_HOME"] = r"C:\Program Files\Java\jdk-23"
-os.environ["PATH"] = os.environ["JAVA_HOME"] + r"\bin;" + os.environ["PATH"]
-from pdf2image import convert_from_bytes
-import tabula
-import streamlit as st
-import pandas as pd
+import io
 import json
-from PIL import Image
-import pytesseract
-import re
-import tempfile
+import marshal
+import pstats
+import streamlit as st
+import streamlit.components.v1 as components
 from pathlib import Path
+from auth import (SESSION_TTL, AuthBusy, check_password, hash_password, issue_token, load_secret, revoke_sessions,
+                  verify_password, verify_token)
+from config import load_config
+from disk_cache import DiskCache, content_key
+from jobs import DONE, FAILED, JobQueue, QUEUED, RUNNING
+from lab_values import parse_lab_values
+import metrics
+from storage import io_counters, open_store
 
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-
-POPPLER_PATH = os.getenv("POPPLER_PATH", r"C:\All programs\poppler-25.07.0\Library\bin")
-
-# Alternatively in Streamlit:
-user_poppler_path = st.text_input("Poppler Path", value=POPPLER_PATH)
-POPPLER_PATH = user_poppler_path.strip() or POPPLER_PATH
-
-
-def hash_password(plain_text_password):
-    return bcrypt.hashpw(plain_text_password.encode(), bcrypt.gensalt()).decode()
-
-def check_password(plain_text_password, hashed_password):
-    try:
-        return bcrypt.checkpw(plain_text_password.encode(), hashed_password.encode())
-    except Exception:
-        return False
-
-
-def extract_text_from_pdf(pdf_path):
-    text = ""
-    tmp_path = None
-    try:
-        dfs = tabula.read_pdf(pdf_path, pages="all", multiple_tables=True, lattice=True)
-        if dfs and any(not df.empty for df in dfs):
-            for df in dfs:
-                text += df.to_csv(index=False) + "\n"
-        else:
-            raise ValueError("No tables detected")
-    except Exception:
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(open(pdf_path, "rb").read())
-                tmp_path = tmp_file.name
-
-            pages = convert_from_bytes(open(pdf_path, 'rb').read(), poppler_path=POPPLER_PATH)
-            for page in pages:
-                text += pytesseract.image_to_string(page, config="--psm 6 -l eng") + "\n"
-        except Exception as ocr_e:
-            print(f"❌ OCR failed: {ocr_e}")
-        finally:
-            if tmp_path and os.path.exists(tmp_path):
-                os.remove(tmp_path)
-    return text
-
-
+# The extraction stack (tabula and its JVM, pdf2image, pytesseract, PIL),
+# pandas/pyarrow and the risk engine are imported where first used, so the
+# login page never loads them.
 
 
 # --- Paths ---
 BASE_DIR = Path.cwd()
-user_file = BASE_DIR / "users.json"
-data_file = BASE_DIR / "patient_data.json"
-
-# --- Load/save JSON ---
-def load_json(path, default):
-    if path.exists():
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                content = f.read().strip()
-                if not content:
-                    return default
-                return json.loads(content)
-        except json.JSONDecodeError:
-            return default
-    return default
 
-def save_json(path, data):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4)
-
-users = load_json(user_file, {})
-patient_records = load_json(data_file, {})
-
-save_json(user_file, users)
-save_json(data_file, patient_records)
+# --- Config (environment, then .streamlit/config.toml) ---
+@st.cache_resource
+def get_config():
+    return load_config(BASE_DIR / ".streamlit" / "config.toml")
+
+CONFIG = get_config()
+POPPLER_PATH = CONFIG["poppler_path"]
+# Everything that changes extraction output goes into the cache key
+PDF_OCR_CONFIG = "--psm 6 -l eng"
+IMAGE_OCR_CONFIG = "--psm 6"
+PDF_DPI = 200  # pdf2image default
+TABULA_MODE = "lattice"
+# Parallel page OCR for multi-page scans; doesn't change output, so not keyed
+OCR_WORKERS = CONFIG["ocr_workers"]
+EXTRACT_MODE = CONFIG["extract_mode"]
+JOB_WORKERS = CONFIG["job_workers"]
+JOB_POLL_SECONDS = 2
+SPEECH_POLL_SECONDS = 1
+ADMIN_EMAILS = set(CONFIG["admin_emails"])
+METRICS_FILE = CONFIG["metrics_file"]
+
+# --- Record store ---
+@st.cache_resource
+def get_store():
+    # SQLite by default; storage_backend = "json" keeps the original files
+    return open_store(BASE_DIR, CONFIG["storage_backend"], CONFIG["db_path"])
+
+store = get_store()
+# Disk reads/writes made by this rerun (counted per script thread)
+io_at_start = io_counters(thread=True)
+
+# --- Session tokens ---
+SESSION_COOKIE = "doctor_buddy_session"
+
+@st.cache_resource
+def get_auth_secret():
+    return load_secret(BASE_DIR / ".auth_secret")
+
+def set_session_cookie(value, max_age):
+    # Streamlit can read cookies (st.context.cookies) but not set them, so the
+    # browser does it. Unlike a query parameter, the token stays out of the
+    # address bar, browser history, shared links and server logs.
+    cookie = f"{SESSION_COOKIE}={value}; Max-Age={max_age}; Path=/; SameSite=Strict"
+    components.html(f"<script>parent.document.cookie = {json.dumps(cookie)};</script>", height=0)
+
+def remember_session(email, user_data):
+    # Survives a browser refresh through the cookie; verified with HMAC, not bcrypt
+    token = issue_token(get_auth_secret(), email, user_data["password"], user_data.get("session_epoch", 0))
+    st.session_state.auth_token = token
+    set_session_cookie(token, SESSION_TTL)
+
+def forget_session(revoke=False):
+    """
+    Drop this session's token. ``revoke`` (logout) also bumps the account's
+    session epoch, so the token is dead even if a copy of it survives.
+    """
+    email = st.session_state.get("current_user_email")
+    if revoke and email:
+        user_data = store.get_user(email)
+        if user_data:
+            store.save_user(email, revoke_sessions(user_data))
+    st.session_state.pop("auth_token", None)
+    st.session_state.pop("history_export", None)  # the last export's data, if any
+    set_session_cookie("", 0)
+
+# --- Record history (Parquet mirror for display/export) ---
+@st.cache_resource
+def get_history():
+    from history import HistoryStore
+    history = HistoryStore(CONFIG["history_dir"] or str(BASE_DIR / "history"))
+    history.sweep_exports()  # left over from before a restart
+    return history
+
+# --- Trend aggregates (updated as records are appended) ---
+@st.cache_resource
+def get_trends():
+    from trends import TrendStore
+    return TrendStore(CONFIG["trends_dir"] or str(BASE_DIR / "trends"))
+
+# --- Extraction cache ---
+@st.cache_resource
+def get_extract_cache():
+    # One instance per process so hit/miss counters survive reruns
+    cache_dir = CONFIG["extract_cache_dir"] or str(BASE_DIR / ".cache" / "extract")
+    return DiskCache(cache_dir, max_bytes=CONFIG["extract_cache_mb"] * 1024 * 1024, suffix=".txt")
+
+# --- Extraction stack, loaded on first upload ---
+def load_extraction():
+    """Import extraction (tabula, pdf2image, pytesseract) pointed at the configured tools."""
+    java_home = CONFIG["java_home"]
+    if java_home and os.environ.get("JAVA_HOME") != java_home:
+        # Read when tabula starts its JVM, which is after this
+        os.environ["JAVA_HOME"] = java_home
+        os.environ["PATH"] = os.path.join(java_home, "bin") + os.pathsep + os.environ.get("PATH", "")
+    import extraction
+    if CONFIG["tesseract_cmd"]:
+        extraction.pytesseract.pytesseract.tesseract_cmd = CONFIG["tesseract_cmd"]
+    return extraction
+
+def ocr_preprocess():
+    # Grayscale/downscale/binarize/deskew settings, or None when turned off
+    if not CONFIG["ocr_preprocess"]:
+        return None
+    from preprocess import DEFAULT_PREPROCESS
+    return dict(DEFAULT_PREPROCESS, adaptive=CONFIG["ocr_adaptive"])
+
+def extract_cache_key(data, mime_type):
+    config = {"mime": mime_type}
+    if mime_type == "application/pdf":
+        config.update(ocr=PDF_OCR_CONFIG, dpi=PDF_DPI, poppler=POPPLER_PATH, tabula=TABULA_MODE,
+                      text_layer_min_chars=load_extraction().MIN_TEXT_LAYER_CHARS, preprocess=ocr_preprocess())
+    elif mime_type in ["image/jpeg", "image/png"]:
+        config.update(ocr=IMAGE_OCR_CONFIG, preprocess=ocr_preprocess())
+    elif mime_type == "text/csv":
+        config.update(csv="structured")
+    return content_key(data, **config)
+
+# --- Spoken results (one speech engine per process, audio cached on disk) ---
+@st.cache_resource
+def get_speech():
+    from speech import SpeechRenderer
+    cache = DiskCache(str(BASE_DIR / ".cache" / "speech"), max_bytes=CONFIG["speech_cache_mb"] * 1024 * 1024,
+                      suffix=".wav")
+    return SpeechRenderer(cache, voice=CONFIG["speech_voice"], rate=CONFIG["speech_rate"])
+
+# --- Extraction jobs ---
+@st.cache_resource
+def get_job_queue():
+    # Worker threads live as long as the process; jobs live in jobs.db
+    cache = get_extract_cache()
+
+    def run_extract_job(job, data, progress):
+        text = cache.get_text(job["cache_key"])
+        if text is None:
+            text = load_extraction().extract_bytes(data, job["mime"], progress=progress, **job["options"])
+            if text:
+                cache.put_text(job["cache_key"], text)
+        return text
+
+    return JobQueue(CONFIG["jobs_db"] or str(BASE_DIR / "jobs.db"), run_extract_job, workers=JOB_WORKERS)
 
 # --- Session state ---
 if "logged_in" not in st.session_state:
@@ -100,11 +176,42 @@ if "current_user_email" not in st.session_state:
 if "page" not in st.session_state:
     st.session_state.page = "login"
 
+# --- Restore or expire the session from its token ---
+# Older versions kept the token in the URL
+st.query_params.pop("session", None)
+# st.context.cookies is what the browser sent when the page loaded, so a
+# cookie changed since then is only seen after a refresh
+session_cookie = st.context.cookies.get(SESSION_COOKIE)
+if (not st.session_state.logged_in and session_cookie
+        and session_cookie != st.session_state.get("rejected_session_cookie")):
+    token_email = verify_token(get_auth_secret(), session_cookie, store.get_user)
+    if token_email:
+        st.session_state.logged_in = True
+        st.session_state.current_user = store.get_user(token_email)["name"]
+        st.session_state.current_user_email = token_email
+        st.session_state.auth_token = session_cookie
+        st.session_state.page = "main"
+    else:
+        st.session_state.rejected_session_cookie = session_cookie
+        forget_session()
+elif st.session_state.logged_in and "auth_token" in st.session_state:
+    if not verify_token(get_auth_secret(), st.session_state.auth_token, store.get_user):
+        forget_session()
+        st.session_state.logged_in = False
+        st.session_state.current_user = None
+        st.session_state.current_user_email = None
+        st.session_state.page = "login"
+
+# --- Opt-in profiling of one rerun (requested from the admin expander) ---
+rerun_profiler = None
+if st.session_state.get("profile_next_rerun"):
+    st.session_state.profile_next_rerun = False
+    rerun_profiler = cProfile.Profile()
+    rerun_profiler.enable()
+
 # --- Ensure user records ---
 def ensure_user_records(user_email):
-    if user_email and user_email not in patient_records:
-        patient_records[user_email] = []
-        save_json(data_file, patient_records)
+    store.ensure_user_records(user_email)
 
 # --- Login ---
 def login_ui():
@@ -117,13 +224,23 @@ def login_ui():
         elif not password:
             st.error("Please enter your password.")
         else:
-            if email_phone in users:
-                user_data = users[email_phone]
-                if check_password(password, user_data["password"]):
+            user_data = store.get_user(email_phone)
+            if user_data is not None:
+                try:
+                    password_ok, new_hash = verify_password(password, user_data["password"])
+                except AuthBusy as e:
+                    st.error(f"⏳ {e}")
+                    return
+                if password_ok:
+                    if new_hash:
+                        # BCRYPT_ROUNDS changed since this hash was made
+                        user_data["password"] = new_hash
+                        store.save_user(email_phone, user_data)
 
                     st.session_state.logged_in = True
                     st.session_state.current_user = user_data["name"]
                     st.session_state.current_user_email = email_phone
+                    remember_session(email_phone, user_data)
                     ensure_user_records(st.session_state.current_user_email)
                     st.success(f"✅ Login successful! Welcome {st.session_state.current_user}")
                     st.session_state["page"] = "main"
@@ -155,29 +272,34 @@ def registration_ui():
                 st.warning("⚠️ Please enter your full name.")
             elif not new_password:
                 st.warning("⚠️ Please enter a password.")
-            elif new_email_phone in users:
+            elif store.get_user(new_email_phone) is not None:
                 st.warning("⚠️ User already exists. Try logging in.")
             else:
+                try:
+                    hashed_password = hash_password(new_password)
+                except AuthBusy as e:
+                    st.warning(f"⏳ {e}")
+                    return
                 # Save new user credentials
-                users[new_email_phone] = {
+                new_user = {
                      "name": new_name,
-                     "password": hash_password(new_password)
+                     "password": hashed_password
                    }
-                save_json(user_file, users)
+                store.save_user(new_email_phone, new_user)
 
                 # Save initial patient record with demographic info
-                patient_records[new_email_phone] = [{
+                store.replace_records(new_email_phone, [{
                     "age": new_age,
                     "sex": new_sex,
                     "weight": new_weight,
                     "height_cm": new_height
-                }]
-                save_json(data_file, patient_records)
+                }])
 
                 # Set session state to logged in
                 st.session_state.logged_in = True
                 st.session_state.current_user = new_name
                 st.session_state.current_user_email = new_email_phone
+                remember_session(new_email_phone, new_user)
 
                 st.success(f"✅ Registered and logged in! Welcome {new_name}")
                 st.session_state["page"] = "main"
@@ -186,8 +308,8 @@ def registration_ui():
 def profile_ui():
     st.title("👤 Edit Profile")
     user_email = st.session_state.current_user_email
-    patient_data = patient_records.get(user_email, [{}])[0]
-    user_data = users.get(user_email, {})
+    patient_data = store.profile(user_email)
+    user_data = store.get_user(user_email) or {}
     
     with st.form("profile_form"):
         new_name = st.text_input("Full Name", value=user_data.get("name", ""))
@@ -209,184 +331,260 @@ def profile_ui():
                 if not old_password:
                     st.error("Please enter your current password to change password.")
                     return
-                if not check_password(old_password, user_data.get("password", "")):
-                    st.error("Current password is incorrect.")
-                    return
-                if new_password != confirm_password:
-                    st.error("New password and confirm password do not match.")
+                try:
+                    if not check_password(old_password, user_data.get("password", "")):
+                        st.error("Current password is incorrect.")
+                        return
+                    if new_password != confirm_password:
+                        st.error("New password and confirm password do not match.")
+                        return
+                    # Update password hash
+                    user_data["password"] = hash_password(new_password)
+                except AuthBusy as e:
+                    st.error(f"⏳ {e}")
                     return
-                # Update password hash
-                users[user_email]["password"] = hash_password(new_password)
 
             # Update name and patient records
             old_name = user_data.get("name", "")
             if new_name and new_name != old_name:
                 # Update users dict key if name changes
-                users[user_email]["name"] = new_name
+                user_data["name"] = new_name
                 # Update name only
                 if new_name and new_name != old_name:
-                    users[user_email]["name"] = new_name
+                    user_data["name"] = new_name
                     st.session_state.current_user = new_name
 
+            store.save_user(user_email, user_data)
+            if new_password:
+                # The old token is tied to the old hash
+                remember_session(user_email, user_data)
+
             # Update demographic info
-            patient_records[user_email][0] = {
+            store.set_profile(user_email, {
                 "age": new_age,
                 "sex": new_sex,
                 "weight": new_weight,
                 "height_cm": new_height
-            }
-
-            save_json(user_file, users)
-            save_json(data_file, patient_records)
+            })
             st.success("Profile updated successfully!")
 
-def extract_text(file):
+def extract_options():
+    return {
+        "poppler_path": POPPLER_PATH,
+        "dpi": PDF_DPI,
+        "pdf_ocr_config": PDF_OCR_CONFIG,
+        "image_ocr_config": IMAGE_OCR_CONFIG,
+        "lattice": TABULA_MODE == "lattice",
+        "ocr_workers": OCR_WORKERS,
+        "preprocess": ocr_preprocess(),
+    }
+
+def extract_text(file, mode=None):
     """
     Handles uploaded files: PDF, images, or CSV.
-    PDF: Try Tabula first, then OCR fallback.
+    PDF: Embedded text layer first, then Tabula / OCR for pages without one.
+    Results are cached on disk by content hash, so re-uploads and
+    reruns skip tabula/OCR entirely.
+    mode="worker" sends the job to the warm extract_worker.py process and
+    falls back to in-process extraction when it isn't running.
     """
+    mode = mode or EXTRACT_MODE
     text = ""
+    cache = get_extract_cache()
+    data = file.getvalue()
+    key = extract_cache_key(data, file.type)
+    cached = cache.get_text(key)
+    if cached is not None:
+        return cached
     try:
-        if file.type in ["image/jpeg", "image/png"]:
-            img = Image.open(file)
-            text = pytesseract.image_to_string(img, config="--psm 6")
-        elif file.type == "application/pdf":
-            # Save uploaded PDF to temp
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                tmp_file.write(file.getbuffer())
-                tmp_path = tmp_file.name
-
-            # Extract text using new function
-            text = extract_text_from_pdf(tmp_path)
-            os.remove(tmp_path)
-        elif file.type == "text/csv":
-            df = pd.read_csv(file)
-            text += df.to_csv(index=False)
+        if mode == "worker":
+            from extract_worker import extract_via_worker_or_local
+            text = extract_via_worker_or_local(data, file.type, **extract_options())
+        else:
+            text = load_extraction().extract_bytes(data, file.type, **extract_options())
     except Exception as e:
         st.warning(f"Failed to parse {file.name}: {e}")
+    # Empty text usually means a failed run (missing Poppler/Java), don't pin it
+    if text:
+        cache.put_text(key, text)
     return text
 
-def parse_lab_values(text):
-    lab_data = {}
-    patterns = {
-    "Glucose": r"(?:Glucose|GLU)\s*[:=]?\s*([\d.]+)",
-    "Hemoglobin": r"(?:Hemoglobin|Hb|H B)\s*[:=]?\s*([\d.]+)",
-    "Systolic_BP": r"(?:Systolic|Sys\.?)\s*[:=]?\s*([\d]+)",
-    "Diastolic_BP": r"(?:Diastolic|Dia\.?)\s*[:=]?\s*([\d]+)",
-    "TSH": r"(?:TSH|Thyroid)\s*[:=]?\s*([\d.]+)",
-    "ALT": r"(?:ALT|SGPT)\s*[:=]?\s*([\d.]+)",
-    "AST": r"(?:AST|SGOT)\s*[:=]?\s*([\d.]+)",
-    "Creatinine": r"(?:Creatinine|CREA)\s*[:=]?\s*([\d.]+)",
-    "Urea": r"(?:Urea|BUN)\s*[:=]?\s*([\d.]+)",
-       # Blood counts
-    "WBC": r"WBC(?: count)?\s*[:=]?\s*([\d.]+)",
-    "RBC": r"RBC(?: count)?\s*[:=]?\s*([\d.]+)",
-    "Platelets": r"(?:PLT|Platelets?)\s*[:=]?\s*([\d.]+)",
-    "MCV": r"MCV\s*[:=]?\s*([\d.]+)",
-    "MCH": r"MCH\s*[:=]?\s*([\d.]+)",
-    "MCHC": r"MCHC\s*[:=]?\s*([\d.]+)",
-
-    # Electrolytes
-    "Sodium": r"(?:Sodium|Na[\+\s]*)\s*[:=]?\s*([\d.]+)",
-    "Potassium": r"(?:Potassium|K[\+\s]*)\s*[:=]?\s*([\d.]+)",
-    "Chloride": r"(?:Chloride|Cl[\-\s]*)\s*[:=]?\s*([\d.]+)",
-
-    # Lipid Profile
-    "Total Cholesterol": r"(?:Total\s*)?Cholesterol\s*[:=]?\s*([\d.]+)",
-    "LDL": r"LDL\s*[:=]?\s*([\d.]+)",
-    "HDL": r"HDL\s*[:=]?\s*([\d.]+)",
-    "Triglycerides": r"Triglycerides\s*[:=]?\s*([\d.]+)",
-    }
-    for key, pattern in patterns.items():
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            try:
-                lab_data[key] = float(match.group(1))
-            except ValueError:
-                continue
-    return lab_data
-
-# --- Risk checker ---
-def bmi_risk(bmi, age, sex):
-    advice = ""
-    if age < 18:
-        risk = "Check BMI percentile for age & sex"
-        advice = "Consult pediatrician for proper growth assessment."
-    else:
-        if bmi < 18.5:
-            risk = "Underweight"
-            advice = "Increase calorie intake & balanced diet."
-        elif 18.5 <= bmi < 25:
-            risk = "Normal weight"
-            advice = "Maintain healthy lifestyle."
-        elif 25 <= bmi < 30:
-            risk = "Overweight"
-            advice = "Increase physical activity and monitor diet."
-        else:
-            risk = "Obese"
-            advice = "Consult doctor/nutritionist for weight management."
-    if sex.lower() == "female" and bmi >= 25:
-        advice += " (Women have slightly higher cardiovascular risk at lower BMI.)"
-    return risk, advice
-
-def check_risks(glucose, hb, bmi, systolic_bp, diastolic_bp, labs, age=25, sex="Male"):
-    risk = []
-    doctors = set()
-    advice_list = []
-
-    if glucose >= 120: risk.append("High Glucose"); doctors.add("Endocrinologist")
-    bmi_cat, bmi_adv = bmi_risk(bmi, age, sex)
-    risk.append(bmi_cat); advice_list.append(bmi_adv)
-    if systolic_bp >= 140 or diastolic_bp >= 90: risk.append("High BP"); doctors.add("Cardiologist")
-    
-    # Thyroid / TSH
-    if labs.get("TSH", 0) > 5.0:
-        risk.append("High TSH")
-        doctors.add("Endocrinologist")
-
-    # Liver enzymes
-    if labs.get("ALT", 0) > 45 or labs.get("AST", 0) > 40:
-        risk.append("Liver Enzyme High")
-        doctors.add("Hepatologist")
-
-
-    # Kidney
-    if labs.get("Creatinine",0) > 1.3 or labs.get("Urea",0) > 50:
-        risk.append("Kidney function abnormal")
-        doctors.add("Nephrologist")
-
-
-    # Hemoglobin check based on sex
-    hb = labs.get("Hemoglobin", hb)  # Use extracted value if available, else use passed hb
-
-    if hb is not None:
-        if sex.lower() == "male" and hb < 13.5:
-            risk.append("Low Hemoglobin")
-            advice_list.append("Iron-rich diet & check for anemia. ")
-            doctors.add("Hematologist")
-        elif sex.lower() == "female" and hb < 12.0:
-            risk.append("Low Hemoglobin")
-            advice_list.append("Iron-rich diet & check for anemia .")
-            doctors.add("Hematologist")
- 
-    if len(risk) == 0:
-        overall_health = "Excellent Health"
-    elif 1 <= len(risk) <= 2:
-        overall_health = "Please monitor your health"
+def submit_uploads(files):
+    """
+    Queue each upload once per session (the uploader hands them back on
+    every rerun) and return the job ids of the files it holds right now.
+    """
+    submitted = st.session_state.setdefault("submitted_uploads", {})  # file_id -> job id
+    queue = get_job_queue()
+    job_ids = []
+    for file in files:
+        if file.file_id not in submitted:
+            data = file.getvalue()
+            submitted[file.file_id] = queue.submit(
+                st.session_state.current_user_email, file.name, file.type, data,
+                options=extract_options(), cache_key=extract_cache_key(data, file.type),
+            )
+        job_ids.append(submitted[file.file_id])
+    # Files removed from the uploader stop counting
+    current = {file.file_id for file in files}
+    for file_id in list(submitted):
+        if file_id not in current:
+            del submitted[file_id]
+    return job_ids
+
+def extraction_jobs_ui(job_ids, extracted_data_per_file, file_names):
+    """
+    The account's uncleared jobs, read from the queue rather than session
+    state, so uploads still running or finished after a refresh (or in
+    another session) show up. Unfinished ones show live progress. Finished
+    ones feed extracted_data_per_file, keyed by job id, when ticked: the
+    uploads in ``job_ids`` (the uploader's files) start ticked, older
+    results don't, so they can't quietly override the inputs.
+    """
+    queue = get_job_queue()
+    jobs = queue.jobs_for(st.session_state.current_user_email)
+    current = set(job_ids)
+    for job in jobs:
+        if job["status"] == DONE:
+            if st.checkbox(f"Use the values from {job['name']}", value=job["id"] in current,
+                           key=f"use_job_{job['id']}"):
+                extracted_data_per_file[job["id"]] = parse_lab_values(job["result"] or "")
+                file_names[job["id"]] = job["name"]
+            with st.expander(f"🧾 Show Raw Text for {job['name']}"):
+                st.text(job["result"] or "")
+        elif job["status"] == FAILED:
+            st.warning(f"Failed to parse {job['name']}: {job['error']}")
+    pending = [job["id"] for job in jobs if job["status"] in (QUEUED, RUNNING)]
+    if pending:
+        job_progress_ui(pending)
+    if any(job["status"] in (DONE, FAILED) for job in jobs) and st.button("Clear finished uploads"):
+        queue.dismiss_finished(st.session_state.current_user_email)
+        st.rerun()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress_ui(job_ids):
+    # Reruns on its own every few seconds without rerunning the page
+    queue = get_job_queue()
+    jobs = [queue.get(job_id) for job_id in job_ids]
+    for job in jobs:
+        if job["status"] == QUEUED:
+            st.progress(0.0, text=f"⏳ {job['name']}: queued")
+        elif job["status"] == RUNNING:
+            total = job["pages_total"] or 0
+            done = job["pages_done"] or 0
+            label = f"page {done} of {total}" if total else "starting"
+            st.progress(done / total if total else 0.0, text=f"⚙️ {job['name']}: {label}")
+    if all(job["status"] in (DONE, FAILED) for job in jobs):
+        st.rerun()  # whole page, to pick up the results
+
+def results_summary_ui(results):
+    overall_health, risk, doctors, advice = (results[k] for k in ("overall_health", "risk", "doctors", "advice"))
+    st.subheader("Results Summary")
+    st.write(f"**Overall Health:** {overall_health}")
+    if risk: st.write("Risks:", risk)
+    if doctors: st.write("See specialists:", ", ".join(doctors))
+    if advice: st.write("Advice:", advice)
+
+    from speech import SpeechError, summary_text
+    text = summary_text(overall_health, risk, doctors, advice)
+    try:
+        wav = get_speech().audio(text)
+    except SpeechError as e:
+        st.caption(f"🔇 Spoken summary unavailable: {e}")
+        return
+    if wav is None:
+        speech_progress_ui(text)
     else:
-        overall_health = "Needs medical attention"
+        st.audio(wav, format="audio/wav")
+
+@st.fragment(run_every=SPEECH_POLL_SECONDS)
+def speech_progress_ui(text):
+    st.caption("🔊 Preparing spoken summary...")
+    if get_speech().done(text):
+        st.rerun()  # whole page, to show the player
+
+HISTORY_PAGE_SIZES = [25, 50, 100]
+EXPORT_FORMATS = {"CSV": ("csv", "text/csv"), "Parquet": ("parquet", "application/octet-stream")}
+
+def past_records_ui(user, total):
+    """One page of the user's history, only the chosen columns, newest page first."""
+    from history import COLUMNS as HISTORY_COLUMNS
+    history = get_history()
+    col1, col2 = st.columns(2)
+    page_size = col1.selectbox("Rows per page", HISTORY_PAGE_SIZES, key="history_page_size")
+    pages = max(1, -(-total // page_size))
+    page = col2.number_input("Page", min_value=1, max_value=pages, value=pages, key=f"history_page_{page_size}")
+    columns = st.multiselect("Columns", HISTORY_COLUMNS, default=[c for c in HISTORY_COLUMNS if c != "other"],
+                             key="history_columns")
+    start = (page - 1) * page_size
+    st.dataframe(history.read(user, start, start + page_size, columns))
+    st.caption(f"Records {start + 1}-{min(total, start + page_size)} of {total}")
+
+    # Built only when asked for, streamed to a file in batches, then handed
+    # to the download button and deleted straight away (the button keeps
+    # its own copy in memory anyway), so no health data stays on disk
+    col1, col2 = st.columns(2)
+    label = col1.selectbox("Export format", list(EXPORT_FORMATS), key="history_export_format")
+    if col2.button("📦 Prepare Download"):
+        fmt, mime = EXPORT_FORMATS[label]
+        path = Path(history.export(user, fmt, columns))
+        try:
+            st.session_state.history_export = (path.read_bytes(), fmt, mime)
+        finally:
+            path.unlink(missing_ok=True)
+    if "history_export" in st.session_state:
+        data, fmt, mime = st.session_state.history_export
+        st.download_button(
+            label=f"📥 Download Records as {fmt.upper()}",
+            data=data,
+            file_name=f"my_health_records.{fmt}",
+            mime=mime,
+            on_click=discard_history_export,
+        )
 
-    return risk, doctors, advice_list, overall_health
+def discard_history_export():
+    st.session_state.pop("history_export", None)
+
+TREND_PERIODS = {"Week": "weeks", "Month": "months"}
+
+def trends_ui(state):
+    """Per-analyte summary table and a weekly/monthly chart, all from precomputed aggregates."""
+    import plotly.graph_objects as go
+    from trends import buckets, summary
+    rows = summary(state)
+    st.dataframe(rows)
+    col1, col2 = st.columns(2)
+    analyte = col1.selectbox("Analyte", [row["Analyte"] for row in rows], key="trend_analyte")
+    period = col2.radio("Group by", list(TREND_PERIODS), horizontal=True, key="trend_period")
+    points = buckets(state, analyte, TREND_PERIODS[period])
+    keys = [key for key, *_ in points]
+    fig = go.Figure()
+    # Min-max band: the max line, then the min line filled up to it
+    fig.add_trace(go.Scatter(x=keys, y=[hi for *_, hi in points], line={"width": 0},
+                             showlegend=False, hoverinfo="skip"))
+    fig.add_trace(go.Scatter(x=keys, y=[lo for *_, lo, _ in points], line={"width": 0}, fill="tonexty",
+                             fillcolor="rgba(76, 175, 80, 0.2)", name="Min-max"))
+    fig.add_trace(go.Scatter(x=keys, y=[mean for _, _, mean, _, _ in points], mode="lines+markers",
+                             line={"color": "#4CAF50"}, name="Mean",
+                             customdata=[n for _, n, *_ in points],
+                             hovertemplate="%{y:.2f} (%{customdata} readings)<extra></extra>"))
+    fig.update_layout(height=320, margin={"l": 10, "r": 10, "t": 30, "b": 10}, xaxis={"type": "category"},
+                      title=f"{analyte} by {period.lower()}")
+    st.plotly_chart(fig)
 
 # --- Main App ---
 def main_app_ui():
-    ensure_user_records(st.session_state.current_user)
+    import pandas as pd
+    from risk import check_risks
+    # Records are keyed by the login email, as registration, the profile
+    # page and watch_ingest.py save them; the display name is only shown
+    user = st.session_state.current_user_email
+    ensure_user_records(user)
     st.title("🩺 Doctor Buddy")
     st.write(f"👋 Welcome, {st.session_state.current_user}!")
 
-    user_records = patient_records.get(st.session_state.current_user, [])
-    if user_records:
-       latest_info = user_records[0]
+    latest_info = store.profile(user)
+    if latest_info:
        age = int(latest_info.get("age", 25))
        sex = latest_info.get("sex", "Male")
        weight = float(latest_info.get("weight", 70.0))
@@ -410,9 +608,16 @@ def main_app_ui():
         "Choose files", type=['pdf', 'png', 'jpg', 'jpeg', 'csv'], accept_multiple_files=True
     )
 
+    cache_stats = get_extract_cache().stats()
+    st.caption(f"Extraction cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+
     extracted_data_per_file = {}
+    file_names = {}  # extracted_data_per_file key -> file name, where they differ
 
-    if uploaded_files:
+    if EXTRACT_MODE == "queue":
+        job_ids = submit_uploads(uploaded_files or [])
+        extraction_jobs_ui(job_ids, extracted_data_per_file, file_names)
+    elif uploaded_files:
         for file in uploaded_files:
             raw_text = extract_text(file)
             lab_values = parse_lab_values(raw_text)
@@ -424,8 +629,8 @@ def main_app_ui():
 
     if extracted_data_per_file:
         st.subheader("📄 Extracted Lab Values by File")
-        for fname, labs in extracted_data_per_file.items():
-            st.markdown(f"**File:** {fname}")
+        for key, labs in extracted_data_per_file.items():
+            st.markdown(f"**File:** {file_names.get(key, key)}")
             if labs:
                 df = pd.DataFrame(list(labs.items()), columns=["Lab Test", "Value"])
                 st.dataframe(df)
@@ -475,11 +680,11 @@ def main_app_ui():
         )
 
 
-        st.subheader("Results Summary")
-        st.write(f"**Overall Health:** {overall_health}")
-        if risk: st.write("Risks:", risk)
-        if doctors: st.write("See specialists:", ", ".join(doctors))
-        if advice: st.write("Advice:", advice)
+        # Kept for the reruns after this one, so the spoken summary can finish rendering
+        st.session_state.last_results = {
+            "user": user,
+            "overall_health": overall_health, "risk": risk, "doctors": doctors, "advice": advice,
+        }
 
         record = {
             "timestamp": datetime.datetime.now().isoformat(),
@@ -496,25 +701,24 @@ def main_app_ui():
             "overall_health": overall_health,
             "risk": risk
         }
-        patient_records[st.session_state.current_user].append(record)
-        save_json(data_file, patient_records)
+        store.append_record(user, record)
 
-    past_records = patient_records.get(st.session_state.current_user, [])
-    if past_records:
+    results = st.session_state.get("last_results")
+    if results and results["user"] == user:
+        results_summary_ui(results)
+
+    history = get_history().sync(user, store)
+    if history["rows"]:
      st.subheader("📋 Your Past Records")
-     df = pd.DataFrame(past_records)
-     st.dataframe(df)
-
-     csv_data = df.to_csv(index=False).encode("utf-8")
-     st.download_button(
-        label="📥 Download Records as CSV",
-        data=csv_data,
-        file_name="my_health_records.csv",
-        mime="text/csv",
-    )
+     past_records_ui(user, history["rows"])
     else:
      st.info("No past records found.")
 
+    trends = get_trends().sync(user, store)
+    if trends["analytes"]:
+        st.subheader("📈 Trends")
+        trends_ui(trends)
+
 
     st.subheader("💡 Healthy Lifestyle Tips")
     st.markdown("""
@@ -527,6 +731,7 @@ def main_app_ui():
     """)
 
     if st.button("Logout"):
+        forget_session(revoke=True)
         st.session_state.logged_in = False
         st.session_state.current_user = None
         st.session_state.current_user_email = None
@@ -543,6 +748,7 @@ if st.session_state.logged_in:
     elif choice == "👤 Profile":
         st.session_state.page = "profile"
     elif choice == "🚪 Logout":
+        forget_session(revoke=True)
         st.session_state.logged_in = False
         st.session_state.current_user = None
         st.session_state.current_user_email = None
@@ -550,6 +756,62 @@ if st.session_state.logged_in:
         st.experimental_rerun()
 
     
+def admin_metrics_ui():
+    import pandas as pd
+    snap = metrics.snapshot()
+    with st.expander("🛠️ Pipeline metrics (admin)"):
+        st.caption(f"Since {datetime.datetime.fromtimestamp(snap['started']):%Y-%m-%d %H:%M:%S}, this process only")
+        if snap["timers"]:
+            st.dataframe(pd.DataFrame([{
+                "Stage": t["name"],
+                "Labels": ", ".join(f"{k}={v}" for k, v in t["labels"].items()),
+                "Calls": t["count"],
+                "Errors": t["errors"],
+                "Mean (ms)": round(t["seconds"] / t["count"] * 1000, 1),
+                "Max (ms)": round(t["max"] * 1000, 1),
+                "Total (s)": round(t["seconds"], 2),
+                "Pages": t["totals"].get("pages"),
+                "Bytes": t["totals"].get("bytes"),
+            } for t in snap["timers"]]))
+        else:
+            st.write("_Nothing timed yet._")
+        if snap["counters"]:
+            st.markdown("**PDF branches and page tiers**")
+            st.dataframe(pd.DataFrame([{
+                "Counter": c["name"],
+                "Labels": ", ".join(f"{k}={v}" for k, v in c["labels"].items()),
+                "Value": c["value"],
+            } for c in snap["counters"]]))
+        if snap["recent"]:
+            st.markdown("**Slowest recent calls**")
+            slowest = sorted(snap["recent"], key=lambda call: call["seconds"], reverse=True)[:20]
+            st.dataframe(pd.DataFrame(slowest))
+
+        col1, col2, col3 = st.columns(3)
+        col1.download_button("metrics.prom", metrics.prometheus_text(snap), file_name="metrics.prom",
+                             mime="text/plain")
+        col2.download_button("metrics.json", json.dumps(snap, indent=2), file_name="metrics.json", mime="application/json")
+        if col3.button("Reset metrics"):
+            metrics.reset()
+
+        if EXTRACT_MODE == "queue":
+            st.markdown("**Extraction queue**")
+            st.dataframe(pd.DataFrame([get_job_queue().stats()]))
+
+        if st.button("Profile next rerun"):
+            st.session_state.profile_next_rerun = True
+        if "last_profile" in st.session_state:
+            text, dump = st.session_state.last_profile
+            st.text(text)
+            st.download_button("rerun.prof", dump, file_name="rerun.prof", mime="application/octet-stream")
+
+def finish_profile(profiler):
+    profiler.disable()
+    out = io.StringIO()
+    # Stats() snapshots profiler.stats; marshalled, that's what Profile.dump_stats writes
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(30)
+    st.session_state.last_profile = (out.getvalue(), marshal.dumps(profiler.stats))
+
 # --- Page Routing ---
 if not st.session_state.logged_in or st.session_state.page == "login":
     login_ui()
@@ -559,4 +821,19 @@ elif st.session_state.page == "main":
 elif st.session_state.page == "profile":
     profile_ui()
 
+# --- Disk I/O for this rerun ---
+io_now = io_counters(thread=True)
+st.session_state.last_rerun_io = {k: io_now[k] - io_at_start[k] for k in io_now}
+if st.session_state.logged_in:
+    st.sidebar.caption(
+        f"Disk I/O this rerun: {st.session_state.last_rerun_io['reads']} reads, "
+        f"{st.session_state.last_rerun_io['writes']} writes"
+    )
 
+# --- Metrics ---
+if rerun_profiler is not None:
+    finish_profile(rerun_profiler)
+if st.session_state.logged_in and st.session_state.current_user_email in ADMIN_EMAILS:
+    admin_metrics_ui()
+if METRICS_FILE:
+    metrics.write_metrics(METRICS_FILE)
@@ -0,0 +1,167 @@
+"""
+Password hashing and session tokens.
+
+bcrypt runs on a small shared thread pool (bcrypt releases the GIL), so a
+burst of logins uses at most AUTH_WORKERS cores. Waiting script threads
+sleep instead of competing with other sessions' reruns, and when too many
+logins are already queued new ones fail fast with AuthBusy.
+
+After a successful login the app keeps an HMAC-signed token, so reruns,
+page switches and browser refreshes are checked with one SHA-256 instead
+of bcrypt. Tokens carry the account's session epoch; logging out bumps it
+(revoke_sessions), which invalidates every token issued before.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from pathlib import Path
+
+import bcrypt
+
+from config import cached_config
+from metrics import timed
+
+_CONFIG = cached_config()
+# bcrypt's own default is 12; each +1 doubles the cost
+BCRYPT_ROUNDS = _CONFIG["bcrypt_rounds"]
+AUTH_WORKERS = _CONFIG["auth_workers"]
+# Hash jobs allowed to wait for a worker before logins are turned away
+AUTH_MAX_PENDING = int(_CONFIG["auth_max_pending"] or AUTH_WORKERS * 8)
+AUTH_TIMEOUT = 30
+SESSION_TTL = _CONFIG["session_ttl_hours"] * 3600
+
+
+class AuthBusy(RuntimeError):
+    """Too many password checks are already queued, or one waited too long."""
+
+
+# --- bcrypt pool ---
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(AUTH_WORKERS + AUTH_MAX_PENDING)
+
+def _run(fn, *args):
+    global _pool
+    if not _slots.acquire(blocking=False):
+        raise AuthBusy("Too many login attempts in progress, please try again in a moment.")
+    try:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="bcrypt")
+        future = _pool.submit(fn, *args)
+        try:
+            return future.result(timeout=AUTH_TIMEOUT)
+        except FutureTimeout:
+            # Not a wrong password: check_password would otherwise report one
+            future.cancel()
+            raise AuthBusy("The server is busy, please try again in a moment.")
+    finally:
+        _slots.release()
+
+def hash_password(plain_text_password, rounds=None):
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    with timed("bcrypt", op="hash"):
+        return _run(bcrypt.hashpw, plain_text_password.encode(), salt).decode()
+
+def check_password(plain_text_password, hashed_password):
+    try:
+        with timed("bcrypt", op="check"):
+            return _run(bcrypt.checkpw, plain_text_password.encode(), hashed_password.encode())
+    except AuthBusy:
+        raise
+    except Exception:
+        return False
+
+def hash_rounds(hashed_password):
+    """Cost factor of a "$2b$12$..." hash, or None if it isn't one."""
+    try:
+        return int(hashed_password.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+def verify_password(plain_text_password, hashed_password, rounds=None):
+    """
+    (ok, new_hash): new_hash is set when the password was right but the
+    stored hash uses a different cost factor than ``rounds``, so the
+    caller can save it in place of the old one.
+    """
+    if not check_password(plain_text_password, hashed_password):
+        return False, None
+    rounds = rounds or BCRYPT_ROUNDS
+    if hash_rounds(hashed_password) != rounds:
+        return True, hash_password(plain_text_password, rounds)
+    return True, None
+
+
+# --- Session tokens ---
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def load_secret(path):
+    """The auth_secret setting, or a random key kept in ``path`` so tokens survive restarts."""
+    secret = _CONFIG["auth_secret"]
+    if secret:
+        return secret.encode()
+    return stored_secret(path)
+
+def stored_secret(path):
+    """A random key created on first use in ``path``, readable only by its owner."""
+    path = Path(path)
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        pass
+    secret = secrets.token_bytes(32)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return path.read_bytes()  # another process got there first
+    with os.fdopen(fd, "wb") as f:
+        f.write(secret)
+    return secret
+
+def _password_tag(hashed_password):
+    # Changing the password (or rehashing it) invalidates older tokens
+    return hashlib.sha256(hashed_password.encode()).hexdigest()[:16]
+
+def issue_token(secret, email, hashed_password, epoch=0, ttl=SESSION_TTL):
+    claims = {"u": email, "exp": int(time.time() + ttl), "p": _password_tag(hashed_password), "e": epoch}
+    payload = _b64(json.dumps(claims, separators=(",", ":")).encode())
+    signature = _b64(hmac.new(secret, payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{signature}"
+
+def verify_token(secret, token, get_user):
+    """
+    The token's email if it is genuine, unexpired, and neither the password
+    nor the session epoch has changed since it was issued; else None.
+    """
+    try:
+        payload, signature = token.split(".")
+        expected = _b64(hmac.new(secret, payload.encode(), hashlib.sha256).digest())
+        if not hmac.compare_digest(signature, expected):
+            return None
+        claims = json.loads(_unb64(payload))
+    except (AttributeError, ValueError):
+        return None
+    if claims.get("exp", 0) < time.time():
+        return None
+    user = get_user(claims.get("u"))
+    if not user or _password_tag(user.get("password", "")) != claims.get("p"):
+        return None
+    if claims.get("e", 0) != user.get("session_epoch", 0):
+        return None
+    return claims["u"]
+
+def revoke_sessions(user):
+    """The account dict with its session epoch bumped; save it to log out every session."""
+    return dict(user, session_epoch=user.get("session_epoch", 0) + 1)
@@ -0,0 +1,110 @@
+"""
+Login load test: a burst of concurrent password checks, with and without
+the bounded bcrypt pool, while a background "rerun" loop measures how long
+other sessions' ordinary script work is delayed.
+
+    python benchmarks/bench_login.py --users 64 --rounds 12 --seconds 10
+
+Reports logins/s, logins/s per core used, login latency percentiles and
+the rerun latency seen during the burst.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+import bcrypt
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import auth  # noqa: E402
+from lab_values import parse_lab_values  # noqa: E402
+
+RERUN_TEXT = "Glucose: 110 mg/dL\nHemoglobin 13.2 g/dL\nTSH 2.1\n" * 50
+
+
+def direct_check(password, hashed):
+    # The old path: bcrypt on the calling (script) thread
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+def pooled_check(password, hashed):
+    return auth.check_password(password, hashed)
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+def run(check, hashed, users, seconds):
+    latencies, busy, stop = [], [0], threading.Event()
+    lock = threading.Lock()
+
+    def session():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                assert check("correct horse", hashed)
+            except auth.AuthBusy:
+                with lock:
+                    busy[0] += 1
+                time.sleep(0.05)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    reruns = []
+
+    def rerun_loop():
+        # Stand-in for another session's rerun: a little pure-Python work
+        while not stop.is_set():
+            start = time.perf_counter()
+            parse_lab_values(RERUN_TEXT)
+            reruns.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    cpu_start = time.process_time()
+    threads = [threading.Thread(target=session) for _ in range(users)] + [threading.Thread(target=rerun_loop)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    cores = (time.process_time() - cpu_start) / wall
+    return {
+        "logins_per_s": len(latencies) / wall,
+        "cores_used": cores,
+        "logins_per_s_per_core": len(latencies) / wall / max(cores, 1e-9),
+        "login_p50_ms": percentile(latencies, 0.5) * 1000,
+        "login_p95_ms": percentile(latencies, 0.95) * 1000,
+        "turned_away": busy[0],
+        "rerun_p50_ms": statistics.median(reruns) * 1000 if reruns else 0.0,
+        "rerun_p95_ms": percentile(reruns, 0.95) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=32, help="concurrent logins")
+    parser.add_argument("--rounds", type=int, default=auth.BCRYPT_ROUNDS)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    hashed = bcrypt.hashpw(b"correct horse", bcrypt.gensalt(args.rounds)).decode()
+    print(f"{args.users} concurrent logins, bcrypt cost {args.rounds}, {os.cpu_count()} CPUs, "
+          f"pool of {auth.AUTH_WORKERS} (+{auth.AUTH_MAX_PENDING} queued)")
+    for name, check in [("direct", direct_check), ("pool", pooled_check)]:
+        result = run(check, hashed, args.users, args.seconds)
+        print(f"{name:>6}: {result['logins_per_s']:7.1f} logins/s  "
+              f"{result['logins_per_s_per_core']:6.1f}/s per core ({result['cores_used']:.1f} cores)  "
+              f"login p50 {result['login_p50_ms']:7.0f} ms  p95 {result['login_p95_ms']:7.0f} ms  "
+              f"turned away {result['turned_away']:5d}  "
+              f"rerun p50 {result['rerun_p50_ms']:6.2f} ms  p95 {result['rerun_p95_ms']:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Wall-clock scaling of the OCR fallback with the number of page workers.
+
+    python benchmarks/bench_ocr_parallel.py report.pdf --workers 1 2 4 8
+
+Pools are warmed up before timing, so the numbers show steady-state
+per-upload cost rather than process start-up.
+"""
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extraction import get_ocr_pool, ocr_pdf_pages  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", type=Path)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--poppler-path", default=os.getenv("POPPLER_PATH"))
+    args = parser.parse_args()
+
+    pdf_bytes = args.pdf.read_bytes()
+    baseline = None
+    print(f"{'workers':>7} {'pages':>5} {'best s':>8} {'pages/s':>8} {'speedup':>8}")
+    for workers in args.workers:
+        if workers > 1:
+            pool = get_ocr_pool(workers)
+            list(pool.map(abs, range(workers)))  # start every worker process
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            pages = ocr_pdf_pages(pdf_bytes, poppler_path=args.poppler_path, dpi=args.dpi, workers=workers)
+            times.append(time.perf_counter() - start)
+        best = min(times)
+        baseline = baseline or best
+        print(f"{workers:>7} {len(pages):>5} {best:>8.2f} {len(pages) / best:>8.2f} {baseline / best:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Seconds per page and lab-value recall of OCR with and without image
+preprocessing, on synthetic report pages (clean scans, noisy skewed scans
+and oversized colour "phone photos"):
+
+    python benchmarks/bench_ocr_preprocess.py --pages 5
+
+Recall is the share of ground-truth analytes that parse_lab_values reads
+back with exactly the right value. Needs the tesseract binary.
+"""
+import argparse
+import random
+import shutil
+import sys
+import time
+from pathlib import Path
+
+from PIL import ImageOps
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import synth  # noqa: E402
+from extraction import DEFAULT_IMAGE_OCR_CONFIG, ocr_page, pytesseract  # noqa: E402
+from lab_values import parse_lab_values  # noqa: E402
+from preprocess import DEFAULT_PREPROCESS  # noqa: E402
+
+VARIANTS = {
+    "raw": None,
+    "preprocess": DEFAULT_PREPROCESS,
+    "adaptive": dict(DEFAULT_PREPROCESS, adaptive=True),
+}
+
+
+def phone_photo(values, seed):
+    """A 400 DPI colour capture (~15 MP) with grain, skew and a paper tint."""
+    page = synth.render_page(values, dpi=400, noise=0.6, seed=seed)
+    return ImageOps.colorize(page, black="#202030", white="#f4ecd8")
+
+def inputs(pages, seed=0):
+    rng = random.Random(seed)
+    truth = [synth.lab_values(rng, 8) for _ in range(pages)]
+    return {
+        "scan 300dpi": [(synth.render_page(v, dpi=300, seed=i), v) for i, v in enumerate(truth)],
+        "scan 300dpi noisy": [(synth.render_page(v, dpi=300, noise=0.8, seed=i), v) for i, v in enumerate(truth)],
+        "phone photo": [(phone_photo(v, i), v) for i, v in enumerate(truth)],
+    }
+
+def recall(text, truth):
+    found = parse_lab_values(text)
+    return sum(1 for name, value in truth.items() if found.get(name) == value) / len(truth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=3, help="pages per input kind")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--tesseract-cmd", default=pytesseract.pytesseract.tesseract_cmd)
+    args = parser.parse_args()
+
+    if not shutil.which(args.tesseract_cmd):
+        print(f"tesseract not found ({args.tesseract_cmd}); nothing to measure")
+        return
+    pytesseract.pytesseract.tesseract_cmd = args.tesseract_cmd
+
+    print(f"{'input':<20} {'variant':<11} {'megapixels':>10} {'s/page':>8} {'recall':>7}")
+    for kind, pages in inputs(args.pages).items():
+        megapixels = sum(img.width * img.height for img, _ in pages) / len(pages) / 1e6
+        for variant in args.variants:
+            seconds, hits = 0.0, 0.0
+            for img, truth in pages:
+                start = time.perf_counter()
+                text = ocr_page(img, DEFAULT_IMAGE_OCR_CONFIG, VARIANTS[variant])
+                seconds += time.perf_counter() - start
+                hits += recall(text, truth)
+            print(f"{kind:<20} {variant:<11} {megapixels:>10.1f} {seconds / len(pages):>8.2f} "
+                  f"{hits / len(pages):>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
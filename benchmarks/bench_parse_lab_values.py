@@ -0,0 +1,106 @@
+"""
+Throughput of the single-pass lab scanner against the previous
+parse_lab_values (22 separate re.search calls per text).
+
+    python benchmarks/bench_parse_lab_values.py --size-mb 1
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lab_values import parse_lab_values, scan_lab_values  # noqa: E402
+
+
+def legacy_parse_lab_values(text):
+    # The implementation lab_values.py replaced, kept for comparison
+    lab_data = {}
+    patterns = {
+        "Glucose": r"(?:Glucose|GLU)\s*[:=]?\s*([\d.]+)",
+        "Hemoglobin": r"(?:Hemoglobin|Hb|H B)\s*[:=]?\s*([\d.]+)",
+        "Systolic_BP": r"(?:Systolic|Sys\.?)\s*[:=]?\s*([\d]+)",
+        "Diastolic_BP": r"(?:Diastolic|Dia\.?)\s*[:=]?\s*([\d]+)",
+        "TSH": r"(?:TSH|Thyroid)\s*[:=]?\s*([\d.]+)",
+        "ALT": r"(?:ALT|SGPT)\s*[:=]?\s*([\d.]+)",
+        "AST": r"(?:AST|SGOT)\s*[:=]?\s*([\d.]+)",
+        "Creatinine": r"(?:Creatinine|CREA)\s*[:=]?\s*([\d.]+)",
+        "Urea": r"(?:Urea|BUN)\s*[:=]?\s*([\d.]+)",
+        "WBC": r"WBC(?: count)?\s*[:=]?\s*([\d.]+)",
+        "RBC": r"RBC(?: count)?\s*[:=]?\s*([\d.]+)",
+        "Platelets": r"(?:PLT|Platelets?)\s*[:=]?\s*([\d.]+)",
+        "MCV": r"MCV\s*[:=]?\s*([\d.]+)",
+        "MCH": r"MCH\s*[:=]?\s*([\d.]+)",
+        "MCHC": r"MCHC\s*[:=]?\s*([\d.]+)",
+        "Sodium": r"(?:Sodium|Na[\+\s]*)\s*[:=]?\s*([\d.]+)",
+        "Potassium": r"(?:Potassium|K[\+\s]*)\s*[:=]?\s*([\d.]+)",
+        "Chloride": r"(?:Chloride|Cl[\-\s]*)\s*[:=]?\s*([\d.]+)",
+        "Total Cholesterol": r"(?:Total\s*)?Cholesterol\s*[:=]?\s*([\d.]+)",
+        "LDL": r"LDL\s*[:=]?\s*([\d.]+)",
+        "HDL": r"HDL\s*[:=]?\s*([\d.]+)",
+        "Triglycerides": r"Triglycerides\s*[:=]?\s*([\d.]+)",
+    }
+    for key, pattern in patterns.items():
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            try:
+                lab_data[key] = float(match.group(1))
+            except ValueError:
+                continue
+    return lab_data
+
+
+FILLER = ("Patient name Reference range Sample collected Remarks Method Specimen "
+          "Laboratory report page of Doctor signature Normal values vary").split()
+LINES = ["Hemoglobin {:.1f} g/dL", "MCHC {:.1f} g/dL", "MCH {:.1f} pg", "Sodium {:.0f} mEq/L",
+         "Potassium {:.1f} mEq/L", "LDL Cholesterol {:.0f} mg/dL", "Creatinine {:.2f} mg/dL"]
+
+
+def synthetic_ocr_text(size, seed=0):
+    """OCR-like noise with lab lines scattered through it; Glucose comes last."""
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        if rng.random() < 0.05:
+            line = rng.choice(LINES).format(rng.uniform(1, 150))
+        else:
+            line = " ".join(rng.choices(FILLER, k=rng.randint(4, 12)))
+        parts.append(line)
+        length += len(line) + 1
+    parts.append("Glucose: 110 mg/dL")
+    return "\n".join(parts)
+
+def best_of(fn, text, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = synthetic_ocr_text(int(args.size_mb * 1024 * 1024))
+    mb = len(text.encode()) / 1024 / 1024
+    rows = [
+        ("legacy parse_lab_values", legacy_parse_lab_values),
+        ("parse_lab_values", parse_lab_values),
+        ("scan_lab_values (all hits)", scan_lab_values),
+    ]
+    legacy = None
+    for name, fn in rows:
+        seconds = best_of(fn, text, args.repeat)
+        legacy = legacy or seconds
+        print(f"{name:<28} {seconds * 1000:9.1f} ms  {mb / seconds:8.1f} MB/s  {legacy / seconds:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
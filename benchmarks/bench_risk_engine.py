@@ -0,0 +1,83 @@
+"""
+Batch risk engine versus a Python loop over check_risks.
+
+    python benchmarks/bench_risk_engine.py --rows 100000 1000000
+
+The scalar loop is timed on at most --scalar-limit rows and extrapolated;
+its results are also compared row by row with the batch output.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from risk import check_risks, check_risks_frame  # noqa: E402
+
+
+def synthetic_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+
+    def sometimes(low, high):
+        values = rng.uniform(low, high, rows)
+        values[rng.random(rows) < 0.5] = np.nan  # lab not on the report
+        return values
+
+    return pd.DataFrame({
+        "glucose": rng.uniform(60, 200, rows),
+        "hemoglobin": rng.uniform(9, 17, rows),
+        "bmi": rng.uniform(14, 40, rows),
+        "systolic_bp": rng.integers(90, 180, rows).astype(float),
+        "diastolic_bp": rng.integers(50, 110, rows).astype(float),
+        "age": rng.integers(5, 90, rows),
+        "sex": rng.choice(np.array(["Male", "Female"], dtype=object), rows),
+        "labs.TSH": sometimes(0, 8),
+        "labs.ALT": sometimes(0, 80),
+        "labs.AST": sometimes(0, 70),
+        "labs.Creatinine": sometimes(0.4, 2),
+        "labs.Urea": sometimes(5, 80),
+        "labs.Hemoglobin": sometimes(8, 17),
+    })
+
+def scalar(rows):
+    """check_risks over plain dict rows, rebuilding each labs dict like the app does."""
+    out = []
+    for row in rows:
+        labs = {key[5:]: value for key, value in row.items() if key.startswith("labs.") and value == value}
+        out.append(check_risks(row["glucose"], row["hemoglobin"], row["bmi"], row["systolic_bp"],
+                               row["diastolic_bp"], labs, age=row["age"], sex=row["sex"]))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--scalar-limit", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        df = synthetic_frame(rows)
+        start = time.perf_counter()
+        batch = check_risks_frame(df)
+        batch_s = time.perf_counter() - start
+
+        sample = df.iloc[:min(rows, args.scalar_limit)]
+        rows_list = sample.to_dict("records")
+        start = time.perf_counter()
+        expected = scalar(rows_list)
+        scalar_s = (time.perf_counter() - start) * rows / len(sample)
+
+        got = zip(batch["risk"], batch["doctors"], batch["advice"], batch["overall_health"])
+        # The batch engine returns tuples and a frozenset where check_risks has lists and a set
+        mismatches = sum((tuple(risk), doctors, tuple(advice), overall) != g
+                         for (risk, doctors, advice, overall), g in zip(expected, got))
+        print(f"{rows:>9} rows  batch {batch_s:7.3f} s  scalar ~{scalar_s:7.2f} s  "
+              f"speedup {scalar_s / batch_s:6.1f}x  mismatches {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
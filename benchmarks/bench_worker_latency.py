@@ -0,0 +1,65 @@
+"""
+p50/p99 extraction latency, cold (in-process, tabula forced into a fresh
+JVM subprocess per call, tesseract forked per image) versus warm (jobs
+sent to a running extract_worker.py).
+
+    python extract_worker.py &
+    python benchmarks/bench_worker_latency.py reports/*.pdf --runs 50
+"""
+import argparse
+import mimetypes
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extraction  # noqa: E402
+from extract_worker import DEFAULT_ADDRESS, extract_via_worker  # noqa: E402
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def time_runs(fn, files, runs):
+    samples = []
+    for i in range(runs):
+        data, mime = files[i % len(files)]
+        start = time.perf_counter()
+        fn(data, mime)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def report(name, samples):
+    print(f"{name:<6} n={len(samples):<4} p50={percentile(samples, 50) * 1000:8.1f} ms  "
+          f"p99={percentile(samples, 99) * 1000:8.1f} ms  mean={statistics.mean(samples) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--address", default=DEFAULT_ADDRESS)
+    parser.add_argument("--poppler-path", default=os.getenv("POPPLER_PATH"))
+    args = parser.parse_args()
+
+    files = [(path.read_bytes(), mimetypes.guess_type(path.name)[0]) for path in args.files]
+    options = {"poppler_path": args.poppler_path}
+
+    extraction.TABULA_FORCE_SUBPROCESS = True
+    cold = time_runs(lambda data, mime: extraction.extract_bytes(data, mime, **options), files, args.runs)
+    report("cold", cold)
+
+    extract_via_worker(*files[0], address=args.address, **options)  # fail fast if the worker is down
+    warm = time_runs(lambda data, mime: extract_via_worker(data, mime, address=args.address, **options),
+                     files, args.runs)
+    report("warm", warm)
+    print(f"p50 speedup: {percentile(cold, 50) / percentile(warm, 50):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Cold-start import budget for the login page.
+
+Renders app.py once (logged out) under ``python -X importtime`` in a
+fresh interpreter and a scratch working directory, then reports what the
+app itself imported on top of Streamlit:
+
+    python benchmarks/import_budget.py --budget-ms 300
+
+Fails (exit 1) if the login page pulled in any of the extraction stack
+(tabula, pdf2image, pytesseract, ...) or the app's own imports took longer
+than --budget-ms.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Must not be imported until the first upload
+FORBIDDEN = ["tabula", "jpype", "pdf2image", "pytesseract", "tesserocr", "extraction", "preprocess"]
+
+CHILD = """
+import json, sys
+from streamlit.testing.v1 import AppTest
+before = set(sys.modules)
+at = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+print(json.dumps({
+    "exception": [str(e.value) for e in at.exception],
+    "titles": [t.value for t in at.title],
+    "loaded": sorted(set(sys.modules) - before),
+}))
+"""
+
+IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr):
+    """module -> (self us, cumulative us, depth) from -X importtime output."""
+    times = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            times[module] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return times
+
+def measure():
+    with tempfile.TemporaryDirectory() as workdir:
+        # Scratch cwd so the store, jobs.db and history land outside the repo
+        env = dict(os.environ, PYTHONPATH=str(ROOT) + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", CHILD, str(ROOT / "app.py")],
+            cwd=workdir, env=env, capture_output=True, text=True,
+        )
+    if proc.returncode != 0:
+        raise SystemExit(f"app run failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    times = parse_importtime(proc.stderr)
+    result["times"] = {name: times[name] for name in result["loaded"] if name in times}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=300,
+                        help="maximum import time of modules first loaded by the login page")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    result = measure()
+    if result["exception"]:
+        raise SystemExit(f"app raised: {result['exception']}")
+    times = result["times"]
+    total_ms = sum(self_us for self_us, _, _ in times.values()) / 1000
+    print(f"Login page ({', '.join(result['titles'])}): {len(result['loaded'])} new modules, "
+          f"{total_ms:.0f} ms of imports (budget {args.budget_ms:.0f} ms)")
+    print(f"{'cumulative ms':>14}  module")
+    top_level = [(cumulative, name) for name, (_, cumulative, depth) in times.items() if depth == 0]
+    for cumulative, name in sorted(top_level, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>14.1f}  {name}")
+
+    loaded = set(result["loaded"])
+    leaked = [name for name in FORBIDDEN if name in loaded]
+    failed = False
+    if leaked:
+        print(f"FAIL: login page imported {', '.join(leaked)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"FAIL: {total_ms:.0f} ms over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+Concurrent-session load test for app.py, built on Streamlit's AppTest.
+
+Each simulated user runs a scripted flow through the real app script:
+register, log in from a fresh session, enter vitals, upload a CSV report
+and wait for its extraction job, Check Risk, then page through and export
+the history:
+
+    python benchmarks/loadtest.py --users 8 --iterations 2 --backend json
+    python benchmarks/loadtest.py --users 8 --compare old.json
+
+AppTest swaps process-wide Streamlit state on every run, so it can't run
+sessions side by side in threads. Each simulated user is a process
+instead, all sharing one scratch directory and therefore the same record
+store, jobs.db and session secret, as replicas of the app would. Every
+process runs one unmeasured flow first, then all start together.
+
+Reports rerun latency percentiles per step, reruns/s and flows/s, and
+contention on the record store: write times, JSON rewrites and their
+size, reloads forced by other sessions' writes, and records or accounts
+that went missing because two writers raced. Everything runs offline on
+seeded data; results go to --output as JSON with the git commit, so runs
+on different commits can be compared with --compare.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import metadata
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+APP = HERE.parent / "app.py"
+sys.path.insert(0, str(HERE.parent))
+sys.path.insert(0, str(HERE))
+
+import synth  # noqa: E402
+
+DEFAULT_OUTPUT = HERE / "loadtest.json"
+STEPS = ["open", "register", "login", "vitals", "upload", "poll", "job_wait", "check_risk", "history", "export"]
+JOB_TIMEOUT = 60
+# Check Risk is pressed this many times per flow, one record each
+CHECKS_PER_FLOW = 2
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+# --- One simulated user ---
+class Session:
+    """Drives AppTest instances through the flow and times every rerun."""
+
+    def __init__(self, tag, user_id, iteration, timeout):
+        self.email = f"{tag}{user_id:04d}.{iteration}@example.com"
+        self.name = f"Load User {tag}{user_id}.{iteration}"
+        self.password = f"pw-{user_id}-{iteration}"
+        self.seed = user_id * 1000 + iteration
+        self.timeout = timeout
+        self.timings = {}
+        self.reruns = 0
+        self.registered = False
+        self.checks = 0
+
+    def _new_app(self):
+        from streamlit.testing.v1 import AppTest
+        return AppTest.from_file(str(APP), default_timeout=self.timeout)
+
+    def _time(self, step, seconds):
+        self.timings.setdefault(step, []).append(seconds)
+
+    def _run(self, at, step):
+        start = time.perf_counter()
+        at.run()
+        self._time(step, time.perf_counter() - start)
+        self.reruns += 1
+        if at.exception:
+            raise RuntimeError(f"{step}: {at.exception[0].value}")
+        return at
+
+    def _button(self, at, label):
+        for button in at.button:
+            if button.label == label:
+                return button
+        raise RuntimeError(f"no {label!r} button on the page")
+
+    def flow(self):
+        at = self._run(self._new_app(), "open")
+        inputs = {t.label: t for t in at.text_input}
+        inputs["📧 New Email/Phone"].input(self.email)
+        inputs["📝 Full Name"].input(self.name)
+        inputs["🔑 New Password"].input(self.password)
+        self._button(at, "Register").click()
+        self._run(at, "register")
+        self.registered = True
+
+        # A second browser logging in to the new account
+        at = self._run(self._new_app(), "open")
+        inputs = {t.label: t for t in at.text_input}
+        inputs["📧 Email or 📱 Phone"].input(self.email)
+        inputs["🔑 Password"].input(self.password)
+        self._button(at, "Login").click()
+        self._run(at, "login")
+        self._run(at, "login")  # the rerun that renders the main page
+        if not any(t.value == "🩺 Doctor Buddy" for t in at.title):
+            raise RuntimeError(f"login failed: {[w.value for w in at.warning + at.error]}")
+
+        numbers = {n.label: n for n in at.number_input}
+        for label, value in [("Glucose (mg/dL)", 95.0 + self.seed % 40), ("Systolic BP (mmHg)", 125),
+                             ("Hemoglobin (g/dL)", 13.5)]:
+            numbers[label].set_value(value)
+            self._run(at, "vitals")
+
+        data, _ = synth.csv_report(1, seed=self.seed)
+        at.file_uploader[0].set_value((f"report_{self.seed}.csv", data, "text/csv"))
+        self._run(at, "upload")
+        start = time.perf_counter()
+        while not any(s.value == "📄 Extracted Lab Values by File" for s in at.subheader):
+            if time.perf_counter() - start > JOB_TIMEOUT:
+                raise RuntimeError("extraction job did not finish")
+            time.sleep(0.1)
+            self._run(at, "poll")  # an idle rerun, like the progress fragment's
+        self._time("job_wait", time.perf_counter() - start)
+
+        for _ in range(CHECKS_PER_FLOW):
+            self._button(at, "Check Risk").click()
+            self._run(at, "check_risk")
+            self.checks += 1
+
+        # Page through the history, then export it
+        at.selectbox(key="history_page_size").set_value(50)
+        self._run(at, "history")
+        self._button(at, "📦 Prepare Download").click()
+        self._run(at, "export")
+
+
+def user_process(user_id, iterations, timeout, barrier, results):
+    """One simulated user: a warm-up flow, then ``iterations`` measured flows."""
+    import metrics
+    from storage import io_counters
+
+    out = {"user": user_id, "timings": {}, "reruns": 0, "flows": 0, "accounts": [], "errors": []}
+    try:
+        Session("warmup", user_id, 0, timeout).flow()
+    except Exception as e:
+        out["errors"].append(f"user {user_id} warm-up: {type(e).__name__}: {e}")
+    metrics.reset()
+    io_start = io_counters()
+    barrier.wait()
+    for iteration in range(iterations):
+        session = Session("load", user_id, iteration, timeout)
+        try:
+            session.flow()
+            out["flows"] += 1
+        except Exception as e:
+            out["errors"].append(f"user {user_id}: {type(e).__name__}: {e}")
+        if session.registered:
+            out["accounts"].append((session.email, session.checks))
+        for step, values in session.timings.items():
+            out["timings"].setdefault(step, []).extend(values)
+        out["reruns"] += session.reruns
+    io_end = io_counters()
+    out["io"] = {kind: io_end[kind] - io_start[kind] for kind in io_end}
+    out["metrics"] = metrics.snapshot()
+    results.put(out)
+
+def run_load(users, iterations, timeout):
+    """Run ``users`` simulated users side by side; returns their merged results."""
+    # spawn: a fresh interpreter per user, nothing inherited from this one's imports
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(users + 1)
+    results = ctx.Queue()
+    processes = [ctx.Process(target=user_process, args=(i, iterations, timeout, barrier, results))
+                 for i in range(users)]
+    for process in processes:
+        process.start()
+    barrier.wait()  # every user has warmed up
+    start = time.perf_counter()
+    outs = [results.get() for _ in processes]
+    seconds = time.perf_counter() - start
+    for process in processes:
+        process.join()
+
+    merged = {"timings": {}, "reruns": 0, "flows": 0, "accounts": [], "errors": [], "io": {}, "timers": [],
+              "seconds": seconds}
+    for out in outs:
+        for step, values in out["timings"].items():
+            merged["timings"].setdefault(step, []).extend(values)
+        merged["reruns"] += out["reruns"]
+        merged["flows"] += out["flows"]
+        merged["accounts"] += out["accounts"]
+        merged["errors"] += out["errors"]
+        for kind, n in out["io"].items():
+            merged["io"][kind] = merged["io"].get(kind, 0) + n
+        merged["timers"] += out["metrics"]["timers"]
+    return merged
+
+def lost_updates(accounts, preloaded):
+    """What the run wrote, or found in the store, that is no longer there."""
+    from storage import open_store
+    store = open_store(Path.cwd())
+    lost = {"accounts": 0, "profiles": 0, "records": 0, "preloaded_records": 0}
+    for email, checks in accounts:
+        lost["accounts"] += store.get_user(email) is None
+        # The profile, then one record per Check Risk
+        count = store.record_count(email)
+        lost["profiles"] += count < 1
+        lost["records"] += max(0, checks - max(0, count - 1))
+    for user, records in preloaded.items():
+        lost["preloaded_records"] += max(0, len(records) - store.record_count(user))
+    return lost
+
+
+# --- Summaries ---
+def _timer(timers, name):
+    """One timer summed over processes and label sets: count, seconds, max, bytes."""
+    total = {"count": 0, "seconds": 0.0, "max": 0.0, "bytes": 0}
+    for timer in timers:
+        if timer["name"] == name:
+            total["count"] += timer["count"]
+            total["seconds"] += timer["seconds"]
+            total["max"] = max(total["max"], timer["max"])
+            total["bytes"] += timer["totals"].get("bytes", 0)
+    return total
+
+def _latencies(values):
+    return {"n": len(values), "p50_ms": percentile(values, 0.5) * 1000, "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000, "mean_ms": statistics.fmean(values) * 1000}
+
+def summarize(raw, lost):
+    steps = {step: _latencies(raw["timings"][step]) for step in STEPS if raw["timings"].get(step)}
+    reruns = [t for step, values in raw["timings"].items() if step != "job_wait" for t in values]
+    wait, write = _timer(raw["timers"], "store_lock_wait"), _timer(raw["timers"], "store_write")
+    save = _timer(raw["timers"], "save_json")
+    return {
+        "steps": steps,
+        "all_reruns": _latencies(reruns) if reruns else {},
+        "throughput": {"seconds": raw["seconds"], "reruns_per_s": raw["reruns"] / raw["seconds"],
+                       "flows_per_s": raw["flows"] / raw["seconds"], "flows": raw["flows"]},
+        "store": {
+            "lock_wait_total_s": wait["seconds"],
+            "lock_wait_max_ms": wait["max"] * 1000,
+            "writes": write["count"],
+            "write_mean_ms": write["seconds"] / write["count"] * 1000 if write["count"] else 0.0,
+            "write_max_ms": write["max"] * 1000,
+            "json_rewrites": save["count"],
+            "json_bytes_per_rewrite": save["bytes"] / save["count"] if save["count"] else 0,
+            "disk_reads": raw["io"].get("reads", 0),
+            "lost": lost,
+        },
+        "errors": raw["errors"],
+    }
+
+def environment():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=HERE, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = None
+    return {
+        "commit": rev,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "streamlit": metadata.version("streamlit"),
+    }
+
+def print_report(report, previous=None):
+    def change(path, value):
+        node = previous
+        for key in path:
+            node = (node or {}).get(key)
+        return f"{value / node - 1:+8.1%}" if node else ""
+
+    summary = report["summary"]
+    print(f"\n{'step':<12} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}" + ("  p95 vs prev" if previous else ""))
+    rows = list(summary["steps"].items()) + [("all reruns", summary["all_reruns"])]
+    for step, s in rows:
+        if not s:
+            continue
+        path = ["summary", "all_reruns"] if step == "all reruns" else ["summary", "steps", step]
+        print(f"{step:<12} {s['n']:>6} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} {s['p99_ms']:9.1f}  "
+              f"{change(path + ['p95_ms'], s['p95_ms'])}")
+    t = summary["throughput"]
+    print(f"\n{t['flows']} flows in {t['seconds']:.1f} s: {t['reruns_per_s']:.1f} reruns/s "
+          f"{change(['summary', 'throughput', 'reruns_per_s'], t['reruns_per_s'])}, "
+          f"{t['flows_per_s']:.2f} flows/s")
+    st = summary["store"]
+    print(f"Store ({report['params']['backend']}): {st['writes']} writes, mean {st['write_mean_ms']:.1f} ms, "
+          f"max {st['write_max_ms']:.1f} ms; {st['disk_reads']} disk reads; "
+          f"{st['lock_wait_total_s']:.2f} s queued on the in-process lock")
+    if st["json_rewrites"]:
+        print(f"  JSON files rewritten {st['json_rewrites']} times, {st['json_bytes_per_rewrite'] / 1024:.1f} KB each")
+    lost = st["lost"]
+    print(f"  lost to racing writers: {lost['accounts']} accounts, {lost['profiles']} profiles, "
+          f"{lost['records']} records, {lost['preloaded_records']} preloaded records")
+    if summary["errors"]:
+        print(f"{len(summary['errors'])} flows failed, first: {summary['errors'][0]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=8, help="concurrent simulated users")
+    parser.add_argument("--iterations", type=int, default=2, help="measured flows per user")
+    parser.add_argument("--backend", choices=["sqlite", "json"], default="sqlite")
+    parser.add_argument("--preload-users", type=int, default=200,
+                        help="existing users with 20 records each in the store before the run")
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="BCRYPT_ROUNDS (default: the app's)")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per rerun")
+    parser.add_argument("--output", type=Path, default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", type=Path, help="previous --output file to compare against")
+    args = parser.parse_args()
+    output = args.output.resolve()
+    previous = json.loads(args.compare.read_text(encoding="utf-8")) if args.compare else None
+
+    # Inherited by the user processes, which load app.py after this
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ.pop("DB_PATH", None)
+    if args.bcrypt_rounds:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.chdir(tempfile.mkdtemp(prefix="loadtest-"))
+
+    from storage import SqliteStore, save_json
+    records = synth.patient_records(args.preload_users, 20, seed=0)
+    if args.backend == "json":
+        save_json(Path("patient_data.json"), records)
+    else:
+        store = SqliteStore("doctor_buddy.db")
+        for user, rows in records.items():
+            store.replace_records(user, rows)
+
+    raw = run_load(args.users, args.iterations, args.timeout)
+    report = {
+        "environment": environment(),
+        "params": {"users": args.users, "iterations": args.iterations, "backend": args.backend,
+                   "preload_users": args.preload_users, "bcrypt_rounds": os.getenv("BCRYPT_ROUNDS")},
+        "summary": summarize(raw, lost_updates(raw["accounts"], records)),
+    }
+    print_report(report, previous)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {output}")
+    sys.exit(1 if raw["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
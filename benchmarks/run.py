@@ -0,0 +1,288 @@
+"""
+Benchmark suite: times each pipeline stage on synthetic data at several
+sizes and compares the numbers against a stored baseline.
+
+    python benchmarks/run.py                      # full sizes, writes benchmarks/results.json
+    python benchmarks/run.py --quick              # small sizes, for a fast check
+    python benchmarks/run.py --save-baseline      # also store the results as the baseline
+    python benchmarks/run.py --fail-on-regression # exit 1 if anything got >20% slower
+
+Extraction benchmarks that need Poppler or tesseract are recorded as
+skipped when those tools aren't installed. Baselines are per machine:
+save one on the machine you compare on.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import metadata
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+sys.path.insert(0, str(HERE))
+
+import synth  # noqa: E402
+import extraction  # noqa: E402
+from csv_labs import read_csv_labs  # noqa: E402
+from lab_values import parse_lab_values  # noqa: E402
+from risk import check_risks, check_risks_frame, records_frame  # noqa: E402
+from storage import JsonStore, SqliteStore, save_json  # noqa: E402
+import trends  # noqa: E402
+
+DEFAULT_RESULTS = HERE / "results.json"
+DEFAULT_BASELINE = HERE / "baseline.json"
+
+SIZES = {
+    "full": {
+        "text_kb": [10, 100, 1024],
+        "risk_rows": [10_000, 100_000, 1_000_000],
+        "csv_patients": [100, 10_000],
+        "pdf_pages": [1, 10, 30],
+        "scan_pages": [1, 5],
+        "store_users": [(1_000, 100), (10_000, 100)],
+        "trend_records": [100, 10_000],
+    },
+    "quick": {
+        "text_kb": [10, 100],
+        "risk_rows": [10_000],
+        "csv_patients": [100],
+        "pdf_pages": [1, 5],
+        "scan_pages": [1],
+        "store_users": [(200, 20)],
+        "trend_records": [100],
+    },
+}
+
+
+class Suite:
+    def __init__(self, repeat, only=None):
+        self.repeat = repeat
+        self.only = only
+        self.results = {}
+
+    def wanted(self, name):
+        return not self.only or any(part in name for part in self.only)
+
+    def time(self, name, fn, setup=None, repeat=None, **params):
+        """Run ``fn(setup())`` ``repeat`` times; setup is excluded from the timing."""
+        if not self.wanted(name):
+            return
+        samples = []
+        for _ in range(repeat or self.repeat):
+            arg = setup() if setup else None
+            start = time.perf_counter()
+            fn(arg) if setup else fn()
+            samples.append(time.perf_counter() - start)
+        self.results[name] = {"seconds": statistics.median(samples), "best": min(samples),
+                              "runs": len(samples), "params": params}
+        print(f"{name:<40} {statistics.median(samples) * 1000:10.2f} ms  (best {min(samples) * 1000:.2f})")
+
+    def skip(self, name, reason):
+        if self.wanted(name):
+            self.results[name] = {"skipped": reason}
+            print(f"{name:<40}    skipped: {reason}")
+
+
+# --- Stage benchmarks ---
+def bench_parse(suite, sizes):
+    for kb in sizes["text_kb"]:
+        text = synth.ocr_text(kb * 1024)
+        suite.time(f"parse_lab_values/{kb}KB", lambda: parse_lab_values(text), kb=kb)
+
+def bench_risk(suite, sizes):
+    for rows in sizes["risk_rows"]:
+        records = list(synth.patient_records(1, rows, distinct=min(rows, 1000)).values())[0][1:]
+        df = records_frame(records)
+        suite.time(f"check_risks_frame/{rows}", lambda: check_risks_frame(df), rows=rows)
+        if rows <= 100_000:
+            def scalar():
+                for r in records:
+                    check_risks(r["glucose"], r["hemoglobin"], r["bmi"], r["systolic_bp"], r["diastolic_bp"],
+                                r["labs"], age=r["age"], sex=r["sex"])
+            suite.time(f"check_risks/{rows}", scalar, repeat=1, rows=rows)
+
+def bench_extract_csv(suite, sizes):
+    for patients in sizes["csv_patients"]:
+        for layout in ("long", "wide"):
+            data, _ = synth.csv_report(patients, layout=layout)
+            # extract_bytes takes one patient per file, so time the reader behind it
+            name = f"read_csv_labs/{patients}" if layout == "long" else f"read_csv_labs/{layout}/{patients}"
+            suite.time(name, lambda: read_csv_labs(data), patients=patients, bytes=len(data))
+
+def bench_extract_pdf(suite, sizes, poppler_path):
+    pdftotext = shutil.which(extraction._poppler_tool("pdftotext", poppler_path))
+    for pages in sizes["pdf_pages"]:
+        name = f"extract_text/digital_pdf/{pages}p"
+        if not pdftotext:
+            suite.skip(name, "pdftotext (Poppler) not found")
+            continue
+        data, _ = synth.digital_pdf(pages)
+        suite.time(name, lambda: extraction.extract_bytes(data, extraction.PDF_TYPE, poppler_path=poppler_path),
+                   pages=pages, bytes=len(data))
+
+def bench_extract_scan(suite, sizes, poppler_path):
+    pdftoppm = shutil.which(extraction._poppler_tool("pdftoppm", poppler_path))
+    tesseract = shutil.which(extraction.pytesseract.pytesseract.tesseract_cmd)
+    for pages in sizes["scan_pages"]:
+        for noise in (0.0, 0.5):
+            name = f"extract_text/scanned_pdf/{pages}p/noise{noise}"
+            stream_name = f"stream_lab_values/scanned_pdf/{pages}p/noise{noise}"
+            if not (pdftoppm and tesseract):
+                suite.skip(name, "pdftoppm (Poppler) or tesseract not found")
+                suite.skip(stream_name, "pdftoppm (Poppler) or tesseract not found")
+                continue
+            data, truth = synth.scanned_pdf(pages, noise=noise)
+            suite.time(name, lambda: extraction.extract_bytes(
+                data, extraction.PDF_TYPE, poppler_path=poppler_path, ocr_workers=1),
+                repeat=1, pages=pages, noise=noise, bytes=len(data))
+            # Page by page, stopping once page 1's analytes are found
+            suite.time(stream_name, lambda: extraction.stream_lab_values(
+                data, extraction.PDF_TYPE, targets=list(truth[0]), poppler_path=poppler_path),
+                repeat=1, pages=pages, noise=noise, bytes=len(data))
+
+def bench_store(suite, sizes):
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        for users, per_user in sizes["store_users"]:
+            data = synth.patient_records(users, per_user)
+            record = data[next(iter(data))][1]
+            path = tmp / "patient_data.json"
+            name = f"save_json/{users}x{per_user}"
+            suite.time(name, lambda: save_json(path, data), repeat=min(suite.repeat, 3),
+                       users=users, records_per_user=per_user)
+            if name in suite.results:
+                suite.results[name]["params"]["bytes"] = path.stat().st_size
+
+            json_store = JsonStore(tmp / "users.json", path)
+            suite.time(f"append_record/json/{users}x{per_user}",
+                       lambda: json_store.append_record("user00000@example.com", record),
+                       repeat=min(suite.repeat, 3), users=users, records_per_user=per_user)
+
+            db = tmp / f"store-{users}.db"
+            sqlite_store = SqliteStore(db)
+            sqlite_store.migrate_from_json(tmp / "users.json", path)
+            suite.time(f"append_record/sqlite/{users}x{per_user}",
+                       lambda: sqlite_store.append_record("user00000@example.com", record),
+                       repeat=max(suite.repeat, 20), users=users, records_per_user=per_user)
+
+def bench_trends(suite, sizes):
+    for n in sizes["trend_records"]:
+        if not any(suite.wanted(f"trends/{step}/{n}") for step in ("update", "rebuild", "sync")):
+            continue
+        records = next(iter(synth.patient_records(1, n, distinct=min(n, 1000)).values()))
+        state = trends.build(records[:-1])
+        # Folding in one more record should cost the same at any history length
+        suite.time(f"trends/update/{n}", lambda s: trends.update(s, records[-1]),
+                   setup=lambda: json.loads(json.dumps(state)), records=n)
+        suite.time(f"trends/rebuild/{n}", lambda: trends.build(records), records=n)
+        # The same through TrendStore: fold in and persist one appended record
+        with tempfile.TemporaryDirectory() as tmp:
+            user = "user00000@example.com"
+            store = SqliteStore(Path(tmp) / "doctor_buddy.db")
+            store.replace_records(user, records[:-1])
+            trend_store = trends.TrendStore(Path(tmp) / "trends")
+            trend_store.rebuild(user, store)
+            suite.time(f"trends/sync/{n}", lambda _: trend_store.sync(user, store),
+                       setup=lambda: store.append_record(user, records[-1]), records=n)
+            if trend_store.verify(user, store):
+                raise AssertionError("stored trend aggregates disagree with a full recompute")
+        problems = trends.verify(trends.update(json.loads(json.dumps(state)), records[-1]), trends.build(records))
+        if problems:
+            raise AssertionError(f"trend aggregates disagree with a full recompute: {problems[:5]}")
+
+
+# --- Results ---
+def environment():
+    def version(pkg):
+        try:
+            return metadata.version(pkg)
+        except metadata.PackageNotFoundError:
+            return None
+
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=HERE, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        rev = None
+    try:
+        tesseract = str(extraction.pytesseract.get_tesseract_version())
+    except Exception:
+        tesseract = None
+    return {
+        "commit": rev,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "tesseract": tesseract,
+        "packages": {pkg: version(pkg) for pkg in
+                     ["streamlit", "pandas", "numpy", "pillow", "pytesseract", "pdf2image", "tabula-py"]},
+    }
+
+def compare(results, baseline, threshold):
+    """Print current vs baseline per benchmark; returns the names that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, current in results.items():
+        base = baseline.get(name)
+        if "seconds" not in current or not base or "seconds" not in base:
+            continue
+        change = current["seconds"] / base["seconds"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<40} {base['seconds'] * 1000:9.2f}ms {current['seconds'] * 1000:9.2f}ms "
+              f"{change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="small data sizes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="*", help="run benchmarks whose name contains any of these")
+    parser.add_argument("--output", type=Path, default=DEFAULT_RESULTS)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--poppler-path", default=os.getenv("POPPLER_PATH"))
+    args = parser.parse_args()
+
+    sizes = SIZES["quick" if args.quick else "full"]
+    suite = Suite(args.repeat, args.only)
+    bench_parse(suite, sizes)
+    bench_risk(suite, sizes)
+    bench_extract_csv(suite, sizes)
+    bench_extract_pdf(suite, sizes, args.poppler_path)
+    bench_extract_scan(suite, sizes, args.poppler_path)
+    bench_store(suite, sizes)
+    bench_trends(suite, sizes)
+
+    report = {"environment": environment(), "sizes": "quick" if args.quick else "full", "results": suite.results}
+    args.output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {args.output}")
+
+    regressions = []
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if baseline.get("sizes") != report["sizes"]:
+            print(f"Baseline was run with {baseline.get('sizes')} sizes; comparing matching names only")
+        regressions = compare(suite.results, baseline["results"], args.threshold)
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Baseline saved to {args.baseline}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Synthetic lab reports for benchmarks, generated locally and
+deterministically from a seed. Every generator also returns the ground
+truth values so extraction recall can be measured.
+"""
+import io
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lab_values import LAB_TESTS  # noqa: E402
+
+# name -> (low, high, decimals, unit, reference range)
+ANALYTES = {
+    "Glucose": (70, 200, 0, "mg/dL", "70-110"),
+    "Hemoglobin": (9, 17, 1, "g/dL", "12-16"),
+    "Systolic_BP": (95, 170, 0, "mmHg", "<140"),
+    "Diastolic_BP": (55, 105, 0, "mmHg", "<90"),
+    "TSH": (0.3, 8, 2, "uIU/mL", "0.4-4.0"),
+    "ALT": (7, 80, 0, "U/L", "7-45"),
+    "AST": (8, 70, 0, "U/L", "8-40"),
+    "Creatinine": (0.5, 2, 2, "mg/dL", "0.6-1.3"),
+    "Urea": (7, 70, 0, "mg/dL", "7-50"),
+    "WBC": (3, 14, 1, "x10^3/µL", "4-11"),
+    "RBC": (3.5, 6, 2, "x10^6/µL", "4.2-5.9"),
+    "Platelets": (120, 450, 0, "x10^3/µL", "150-400"),
+    "MCV": (75, 105, 0, "fL", "80-100"),
+    "MCH": (24, 35, 1, "pg", "27-33"),
+    "MCHC": (30, 37, 1, "g/dL", "32-36"),
+    "Sodium": (128, 150, 0, "mEq/L", "135-145"),
+    "Potassium": (3, 6, 1, "mEq/L", "3.5-5.1"),
+    "Chloride": (92, 112, 0, "mEq/L", "98-107"),
+    "Total Cholesterol": (130, 300, 0, "mg/dL", "<200"),
+    "LDL": (60, 200, 0, "mg/dL", "<130"),
+    "HDL": (25, 80, 0, "mg/dL", ">40"),
+    "Triglycerides": (60, 400, 0, "mg/dL", "<150"),
+}
+# How each analyte is labelled on the synthetic report
+LABELS = {test.name: test.aliases[0] for test in LAB_TESTS}
+LABELS.update(Systolic_BP="Systolic", Diastolic_BP="Diastolic")
+
+FILLER = ("Patient name Reference range Sample collected Remarks Method Specimen "
+          "Laboratory report page of Doctor signature Normal values vary").split()
+
+
+def lab_values(rng, count=None):
+    """Random ground truth, e.g. {"Glucose": 112.0, ...}."""
+    names = list(ANALYTES)
+    if count is not None:
+        names = rng.sample(names, min(count, len(names)))
+    values = {}
+    for name in names:
+        low, high, decimals, _, _ = ANALYTES[name]
+        values[name] = round(rng.uniform(low, high), decimals)
+    return values
+
+def report_rows(values):
+    """(label, value, unit, reference) table rows for a report."""
+    rows = []
+    for name, value in values.items():
+        _, _, decimals, unit, reference = ANALYTES[name]
+        rows.append((LABELS[name], f"{value:.{decimals}f}", unit, reference))
+    return rows
+
+def report_pages(rng, pages, per_page=8):
+    """Ground truth per page; analytes are spread over the pages."""
+    return [lab_values(rng, per_page) for _ in range(pages)]
+
+
+# --- OCR-like text ---
+def ocr_text(size, seed=0):
+    """Noise words with lab lines scattered through them; Glucose comes last."""
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        if rng.random() < 0.05:
+            row = report_rows(lab_values(rng, 1))[0]
+            line = " ".join(row[:3])
+        else:
+            line = " ".join(rng.choices(FILLER, k=rng.randint(4, 12)))
+        parts.append(line)
+        length += len(line) + 1
+    parts.append("Glucose: 110 mg/dL")
+    return "\n".join(parts)
+
+
+# --- CSV ---
+def csv_report(rows, layout="long", seed=0):
+    """
+    CSV export with ``rows`` patients' results. ``long`` has one
+    Test/Result/Unit row per analyte, ``wide`` one column per analyte.
+    Returns (bytes, ground truth list per patient).
+    """
+    rng = random.Random(seed)
+    truth = [lab_values(rng) for _ in range(rows)]
+    out = io.StringIO()
+    if layout == "long":
+        out.write("Patient ID,Test,Result,Unit,Reference Range\n")
+        for pid, values in enumerate(truth):
+            for label, value, unit, reference in report_rows(values):
+                out.write(f"P{pid:06d},{label},{value},{unit},{reference}\n")
+    else:
+        names = list(ANALYTES)
+        out.write("Patient ID," + ",".join(LABELS[n] for n in names) + "\n")
+        for pid, values in enumerate(truth):
+            out.write(f"P{pid:06d}," + ",".join(str(values[n]) for n in names) + "\n")
+    return out.getvalue().encode("utf-8"), truth
+
+
+# --- Digital PDF ---
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _pdf_text(x, y, text, size=10):
+    # Helvetica's standard encoding has no µ; keep reports ASCII
+    text = text.replace("µ", "u")
+    return f"BT /F1 {size} Tf {x} {y} Td ({_pdf_escape(text)}) Tj ET\n"
+
+def _build_pdf(objects):
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % n + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def digital_pdf(pages=1, seed=0, per_page=8):
+    """
+    Born-digital report: a text layer with a ruled results table on every
+    page. Returns (bytes, ground truth per page).
+    """
+    rng = random.Random(seed)
+    truth = report_pages(rng, pages, per_page)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    columns = [50, 230, 330, 450]
+    for number, values in enumerate(truth, start=1):
+        stream = _pdf_text(50, 760, "City Diagnostics - Laboratory Report", 14)
+        stream += _pdf_text(50, 740, f"Patient: Synthetic {seed}   Page {number} of {pages}")
+        y = 700
+        stream += "0.5 w\n"
+        for row in [("Test", "Result", "Unit", "Reference Range")] + report_rows(values):
+            stream += f"50 {y + 14} m 550 {y + 14} l S\n"
+            for x, cell in zip(columns, row):
+                stream += _pdf_text(x, y, cell)
+            y -= 20
+        stream += f"50 {y + 14} m 550 {y + 14} l S\n"
+        content = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    return _build_pdf(objects), truth
+
+
+# --- Scanned PDF ---
+def _font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1 has a single bitmap size
+        return ImageFont.load_default()
+
+def render_page(values, dpi=200, noise=0.0, seed=0):
+    """
+    One report page as a greyscale image at ``dpi``, 8.5 x 11 in. ``noise``
+    (0-1) adds Gaussian grain and a skew of up to 2 degrees, like a phone
+    photo or a cheap scanner.
+    """
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    page = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    line = int(dpi * 0.28)
+    title, body = _font(int(dpi * 0.2)), _font(int(dpi * 0.15))
+    columns = [int(dpi * x) for x in (0.7, 3.2, 4.6, 6.2)]
+    y = int(dpi * 0.8)
+    draw.text((columns[0], y), "City Diagnostics - Laboratory Report", fill=0, font=title)
+    y += line * 2
+    for row in [("Test", "Result", "Unit", "Reference Range")] + report_rows(values):
+        for x, cell in zip(columns, row):
+            draw.text((x, y), cell, fill=0, font=body)
+        y += line
+    if noise:
+        grain = Image.effect_noise((width, height), 40 + 120 * noise)
+        page = Image.blend(page, grain, 0.25 * noise)
+        page = page.rotate(rng.uniform(-2, 2) * noise, expand=False, fillcolor=255)
+    return page
+
+def scanned_pdf(pages=1, dpi=200, noise=0.0, seed=0, per_page=8):
+    """Image-only PDF (no text layer). Returns (bytes, ground truth per page)."""
+    rng = random.Random(seed)
+    truth = report_pages(rng, pages, per_page)
+    images = [render_page(values, dpi, noise, seed + i) for i, values in enumerate(truth)]
+    out = io.BytesIO()
+    images[0].save(out, format="PDF", save_all=True, append_images=images[1:], resolution=dpi)
+    return out.getvalue(), truth
+
+def image_report(dpi=200, noise=0.0, seed=0, fmt="PNG"):
+    """A single photographed/scanned page as PNG or JPEG bytes."""
+    rng = random.Random(seed)
+    truth = lab_values(rng, 8)
+    out = io.BytesIO()
+    render_page(truth, dpi, noise, seed).save(out, format=fmt)
+    return out.getvalue(), truth
+
+
+# --- Record store data ---
+def patient_records(users, records_per_user, seed=0, distinct=1000):
+    """
+    {user: [profile, record, ...]} shaped like the app's store. Records are
+    drawn from a pool of ``distinct`` dicts, so 10k x 100 fits in memory while
+    still serializing every record in full.
+    """
+    rng = random.Random(seed)
+    pool = []
+    for i in range(distinct):
+        labs = lab_values(rng, 6)
+        pool.append({
+            "timestamp": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T08:{i % 60:02d}:00",
+            "age": rng.randint(18, 90), "sex": rng.choice(["Male", "Female"]),
+            "weight": round(rng.uniform(45, 120), 1), "height_cm": round(rng.uniform(150, 195), 1),
+            "glucose": labs.get("Glucose", 90.0), "bmi": round(rng.uniform(17, 38), 2),
+            "systolic_bp": 120.0, "diastolic_bp": 80.0, "hemoglobin": labs.get("Hemoglobin", 14.0),
+            "labs": labs, "overall_health": "Please monitor your health", "risk": ["Normal weight"],
+        })
+    data = {}
+    for u in range(users):
+        profile = {"age": 40, "sex": "Male", "weight": 70.0, "height_cm": 170.0}
+        data[f"user{u:05d}@example.com"] = [profile] + [pool[rng.randrange(distinct)] for _ in range(records_per_user)]
+    return data
@@ -0,0 +1,113 @@
+"""
+App settings, resolved once per process.
+
+Each setting comes from its environment variable (the key upper-cased,
+e.g. POPPLER_PATH) if set, else from the [doctor_buddy] table of
+.streamlit/config.toml, else the default below:
+
+    [doctor_buddy]
+    poppler_path = 'C:\\poppler\\Library\\bin'
+    tesseract_cmd = 'C:\\Program Files\\Tesseract-OCR\\tesseract.exe'
+    admin_emails = ["you@example.com"]
+
+Streamlit reads the same file and logs a warning for each key it doesn't
+know; they are otherwise ignored.
+"""
+import os
+from functools import lru_cache
+from pathlib import Path
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+    import toml
+
+SECTION = "doctor_buddy"
+
+DEFAULTS = {
+    # External tools; None means "find it on PATH"
+    "poppler_path": None,
+    "tesseract_cmd": None,
+    "java_home": None,
+    # "queue" runs uploads as background jobs, "local" extracts in the script
+    # thread, "worker" uses extract_worker.py
+    "extract_mode": "queue",
+    "job_workers": 2,
+    "jobs_db": None,
+    # extract_worker.py: host:port, seconds to connect / to wait for a job's
+    # text before extracting locally, shared key (None: .worker_key, loopback only)
+    "extract_worker_address": "127.0.0.1:6011",
+    "extract_worker_timeout": 2.0,
+    "extract_worker_job_timeout": 300.0,
+    "extract_worker_authkey": None,
+    # Parallel page OCR for multi-page scans
+    "ocr_workers": os.cpu_count() or 1,
+    # Grayscale/downscale/binarize/deskew before OCR; adaptive reads pages at low DPI first
+    "ocr_preprocess": True,
+    "ocr_adaptive": False,
+    "extract_cache_dir": None,
+    "extract_cache_mb": 512,
+    "history_dir": None,
+    "trends_dir": None,
+    # Spoken results summary: voice id or part of its name (None: engine default), words per minute
+    "speech_voice": None,
+    "speech_rate": 120,
+    "speech_cache_mb": 64,
+    # Record store: "sqlite" or "json" (users.json and patient_data.json);
+    # db_path defaults to doctor_buddy.db next to them
+    "storage_backend": "sqlite",
+    "db_path": None,
+    # Logins: bcrypt cost, bcrypt threads, checks allowed to queue (None: 8 per thread)
+    "bcrypt_rounds": 12,
+    "auth_workers": max(1, (os.cpu_count() or 2) // 2),
+    "auth_max_pending": None,
+    "session_ttl_hours": 12,
+    # Signs session tokens; None keeps a random key in .auth_secret
+    "auth_secret": None,
+    # Emails that see the pipeline metrics expander
+    "admin_emails": [],
+    # Rewritten after every rerun when set: .json for JSON, anything else for Prometheus text
+    "metrics_file": None,
+}
+
+
+def _read_toml(path):
+    try:
+        if tomllib is not None:
+            with open(path, "rb") as f:
+                return tomllib.load(f)
+        return toml.load(path)
+    except FileNotFoundError:
+        return {}
+
+def _coerce(value, default):
+    if isinstance(default, bool):
+        return value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    if isinstance(default, list):
+        if isinstance(value, str):
+            value = value.split(",")
+        return [str(v).strip() for v in value if str(v).strip()]
+    return str(value) if value not in (None, "") else None
+
+def load_config(path=Path(".streamlit") / "config.toml"):
+    file_settings = _read_toml(path).get(SECTION, {})
+    unknown = set(file_settings) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown [{SECTION}] settings in {path}: {', '.join(sorted(unknown))}")
+    config = {}
+    for key, default in DEFAULTS.items():
+        value = os.getenv(key.upper())
+        if value is None:
+            value = file_settings.get(key, default)
+        config[key] = _coerce(value, default)
+    return config
+
+@lru_cache(maxsize=None)
+def cached_config(path=Path(".streamlit") / "config.toml"):
+    """load_config() once per process, for modules that read settings outside the app."""
+    return load_config(path)
@@ -0,0 +1,196 @@
+"""
+Lab values straight from CSV exports, without turning the table back
+into text for the regex parser.
+
+Two layouts are recognised from the header row:
+
+* long - one row per result, with a test-name column and a value column
+  (and optionally unit and patient columns)
+* wide - one column per analyte, one row per patient or visit
+
+Headers and test names go through one lookup index built from the lab
+registry's names and aliases, so "Haemoglobin (g/dL)", "HB" and
+"Hemoglobin" all land on Hemoglobin. Values are pulled out with
+vectorized pandas operations, chunk by chunk, so a multi-megabyte export
+never has to fit in memory at once. As with parse_lab_values, the first
+value seen for an analyte wins, per patient.
+
+Values are kept per patient all the way through. extract_bytes turns a
+single patient's values into text for the rest of the pipeline and
+rejects exports with several patients, which no one upload's record can
+hold; ingest.py and watch_ingest.py read those here, one row or record
+per patient.
+"""
+import io
+import re
+
+import numpy as np
+import pandas as pd
+
+from lab_values import LAB_TESTS, UNITS
+
+CSV_CHUNK_ROWS = 50_000
+
+# Normalized header names for the long layout's columns
+TEST_HEADERS = {"test", "testname", "tests", "analyte", "parameter", "investigation", "component", "labtest",
+                "name", "description"}
+VALUE_HEADERS = {"value", "result", "results", "resultvalue", "observedvalue", "observation", "reading"}
+UNIT_HEADERS = {"unit", "units", "uom"}
+PATIENT_HEADERS = {"patientid", "patient", "patientno", "patientcode", "mrn", "mrno", "subjectid", "subject", "id",
+                   "uhid", "regno", "registrationno", "name", "patientname", "fullname"}
+
+_UNIT_SUFFIX = re.compile(
+    r"\s*(?:\(.*?\)|\[.*?\]|" + "|".join(re.escape(u) for u in sorted(UNITS, key=len, reverse=True)) + r")\s*$",
+    re.IGNORECASE,
+)
+_NUMBER = r"(-?\d+(?:\.\d+)?)"
+
+
+def _norm(name):
+    return re.sub(r"[\s_\-.:]+", "", str(name)).lower()
+
+def _build_index(tests=LAB_TESTS):
+    index = {}
+    for test in tests:
+        for alias in [test.name] + test.aliases:
+            index.setdefault(_norm(alias), test.name)
+    return index
+
+ANALYTE_INDEX = _build_index()
+INTEGER_ANALYTES = {test.name for test in LAB_TESTS if test.integer}
+
+
+def analyte_for(label):
+    """Canonical analyte for a header or test name, e.g. "Haemoglobin (g/dL)" -> "Hemoglobin"; else None."""
+    if not isinstance(label, str):
+        return None
+    key = _norm(label)
+    if key in ANALYTE_INDEX:
+        return ANALYTE_INDEX[key]
+    # "Glucose (mg/dL)", "Urea [mg/dL]", "TSH uIU/mL"
+    stripped = label
+    while True:
+        shorter = _UNIT_SUFFIX.sub("", stripped)
+        if shorter == stripped or not shorter:
+            break
+        stripped = shorter
+    return ANALYTE_INDEX.get(_norm(stripped))
+
+
+# --- Layout ---
+def detect_layout(columns):
+    """
+    {"layout": "long"|"wide", "patient": column or None, ...} for a header
+    row, or None when neither layout fits (the caller falls back to text).
+    """
+    by_norm = {}
+    for column in columns:
+        by_norm.setdefault(_norm(column), column)
+    patients = [by_norm[h] for h in by_norm if h in PATIENT_HEADERS]
+    # "Name" is the test column only when nothing else is ("Name,Value,Unit");
+    # next to a Test column it names the patient
+    test = next((by_norm[h] for h in by_norm if h in TEST_HEADERS and h != "name"), by_norm.get("name"))
+    value = next((by_norm[h] for h in by_norm if h in VALUE_HEADERS), None)
+    if test is not None and value is not None:
+        patient = next((column for column in patients if column != test), None)
+        unit = next((by_norm[h] for h in by_norm if h in UNIT_HEADERS), None)
+        return {"layout": "long", "patient": patient, "test": test, "value": value, "unit": unit}
+    patient = patients[0] if patients else None
+    analytes = {}
+    for column in columns:
+        name = analyte_for(column)
+        if name and name not in analytes.values() and column != patient:
+            analytes[column] = name
+    if analytes:
+        return {"layout": "wide", "patient": patient, "analytes": analytes}
+    return None
+
+
+# --- Values ---
+def to_values(column, analyte=None):
+    """
+    Numbers from a column of strings, NaN where there is none. Plain
+    numbers go through to_numeric; only cells like "110 mg/dL" or "<5"
+    pay for the regex. Integer analytes (BP) drop decimals, as in
+    parse_lab_values.
+    """
+    values = pd.to_numeric(column, errors="coerce")
+    messy = values.isna() & column.notna()
+    if messy.any():
+        values[messy] = pd.to_numeric(column[messy].astype(str).str.extract(_NUMBER, expand=False),
+                                      errors="coerce")
+    values = values.astype(float)
+    if analyte in INTEGER_ANALYTES:
+        values = np.trunc(values)
+    return values
+
+def _long_chunk(chunk, layout, patients):
+    names = chunk[layout["test"]]
+    # Map each distinct test name once, not every row
+    lookup = {label: analyte_for(label) for label in names.dropna().unique()}
+    frame = pd.DataFrame({
+        "patient": chunk[layout["patient"]] if layout["patient"] else "",
+        "analyte": names.map(lookup),
+        "value": to_values(chunk[layout["value"]]),
+    }).dropna(subset=["analyte", "value"])
+    for analyte in INTEGER_ANALYTES:
+        rows = frame["analyte"] == analyte
+        frame.loc[rows, "value"] = np.trunc(frame.loc[rows, "value"])
+    frame = frame.drop_duplicates(["patient", "analyte"], keep="first")
+    # tolist() hands back plain Python objects in one go; iterating the
+    # (possibly Arrow-backed) columns directly is several times slower
+    for patient, analyte, value in zip(frame["patient"].tolist(), frame["analyte"].tolist(),
+                                       frame["value"].tolist()):
+        patients.setdefault(patient, {}).setdefault(analyte, value)
+
+def _wide_chunk(chunk, layout, patients):
+    frame = pd.DataFrame({name: to_values(chunk[column], name) for column, name in layout["analytes"].items()})
+    frame["patient"] = chunk[layout["patient"]].to_numpy() if layout["patient"] else ""
+    # groupby().first() takes each column's first non-missing value
+    firsts = frame.groupby("patient", sort=False).first()
+    for patient, row in zip(firsts.index, firsts.to_dict("records")):
+        labs = patients.setdefault(patient, {})
+        for analyte, value in row.items():
+            if not np.isnan(value):
+                labs.setdefault(analyte, float(value))
+
+def read_csv_labs(data, chunksize=CSV_CHUNK_ROWS):
+    """
+    {patient: {analyte: value}} from CSV bytes, patients in order of first
+    appearance ("" when there is no patient column). Returns None when the
+    header matches neither layout.
+    """
+    reader = pd.read_csv(io.BytesIO(data), dtype=str, chunksize=chunksize, skipinitialspace=True)
+    patients = {}
+    layout = None
+    for chunk in reader:
+        if layout is None:
+            layout = detect_layout(list(chunk.columns))
+            if layout is None:
+                reader.close()
+                return None
+        if layout["patient"]:
+            chunk[layout["patient"]] = chunk[layout["patient"]].fillna("")
+        if layout["layout"] == "long":
+            _long_chunk(chunk, layout, patients)
+        else:
+            _wide_chunk(chunk, layout, patients)
+    return patients
+
+
+# --- Text for the rest of the pipeline ---
+# The first alias of each test reads back to it through parse_lab_values
+_TEXT_LABELS = {test.name: test.aliases[0] for test in LAB_TESTS}
+
+def _number_text(value):
+    # Fixed-point: the parser reads digits and a dot, not "1e-05"
+    return f"{value:.6f}".rstrip("0").rstrip(".")
+
+def labs_text(labs):
+    """
+    "Label: value" lines for one patient's {analyte: value}, which
+    parse_lab_values reads back exactly, for the raw-text view, caches
+    and jobs.
+    """
+    lines = [f"{_TEXT_LABELS.get(analyte, analyte)}: {_number_text(value)}" for analyte, value in labs.items()]
+    return "\n".join(lines) + "\n"
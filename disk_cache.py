@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+
+def content_key(data, **config):
+    """
+    Content-addressed cache key: SHA-256 of the raw bytes plus a
+    canonical JSON dump of whatever settings change the result.
+    """
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """
+    Size-bounded LRU cache of files on disk, keyed by hex digest.
+
+    Entries are plain files, so the cache survives restarts and is shared
+    by every session and process pointing at the same directory. Recency
+    is tracked through file mtimes (bumped on every hit); when the total
+    size goes over ``max_bytes`` the least recently used files are removed.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, suffix=".bin"):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key):
+        # Two-level fan-out keeps directory listings short
+        return self.directory / key[:2] / (key + self.suffix)
+
+    def get_path(self, key):
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except OSError:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return path
+
+    def get_bytes(self, key):
+        path = self.get_path(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            # Evicted by another process between utime and read
+            return None
+
+    def get_text(self, key):
+        data = self.get_bytes(key)
+        return None if data is None else data.decode("utf-8")
+
+    def put_bytes(self, key, data):
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self._commit(tmp_path, path)
+        return path
+
+    def put_text(self, key, text):
+        return self.put_bytes(key, text.encode("utf-8"))
+
+    def put_file(self, key, src_path):
+        """Move an already rendered file (e.g. audio) into the cache."""
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._commit(src_path, path)
+        return path
+
+    def _commit(self, src_path, path):
+        # os.replace is atomic, so readers never see a half-written entry
+        os.replace(src_path, path)
+        size = path.stat().st_size
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += size
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _entries(self):
+        for sub in self.directory.iterdir():
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub):
+                if entry.name.endswith(self.suffix):
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, st.st_mtime, st.st_size
+
+    def _scan_size(self):
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self):
+        """Drop least recently used entries until under 90% of max_bytes."""
+        with self._lock:
+            # Rescan: other processes may have added or removed entries
+            entries = sorted(self._entries(), key=lambda e: e[1])
+            total = sum(size for _, _, size in entries)
+            target = int(self.max_bytes * 0.9)
+            for path, _, size in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                self.evictions += 1
+            self._size = total
+
+    def clear(self):
+        with self._lock:
+            for path, _, _ in list(self._entries()):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self._size if self._size is not None else self._scan_size(),
+                "max_bytes": self.max_bytes,
+            }
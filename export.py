@@ -0,0 +1,324 @@
+"""
+Admin export of every user's records to CSV, JSONL or Parquet.
+
+Records are streamed from the store one at a time: SQLite through a
+cursor, patient_data.json with an incremental parser that decodes one
+record object at a time instead of loading the whole file. Each record
+becomes one flat row: the record fields, one lab_* column per analyte in
+the lab registry, and any other lab values as JSON in labs_other. Parquet
+is written in row groups of --row-group-size rows, so memory stays
+bounded however large the store is.
+
+    python export.py --output records.parquet
+    python export.py --output audit.csv --user alice@example.com --since 2025-01-01 --until 2025-07-01
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from config import cached_config
+from lab_values import LAB_TESTS
+from metrics import peak_rss_mb
+
+# Record field -> Python type, in output order
+RECORD_FIELDS = [
+    ("timestamp", str),
+    ("age", int),
+    ("sex", str),
+    ("weight", float),
+    ("height_cm", float),
+    ("glucose", float),
+    ("bmi", float),
+    ("systolic_bp", float),
+    ("diastolic_bp", float),
+    ("hemoglobin", float),
+    ("overall_health", str),
+]
+# "Total Cholesterol" -> "lab_total_cholesterol"
+LAB_COLUMNS = {test.name: "lab_" + re.sub(r"\W+", "_", test.name).lower() for test in LAB_TESTS}
+COLUMNS = (["user"] + [name for name, _ in RECORD_FIELDS] + list(LAB_COLUMNS.values())
+           + ["labs_other", "risk", "other"])
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".parquet": "parquet"}
+
+READ_CHUNK = 1 << 20
+
+
+# --- Flattening ---
+def _convert(value, type_):
+    if value is None:
+        return None
+    try:
+        return type_(value)
+    except (TypeError, ValueError):
+        return None
+
+def flatten(user, record):
+    """One output row for a stored record; unknown fields go to "other" as JSON."""
+    row = {"user": user}
+    for name, type_ in RECORD_FIELDS:
+        row[name] = _convert(record.get(name), type_)
+    labs = record.get("labs") if isinstance(record.get("labs"), dict) else {}
+    extra_labs = {}
+    for name, value in labs.items():
+        if name in LAB_COLUMNS:
+            row[LAB_COLUMNS[name]] = _convert(value, float)
+        else:
+            extra_labs[name] = value
+    for column in LAB_COLUMNS.values():
+        row.setdefault(column, None)
+    known = {name for name, _ in RECORD_FIELDS} | {"labs", "risk"}
+    other = {k: v for k, v in record.items() if k not in known}
+    row["labs_other"] = json.dumps(extra_labs) if extra_labs else None
+    row["risk"] = json.dumps(record["risk"]) if record.get("risk") is not None else None
+    row["other"] = json.dumps(other, default=str) if other else None
+    return row
+
+def _wanted(user, record, users, since, until):
+    if users and user not in users:
+        return False
+    if since or until:
+        stamp = record.get("timestamp")
+        if not isinstance(stamp, str):
+            return False  # profile rows have no timestamp
+        if (since and stamp < since) or (until and stamp >= until):
+            return False
+    return True
+
+
+# --- Sources ---
+class _JsonStream:
+    """Just enough of a pull parser for {"user": [record, ...], ...}."""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(READ_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop what has been consumed so the buffer stays about one chunk
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-space character (without consuming it), or "" at the end."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        ch = self.peek()
+        if ch not in chars:
+            raise ValueError(f"Expected one of {chars!r} in the store file, found {ch!r}")
+        self.pos += 1
+        return ch
+
+    def value(self):
+        """Decode one JSON value, reading more of the file until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self._fill():
+                    raise
+                continue
+            # A number could continue in the next chunk
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+def iter_json_records(data_file):
+    """(user, record) pairs from patient_data.json, one record in memory at a time."""
+    if not Path(data_file).exists():
+        return
+    with open(data_file, encoding="utf-8") as f:
+        stream = _JsonStream(f)
+        if stream.peek() == "":
+            return  # empty file, as load_json treats it
+        stream.expect("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            user = stream.value()
+            stream.expect(":")
+            stream.expect("[")
+            if stream.peek() == "]":
+                stream.expect("]")
+            else:
+                while True:
+                    yield user, stream.value()
+                    if stream.expect(",]") == "]":
+                        break
+            if stream.expect(",}") == "}":
+                return
+
+def iter_sqlite_records(db_path, users=None, since=None, until=None):
+    """(user, record) pairs straight off a cursor, filtered in SQL where possible."""
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        where, args = [], []
+        if users:
+            where.append(f"user IN ({', '.join('?' * len(users))})")
+            args += sorted(users)
+        if since:
+            where.append("timestamp >= ?")
+            args.append(since)
+        if until:
+            where.append("timestamp < ?")
+            args.append(until)
+        sql = "SELECT user, data FROM records"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        for user, data in conn.execute(sql + " ORDER BY id", args):
+            yield user, json.loads(data)
+    finally:
+        conn.close()
+
+
+# --- Sinks ---
+class CsvSink:
+    def __init__(self, output):
+        self.f = open(output, "w", encoding="utf-8", newline="")
+        self.writer = csv.DictWriter(self.f, fieldnames=COLUMNS)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.f.close()
+
+class JsonlSink:
+    def __init__(self, output):
+        self.f = open(output, "w", encoding="utf-8")
+
+    def write(self, row):
+        self.f.write(json.dumps(row) + "\n")
+
+    def close(self):
+        self.f.close()
+
+class ParquetSink:
+    """Rows are buffered only until a row group is full."""
+
+    def __init__(self, output, row_group_size=10_000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {str: pa.string(), int: pa.int64(), float: pa.float64()}
+        self.pa = pa
+        self.schema = pa.schema(
+            [("user", pa.string())]
+            + [(name, types[type_]) for name, type_ in RECORD_FIELDS]
+            + [(column, pa.float64()) for column in LAB_COLUMNS.values()]
+            + [("labs_other", pa.string()), ("risk", pa.string()), ("other", pa.string())]
+        )
+        self.writer = pq.ParquetWriter(output, self.schema)
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+# --- Driver ---
+def export(records, output, fmt, users=None, since=None, until=None, row_group_size=10_000, progress_every=0):
+    """
+    Write (user, record) pairs that pass the filters to ``output``. Returns
+    {"rows", "scanned", "seconds", "rows_per_s", "scanned_per_s", "peak_rss_mb"}.
+    """
+    output = Path(output)
+    tmp = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+    sink = {"csv": CsvSink, "jsonl": JsonlSink}[fmt](tmp) if fmt != "parquet" else ParquetSink(tmp, row_group_size)
+    stats = {"rows": 0, "scanned": 0}
+    start = time.perf_counter()
+    try:
+        for user, record in records:
+            stats["scanned"] += 1
+            if not isinstance(record, dict) or not _wanted(user, record, users, since, until):
+                continue
+            sink.write(flatten(user, record))
+            stats["rows"] += 1
+            if progress_every and stats["rows"] % progress_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"  {stats['rows']:,} rows, {stats['rows'] / elapsed:,.0f} rows/s, "
+                      f"peak RSS {peak_rss_mb() or 0:.0f} MB", file=sys.stderr)
+    except BaseException:
+        sink.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    sink.close()
+    # Only a finished export replaces the output
+    os.replace(tmp, output)
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_s"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    stats["scanned_per_s"] = stats["scanned"] / stats["seconds"] if stats["seconds"] else 0.0
+    stats["peak_rss_mb"] = peak_rss_mb()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", type=Path, required=True, help=".csv, .jsonl or .parquet")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())),
+                        help="output format (default: from the output's extension)")
+    parser.add_argument("--base-dir", type=Path, default=Path.cwd(), help="directory holding the store")
+    parser.add_argument("--backend", choices=["sqlite", "json"], help="default: the storage_backend setting")
+    parser.add_argument("--user", action="append", help="only this user (repeatable)")
+    parser.add_argument("--since", help="only records with timestamp >= this (ISO, e.g. 2025-01-01)")
+    parser.add_argument("--until", help="only records with timestamp < this")
+    parser.add_argument("--row-group-size", type=int, default=10_000, help="Parquet rows per row group")
+    parser.add_argument("--progress-every", type=int, default=100_000, help="report every N rows (0: never)")
+    args = parser.parse_args(argv)
+    config = cached_config()
+
+    fmt = args.format or FORMATS.get(args.output.suffix.lower())
+    if fmt is None:
+        parser.error("can't tell the format from the output name; pass --format")
+    users = set(args.user or ())
+    backend = args.backend or config["storage_backend"]
+    if backend == "sqlite":
+        db_path = Path(config["db_path"] or args.base_dir / "doctor_buddy.db")
+        if not db_path.exists():
+            parser.error(f"{db_path} not found")
+        records = iter_sqlite_records(db_path, users, args.since, args.until)
+    else:
+        records = iter_json_records(args.base_dir / "patient_data.json")
+
+    stats = export(records, args.output, fmt, users, args.since, args.until, args.row_group_size,
+                   args.progress_every)
+    print(f"Exported {stats['rows']:,} of {stats['scanned']:,} records to {args.output} in {stats['seconds']:.1f} s")
+    print(f"  {stats['rows_per_s']:,.0f} rows/s written, {stats['scanned_per_s']:,.0f} records/s read, "
+          f"peak RSS {stats['peak_rss_mb'] or 0:.0f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Long-lived extraction worker.
+
+Keeps tabula's JVM (through JPype) and, when tesserocr is installed, a
+tesseract engine resident, and serves extraction jobs over a local socket:
+
+    python extract_worker.py --address 127.0.0.1:6011
+
+The app routes to it with EXTRACT_MODE=worker and falls back to
+in-process extraction whenever the worker can't be reached.
+
+Jobs run on a fixed set of handler threads, each holding its own
+resident engine, so the engines started at warm-up serve every later job.
+
+Connections are authenticated with EXTRACT_WORKER_AUTHKEY. When it isn't
+set, the app and the worker share a random key kept in .worker_key
+(created 0600 in the working directory on first use), which only works
+on one machine, so binding to anything but loopback needs the variable.
+"""
+import argparse
+import ipaddress
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+import extraction
+from auth import stored_secret
+from config import cached_config
+
+CONFIG = cached_config()
+DEFAULT_ADDRESS = CONFIG["extract_worker_address"]
+KEY_FILE = ".worker_key"
+BACKLOG = 64
+# Limit on the connect probe, and on the wait for the job to arrive at the worker
+CONNECT_TIMEOUT = CONFIG["extract_worker_timeout"]
+# Limit on the wait for a job's text (queueing included) before the caller
+# gives up and extracts locally
+JOB_TIMEOUT = CONFIG["extract_worker_job_timeout"]
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def authkey():
+    """EXTRACT_WORKER_AUTHKEY, or the key in .worker_key shared by local processes."""
+    key = CONFIG["extract_worker_authkey"]
+    if key:
+        return key.encode()
+    return stored_secret(Path.cwd() / KEY_FILE)
+
+def is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+# --- Client side ---
+class WorkerUnavailable(ConnectionError):
+    pass
+
+def extract_via_worker(data, mime_type, address=DEFAULT_ADDRESS, **options):
+    """Send one job to the worker. Raises WorkerUnavailable if it is down."""
+    host, port = parse_address(address)
+    # Probe first so a dead worker costs one refused connect, not a hang
+    try:
+        socket.create_connection((host, port), timeout=CONNECT_TIMEOUT).close()
+        conn = Client((host, port), authkey=authkey())
+    except (OSError, EOFError, AuthenticationError) as e:
+        raise WorkerUnavailable(f"extract worker at {address} unreachable: {e}") from e
+    try:
+        conn.send({"data": data, "mime": mime_type, "options": options})
+        if not conn.poll(JOB_TIMEOUT):
+            raise WorkerUnavailable(f"extract worker at {address} took over {JOB_TIMEOUT:g}s")
+        reply = conn.recv()
+    except (OSError, EOFError) as e:
+        raise WorkerUnavailable(f"extract worker at {address} dropped the job: {e}") from e
+    finally:
+        conn.close()
+    if not reply["ok"]:
+        raise RuntimeError(reply["error"])
+    return reply["text"]
+
+def extract_via_worker_or_local(data, mime_type, address=DEFAULT_ADDRESS, **options):
+    try:
+        return extract_via_worker(data, mime_type, address=address, **options)
+    except WorkerUnavailable as e:
+        print(f"⚠️ {e}; extracting in-process")
+        return extraction.extract_bytes(data, mime_type, **options)
+
+
+# --- Server side ---
+def _blank_pdf():
+    """Smallest valid one-page PDF, used to start the JVM ahead of the first job."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] >>",
+    ]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for n, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % n + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+def _start_engine(ready):
+    # Every handler waits here until all have arrived, so each runs one of these
+    ready.wait()
+    try:
+        return extraction.start_resident_tesseract()
+    except Exception as e:
+        print(f"⚠️ tesseract warm-up failed on {threading.current_thread().name}: {e}")
+        return False
+
+def warm_up(handlers, jobs):
+    """Start the JVM, then a tesseract engine on each of the ``jobs`` handler threads."""
+    resident = extraction.use_resident_tesseract()
+    try:
+        extraction._read_tables(_blank_pdf(), "all")
+    except Exception as e:
+        print(f"⚠️ tabula warm-up failed: {e}")
+    ready = threading.Barrier(jobs)
+    started = sum(f.result() for f in [handlers.submit(_start_engine, ready) for _ in range(jobs)])
+    if resident:
+        print(f"Worker warm (resident tesseract on {started} of {jobs} handler threads)")
+    else:
+        print("Worker warm (resident tesseract: no, tesserocr not installed)")
+
+def _handle(conn):
+    try:
+        if not conn.poll(CONNECT_TIMEOUT):
+            return
+        job = conn.recv()
+        try:
+            text = extraction.extract_bytes(job["data"], job["mime"], **job["options"])
+            reply = {"ok": True, "text": text}
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        conn.send(reply)
+    except (OSError, EOFError):
+        pass
+    finally:
+        conn.close()
+
+def serve(address=DEFAULT_ADDRESS, jobs=2):
+    host, port = parse_address(address)
+    if not is_loopback(host) and not CONFIG["extract_worker_authkey"]:
+        raise ValueError(f"Refusing to listen on {host} without EXTRACT_WORKER_AUTHKEY; "
+                         "set it to the same random key for the worker and the app")
+    # Extraction stays in-process so the JVM started by JPype is reused
+    extraction.TABULA_FORCE_SUBPROCESS = False
+    # Long-lived handler threads: the resident engines are per thread
+    handlers = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="extract-handler")
+    warm_up(handlers, jobs)
+    # Listener's default backlog of 1 drops connects from concurrent sessions
+    with handlers, Listener((host, port), backlog=BACKLOG, authkey=authkey()) as listener:
+        print(f"Extract worker listening on {address} ({jobs} concurrent jobs)")
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                # Bad authkey or a probe that disconnected straight away
+                continue
+            handlers.submit(_handle, conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm extraction worker for Doctor Buddy")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="host:port to listen on")
+    parser.add_argument("--jobs", type=int, default=2, help="jobs extracted at the same time")
+    parser.add_argument("--tesseract-cmd", default=CONFIG["tesseract_cmd"])
+    args = parser.parse_args()
+    if args.tesseract_cmd:
+        extraction.pytesseract.pytesseract.tesseract_cmd = args.tesseract_cmd
+    try:
+        serve(args.address, args.jobs)
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,573 @@
+import io
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_path
+import pandas as pd
+import tabula
+from PIL import Image
+import pytesseract
+
+from csv_labs import labs_text, read_csv_labs
+from lab_values import LabCollector
+from metrics import count, timed, track_rss
+from preprocess import downscale, finish, prepare, settings
+
+try:
+    # Optional: keeps a tesseract engine resident instead of forking per image
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+DEFAULT_OCR_CONFIG = "--psm 6 -l eng"
+DEFAULT_IMAGE_OCR_CONFIG = "--psm 6"
+DEFAULT_DPI = 200  # pdf2image default
+# Pages whose text layer has fewer visible characters than this are
+# treated as scans (or as table-only pages when there is some text)
+MIN_TEXT_LAYER_CHARS = 20
+
+# Which stage produced a page's text
+TIER_TEXT = "text"
+TIER_TABLE = "table"
+TIER_OCR = "ocr"
+TIER_FAILED = "failed"
+
+# Which way a whole PDF went, for metrics: the deepest fallback any page hit
+BRANCH_TEXT = "text_layer"
+BRANCH_TABULA = "tabula_ok"
+BRANCH_OCR = "tabula_failed_ocr"  # also pages with no text layer, which skip tabula
+BRANCH_FAILED = "ocr_failed"
+
+# tabula-py reuses an in-process JVM through JPype when it is installed;
+# forcing a subprocess means a fresh JVM per call (the cold path)
+TABULA_FORCE_SUBPROCESS = False
+
+IMAGE_TYPES = ["image/jpeg", "image/png"]
+PDF_TYPE = "application/pdf"
+CSV_TYPE = "text/csv"
+# Same types the app's file uploader accepts
+MIME_TYPES = {
+    ".pdf": PDF_TYPE,
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".csv": CSV_TYPE,
+}
+
+_pools = {}
+_pool_lock = threading.Lock()
+_resident = threading.local()
+_use_resident_engine = False
+
+
+# --- OCR engine ---
+def use_resident_tesseract(enabled=True):
+    """
+    Route OCR through a resident tesserocr engine (one per thread) instead
+    of forking the tesseract binary per image. Returns whether it took
+    effect, which needs tesserocr installed.
+    """
+    global _use_resident_engine
+    _use_resident_engine = bool(enabled and tesserocr is not None)
+    return _use_resident_engine
+
+def _parse_tess_config(config):
+    args = config.split()
+    psm, lang = 3, "eng"
+    for flag, value in zip(args, args[1:]):
+        if flag == "--psm":
+            psm = int(value)
+        elif flag == "-l":
+            lang = value
+    return lang, psm
+
+def _resident_api(config):
+    lang, psm = _parse_tess_config(config)
+    apis = getattr(_resident, "apis", None)
+    if apis is None:
+        apis = _resident.apis = {}
+    api = apis.get(lang)
+    if api is None:
+        api = apis[lang] = tesserocr.PyTessBaseAPI(lang=lang)
+    api.SetPageSegMode(psm)
+    return api
+
+def start_resident_tesseract(config=DEFAULT_OCR_CONFIG):
+    """Start the calling thread's resident engine ahead of its first page, if in use."""
+    if not _use_resident_engine:
+        return False
+    _resident_api(config)
+    return True
+
+def ocr_image(img, config=DEFAULT_IMAGE_OCR_CONFIG):
+    if _use_resident_engine:
+        api = _resident_api(config)
+        api.SetImage(img)
+        return api.GetUTF8Text()
+    return pytesseract.image_to_string(img, config=config)
+
+def _data_text(data):
+    """Rebuild page text from image_to_data words: one line per tesseract line."""
+    lines, current, last_block = [], None, None
+    for i, word in enumerate(data["text"]):
+        if not word.strip():
+            continue
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if key != current:
+            if last_block is not None and key[0] != last_block:
+                lines.append("")
+            lines.append(word)
+            current, last_block = key, key[0]
+        else:
+            lines[-1] += " " + word
+    return "\n".join(lines) + "\n" if lines else ""
+
+def ocr_image_with_confidence(img, config=DEFAULT_IMAGE_OCR_CONFIG):
+    """(text, mean word confidence 0-100) from one tesseract pass."""
+    if _use_resident_engine:
+        api = _resident_api(config)
+        api.SetImage(img)
+        return api.GetUTF8Text(), api.MeanTextConf()
+    data = pytesseract.image_to_data(img, config=config, output_type=pytesseract.Output.DICT)
+    confs = [float(c) for c, word in zip(data["conf"], data["text"]) if word.strip() and float(c) >= 0]
+    return _data_text(data), sum(confs) / len(confs) if confs else 0.0
+
+def ocr_page(img, config=DEFAULT_IMAGE_OCR_CONFIG, preprocess=None, source_dpi=None):
+    """
+    OCR one page image. With ``preprocess`` settings (see preprocess.py)
+    the page is cleaned up first, and in adaptive mode read at low_dpi;
+    only pages whose confidence falls below min_conf are read again at
+    full resolution.
+    """
+    if preprocess is None:
+        return ocr_image(img, config)
+    opts = settings(preprocess)
+    with timed("preprocess"):
+        page, dpi = prepare(img, opts, source_dpi)
+    if not opts["adaptive"] or dpi <= opts["low_dpi"]:
+        return ocr_image(finish(page, opts), config)
+    low, _ = downscale(page, dpi, opts["low_dpi"])
+    text, confidence = ocr_image_with_confidence(finish(low, opts), config)
+    if confidence >= opts["min_conf"]:
+        count("ocr_adaptive", outcome="low_dpi")
+        return text
+    count("ocr_adaptive", outcome="reocr")
+    return ocr_image(finish(page, opts), config)
+
+
+# --- OCR workers ---
+def _init_ocr_worker(tesseract_cmd, resident=False):
+    # Spawned workers don't inherit the parent's pytesseract setting
+    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    # One page per core already; stop tesseract's OpenMP from oversubscribing
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    use_resident_tesseract(resident)
+
+def _ocr_page_file(path, config, preprocess=None, dpi=None):
+    with Image.open(path) as img:
+        return ocr_page(img, config, preprocess, dpi)
+
+def _pool_context():
+    # Forking the app would copy its threads (Streamlit's server, job and
+    # bcrypt workers) mid-flight, locks included; start workers clean instead
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def get_ocr_pool(workers):
+    """Process pool shared by every session, one per worker count."""
+    with _pool_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=_pool_context(),
+                initializer=_init_ocr_worker,
+                initargs=(pytesseract.pytesseract.tesseract_cmd, _use_resident_engine),
+            )
+            _pools[workers] = pool
+        return pool
+
+def _page_runs(page_numbers):
+    """Group sorted 1-based page numbers into (first, last) runs."""
+    runs = []
+    for n in sorted(page_numbers):
+        if runs and runs[-1][1] == n - 1:
+            runs[-1][1] = n
+        else:
+            runs.append([n, n])
+    return [tuple(run) for run in runs]
+
+def ocr_pdf_pages(pdf_bytes, poppler_path=None, dpi=DEFAULT_DPI, config=DEFAULT_OCR_CONFIG, workers=1,
+                  pages=None, progress=None, preprocess=None):
+    """
+    Rasterize a PDF and OCR its pages, returning one string per page in
+    page order. ``pages`` limits the work to those 1-based page numbers.
+    With workers > 1 pages are OCRed on a process pool and rasterized with
+    pdf2image's thread_count.
+    Pages go through temporary files so only paths cross process boundaries.
+    ``progress(done, total)`` is called after each page is OCRed.
+    ``preprocess`` settings are applied to each page (see ocr_page).
+    """
+    workers = max(1, int(workers))
+    runs = _page_runs(pages) if pages is not None else [(None, None)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        with timed("rasterize", bytes=len(pdf_bytes)) as call:
+            for first, last in runs:
+                paths += convert_from_bytes(
+                    pdf_bytes,
+                    dpi=dpi,
+                    poppler_path=poppler_path,
+                    first_page=first,
+                    last_page=last,
+                    output_folder=tmp_dir,
+                    paths_only=True,
+                    thread_count=workers,
+                    # Colour never helps OCR; skip it at the source
+                    grayscale=preprocess is not None and settings(preprocess)["grayscale"],
+                )
+            call["pages"] = len(paths)
+        with timed("ocr", pages=len(paths)):
+            if workers == 1 or len(paths) == 1:
+                texts = (_ocr_page_file(path, config, preprocess, dpi) for path in paths)
+            else:
+                pool = get_ocr_pool(workers)
+                # map() yields results in submission order, which keeps page order
+                n = len(paths)
+                texts = pool.map(_ocr_page_file, paths, [config] * n, [preprocess] * n, [dpi] * n)
+            results = []
+            for text in texts:
+                results.append(text)
+                if progress:
+                    progress(len(results), len(paths))
+            return results
+
+
+# --- PDF extraction ---
+def _poppler_tool(name, poppler_path=None):
+    return os.path.join(poppler_path, name) if poppler_path else name
+
+def read_text_layer(pdf_bytes, poppler_path=None):
+    """
+    Embedded text of every page via Poppler's pdftotext (same install as
+    pdf2image), one string per page. The PDF is piped through stdin.
+    """
+    with timed("pdftotext", bytes=len(pdf_bytes)) as call:
+        result = subprocess.run(
+            [_poppler_tool("pdftotext", poppler_path), "-layout", "-enc", "UTF-8", "-", "-"],
+            input=pdf_bytes,
+            capture_output=True,
+            check=True,
+        )
+        # pdftotext ends every page with a form feed
+        pages = result.stdout.decode("utf-8", errors="replace").split("\f")[:-1]
+        call["pages"] = len(pages)
+    return pages
+
+def _visible_chars(text):
+    return sum(1 for c in text if not c.isspace())
+
+def _read_tables(pdf_bytes, pages, lattice=True):
+    with timed("tabula", bytes=len(pdf_bytes), pages=pages if isinstance(pages, int) else None) as call:
+        dfs = tabula.read_pdf(io.BytesIO(pdf_bytes), pages=pages, multiple_tables=True, lattice=lattice,
+                              force_subprocess=TABULA_FORCE_SUBPROCESS)
+        call["tables"] = sum(1 for df in dfs if not df.empty)
+    return "".join(df.to_csv(index=False) + "\n" for df in dfs if not df.empty)
+
+def _read_tables_by_page(pdf_bytes, pages, lattice=True):
+    """
+    {page number: table text} for ``pages`` (a list, or "all") from a
+    single tabula call, so the JVM starts and parses the PDF once however
+    many pages need it. Pages without tables are left out.
+    """
+    with timed("tabula", bytes=len(pdf_bytes), pages=len(pages) if isinstance(pages, list) else None) as call:
+        # JSON output keeps each table's page_number; DataFrames don't
+        tables = tabula.read_pdf(io.BytesIO(pdf_bytes), pages=pages, multiple_tables=True, lattice=lattice,
+                                 output_format="json", force_subprocess=TABULA_FORCE_SUBPROCESS)
+        texts = {}
+        for table in tables:
+            text = _json_table_text(table)
+            if text:
+                n = table.get("page_number")
+                texts[n] = texts.get(n, "") + text
+        call["tables"] = len(tables)
+    return texts
+
+def _json_table_text(table):
+    """
+    One table from tabula's JSON output as CSV text, shaped like
+    _read_tables' DataFrame output: first row as the header, "" for a
+    table with no rows under it. Cells keep their printed text ("110",
+    where read_pdf's numeric columns would give "110.0").
+    """
+    rows = [[cell.get("text", "") for cell in row] for row in table.get("data", [])]
+    if len(rows) < 2:
+        return ""
+    width = max(len(row) for row in rows)
+    rows = [row + [""] * (width - len(row)) for row in rows]
+    return pd.DataFrame(rows[1:], columns=rows[0]).to_csv(index=False) + "\n"
+
+def extract_pdf_pages(pdf_bytes, poppler_path=None, dpi=DEFAULT_DPI, ocr_config=DEFAULT_OCR_CONFIG,
+                      lattice=True, ocr_workers=1, progress=None, preprocess=None):
+    """
+    Tiered PDF extraction, cheapest stage first:
+
+    1. ``text``  - embedded text layer (born-digital reports)
+    2. ``table`` - tabula, only for pages with a too-sparse text layer
+    3. ``ocr``   - tesseract, only for pages tabula or the text layer missed
+
+    Returns a list of ``{"page", "tier", "text"}`` dicts in page order.
+    Pages that could not be read at all get tier ``failed``.
+    ``progress(done, total)`` reports pages finished so far.
+    """
+    try:
+        layer = read_text_layer(pdf_bytes, poppler_path)
+    except Exception as e:
+        print(f"⚠️ Text layer unavailable, falling back to tables/OCR: {e}")
+        pages = _extract_pages_without_layer(pdf_bytes, poppler_path, dpi, ocr_config, lattice, ocr_workers,
+                                             progress, preprocess)
+        _count_branch(pages)
+        return pages
+
+    pages = [{"page": n, "tier": TIER_FAILED, "text": ""} for n in range(1, len(layer) + 1)]
+    sparse = []
+    for page, page_text in zip(pages, layer):
+        chars = _visible_chars(page_text)
+        if chars >= MIN_TEXT_LAYER_CHARS:
+            page.update(tier=TIER_TEXT, text=page_text)
+        elif chars:
+            sparse.append(page)
+
+    if sparse:
+        try:
+            tables = _read_tables_by_page(pdf_bytes, [page["page"] for page in sparse], lattice)
+        except Exception:
+            tables = {}
+        for page in sparse:
+            if tables.get(page["page"]):
+                page.update(tier=TIER_TABLE, text=tables[page["page"]])
+
+    if progress:
+        progress(sum(1 for page in pages if page["tier"] != TIER_FAILED), len(pages))
+    _ocr_missing_pages(pdf_bytes, pages, poppler_path, dpi, ocr_config, ocr_workers, progress, preprocess)
+    _count_branch(pages)
+    return pages
+
+def _count_branch(pages):
+    tiers = [page["tier"] for page in pages]
+    for tier in set(tiers):
+        count("pdf_pages", tiers.count(tier), tier=tier)
+    if TIER_FAILED in tiers:
+        branch = BRANCH_FAILED
+    elif TIER_OCR in tiers:
+        branch = BRANCH_OCR
+    elif TIER_TABLE in tiers:
+        branch = BRANCH_TABULA
+    else:
+        branch = BRANCH_TEXT
+    count("pdf_branch", branch=branch)
+
+def _extract_pages_without_layer(pdf_bytes, poppler_path, dpi, ocr_config, lattice, ocr_workers, progress=None,
+                                 preprocess=None):
+    # No pdftotext: the original behaviour, tabula on the whole file, then OCR
+    try:
+        table_text = _read_tables(pdf_bytes, "all", lattice)
+    except Exception:
+        table_text = ""
+    if table_text:
+        return [{"page": None, "tier": TIER_TABLE, "text": table_text}]
+    try:
+        texts = ocr_pdf_pages(pdf_bytes, poppler_path=poppler_path, dpi=dpi, config=ocr_config, workers=ocr_workers,
+                              progress=progress, preprocess=preprocess)
+    except Exception as ocr_e:
+        print(f"❌ OCR failed: {ocr_e}")
+        return [{"page": None, "tier": TIER_FAILED, "text": ""}]
+    return [{"page": n, "tier": TIER_OCR, "text": t} for n, t in enumerate(texts, start=1)]
+
+def _ocr_missing_pages(pdf_bytes, pages, poppler_path, dpi, ocr_config, ocr_workers, progress=None,
+                       preprocess=None):
+    missing = [page for page in pages if page["tier"] == TIER_FAILED]
+    if not missing:
+        return
+    on_page = None
+    if progress:
+        # OCR only sees the missing pages; report against the whole document
+        done = len(pages) - len(missing)
+        def on_page(n, _):
+            progress(done + n, len(pages))
+    try:
+        texts = ocr_pdf_pages(pdf_bytes, poppler_path=poppler_path, dpi=dpi, config=ocr_config,
+                              workers=ocr_workers, pages=[page["page"] for page in missing], progress=on_page,
+                              preprocess=preprocess)
+    except Exception as ocr_e:
+        print(f"❌ OCR failed: {ocr_e}")
+        return
+    for page, page_text in zip(missing, texts):
+        page.update(tier=TIER_OCR, text=page_text)
+
+def extract_text_from_pdf(pdf_bytes, poppler_path=None, dpi=DEFAULT_DPI, ocr_config=DEFAULT_OCR_CONFIG,
+                          lattice=True, ocr_workers=1, progress=None, preprocess=None):
+    pages = extract_pdf_pages(pdf_bytes, poppler_path=poppler_path, dpi=dpi, ocr_config=ocr_config,
+                              lattice=lattice, ocr_workers=ocr_workers, progress=progress, preprocess=preprocess)
+    return "".join(page["text"] + "\n" for page in pages)
+
+
+# --- Streaming extraction ---
+def _ocr_single_page(pdf_path, n, tmp_dir, poppler_path, dpi, config, preprocess):
+    # One page image on disk at a time, deleted as soon as it is read
+    with timed("rasterize", pages=1):
+        paths = convert_from_path(
+            pdf_path, dpi=dpi, poppler_path=poppler_path, first_page=n, last_page=n,
+            output_folder=tmp_dir, paths_only=True,
+            grayscale=preprocess is not None and settings(preprocess)["grayscale"],
+        )
+    try:
+        with timed("ocr", pages=1):
+            return "".join(_ocr_page_file(path, config, preprocess, dpi) for path in paths)
+    finally:
+        for path in paths:
+            os.remove(path)
+
+def iter_pdf_pages(pdf_bytes, poppler_path=None, dpi=DEFAULT_DPI, ocr_config=DEFAULT_OCR_CONFIG, lattice=True,
+                   preprocess=None):
+    """
+    extract_pdf_pages one page at a time: the same tiers, but each page is
+    rasterized and OCRed only when the caller asks for it, so stopping
+    early skips the remaining pages' work and at most one page image
+    exists at once. Yields ``{"page", "pages", "tier", "text"}`` dicts
+    in page order, ``pages`` being the document's page count.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, "input.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+        try:
+            layer = read_text_layer(pdf_bytes, poppler_path)
+            total = len(layer)
+        except Exception as e:
+            print(f"⚠️ Text layer unavailable, falling back to tables/OCR: {e}")
+            layer = None
+            total = pdfinfo_from_path(pdf_path, poppler_path=poppler_path)["Pages"]
+        chars = [_visible_chars(text) for text in layer] if layer else [0] * total
+        # Pages tabula should look at: sparse text layer, or every page without one
+        sparse = [n for n in range(1, total + 1) if layer is None or 0 < chars[n - 1] < MIN_TEXT_LAYER_CHARS]
+        tables = None  # read for all of them in one call, when the first is reached
+        for n in range(1, total + 1):
+            page = {"page": n, "pages": total, "tier": TIER_FAILED, "text": ""}
+            if chars[n - 1] >= MIN_TEXT_LAYER_CHARS:
+                page.update(tier=TIER_TEXT, text=layer[n - 1])
+            elif n in sparse:
+                if tables is None:
+                    try:
+                        tables = _read_tables_by_page(pdf_bytes, [m for m in sparse if m >= n], lattice)
+                    except Exception:
+                        tables = {}
+                if tables.get(n):
+                    page.update(tier=TIER_TABLE, text=tables[n])
+            if page["tier"] == TIER_FAILED:
+                try:
+                    page.update(tier=TIER_OCR, text=_ocr_single_page(pdf_path, n, tmp_dir, poppler_path, dpi,
+                                                                      ocr_config, preprocess))
+                except Exception as ocr_e:
+                    print(f"❌ OCR failed on page {n}: {ocr_e}")
+            yield page
+
+def stream_lab_values(data, mime_type, targets=None, max_pages=None, max_seconds=None, progress=None,
+                      poppler_path=None, dpi=DEFAULT_DPI, pdf_ocr_config=DEFAULT_OCR_CONFIG,
+                      image_ocr_config=DEFAULT_IMAGE_OCR_CONFIG, lattice=True, ocr_workers=1, preprocess=None):
+    """
+    Extract and parse a PDF page by page, stopping as soon as every
+    analyte in ``targets`` has a value, ``max_pages`` pages are done or
+    ``max_seconds`` have passed (checked between pages). Other file types
+    are a single extract_bytes call.
+
+    Returns ``(text, labs, report)``: the text read so far, the parsed
+    values, and ``{"pages", "total_pages", "stopped", "missing",
+    "seconds", "peak_rss_mb"}`` where ``stopped`` is "targets",
+    "max_pages", "max_seconds" or None (read to the end), and
+    ``peak_rss_mb`` is this process's highest RSS sampled during the call.
+    Pages are done one after another, so ``ocr_workers`` is ignored.
+    """
+    start = time.perf_counter()
+    collector = LabCollector(targets)
+    texts, done, total, stopped = [], [], 1, None
+    with track_rss() as rss:
+        if mime_type != PDF_TYPE:
+            texts.append(extract_bytes(data, mime_type, poppler_path=poppler_path, image_ocr_config=image_ocr_config,
+                                       preprocess=preprocess))
+            collector.feed(texts[-1])
+        else:
+            with timed("extract", mime=mime_type, bytes=len(data), mode="stream") as call:
+                pages = iter_pdf_pages(data, poppler_path=poppler_path, dpi=dpi, ocr_config=pdf_ocr_config,
+                                       lattice=lattice, preprocess=preprocess)
+                try:
+                    for page in pages:
+                        total = page["pages"]
+                        texts.append(page.pop("text"))
+                        done.append(page)
+                        collector.feed(texts[-1])
+                        if progress:
+                            progress(len(done), total)
+                        if len(done) < total:
+                            if collector.complete:
+                                stopped = "targets"
+                            elif max_pages and len(done) >= max_pages:
+                                stopped = "max_pages"
+                            elif max_seconds and time.perf_counter() - start >= max_seconds:
+                                stopped = "max_seconds"
+                        if stopped:
+                            break
+                finally:
+                    pages.close()  # removes the temporary files
+                call["pages"] = len(done)
+            _count_branch(done)
+            if stopped:
+                count("early_stop", reason=stopped)
+                count("pdf_pages_skipped", total - len(done))
+    report = {
+        "pages": len(texts),
+        "total_pages": total,
+        "stopped": stopped,
+        "missing": collector.missing,
+        "seconds": time.perf_counter() - start,
+        "peak_rss_mb": rss["peak_mb"],
+    }
+    return "".join(text + "\n" for text in texts), collector.values, report
+
+
+# --- Any upload ---
+def extract_bytes(data, mime_type, poppler_path=None, dpi=DEFAULT_DPI, pdf_ocr_config=DEFAULT_OCR_CONFIG,
+                  image_ocr_config=DEFAULT_IMAGE_OCR_CONFIG, lattice=True, ocr_workers=1, progress=None,
+                  preprocess=None):
+    """
+    Text of an uploaded PDF, image or CSV given its raw bytes.
+    Raises on unreadable input; unsupported types give an empty string.
+    CSV lab tables come back as "Label: value" lines (see csv_labs); a
+    table with several patients' results raises ValueError.
+    ``progress(done, total)`` reports PDF pages as they finish.
+    ``preprocess`` enables OCR image cleanup (a dict, see preprocess.py).
+    """
+    with timed("extract", mime=mime_type, bytes=len(data)):
+        if mime_type in IMAGE_TYPES:
+            with Image.open(io.BytesIO(data)) as img, timed("ocr", pages=1):
+                return ocr_page(img, image_ocr_config, preprocess)
+        if mime_type == PDF_TYPE:
+            return extract_text_from_pdf(data, poppler_path=poppler_path, dpi=dpi, ocr_config=pdf_ocr_config,
+                                         lattice=lattice, ocr_workers=ocr_workers, progress=progress,
+                                         preprocess=preprocess)
+        if mime_type == CSV_TYPE:
+            # Lab tables are read column-wise; anything else goes to the text parser as before
+            patients = read_csv_labs(data)
+            if patients and len(patients) > 1:
+                # One upload is one record: merging patients would mix their results
+                raise ValueError(f"This CSV has results for {len(patients)} patients; "
+                                 "upload one patient's report at a time")
+            if patients:
+                return labs_text(next(iter(patients.values())))
+            return pd.read_csv(io.BytesIO(data)).to_csv(index=False)
+        return ""
@@ -0,0 +1,260 @@
+"""
+Per-user record history as Parquet, for the "Your Past Records" table and
+its export.
+
+The record store stays the source of truth; each user's history is a
+columnar mirror of store.records(user) kept in a directory of Parquet
+segments plus a small manifest. New records are appended as a segment,
+segments are compacted once there are too many, and a changed profile
+(or any other edit the row count can't explain) rebuilds the mirror.
+Display reads one page of rows and only the requested columns; export
+streams the segments to CSV or Parquet batch by batch, into an exports
+directory next to the mirror rather than the shared temp directory.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+# Record fields stored as typed columns; labs and risk are JSON text, and
+# anything unexpected lands in "other" so nothing is lost
+SCALAR_FIELDS = {
+    "timestamp": (pa.string(), str),
+    "age": (pa.int64(), int),
+    "sex": (pa.string(), str),
+    "weight": (pa.float64(), float),
+    "height_cm": (pa.float64(), float),
+    "glucose": (pa.float64(), float),
+    "bmi": (pa.float64(), float),
+    "systolic_bp": (pa.float64(), float),
+    "diastolic_bp": (pa.float64(), float),
+    "hemoglobin": (pa.float64(), float),
+}
+SCHEMA = pa.schema(
+    [(name, type_) for name, (type_, _) in SCALAR_FIELDS.items()]
+    + [("labs", pa.string()), ("overall_health", pa.string()), ("risk", pa.string()), ("other", pa.string())]
+)
+# Same column order as the records themselves
+COLUMNS = [
+    "timestamp", "age", "sex", "weight", "height_cm", "glucose", "bmi", "systolic_bp", "diastolic_bp",
+    "hemoglobin", "labs", "overall_health", "risk", "other",
+]
+
+ROW_GROUP_SIZE = 1000
+EXPORT_BATCH_ROWS = 5000
+# Exports left behind (a crash, a session that went away) are deleted after this
+EXPORT_MAX_AGE = 15 * 60
+MAX_SEGMENTS = 16
+
+
+def _row(record):
+    row, other = {}, {}
+    for key, value in record.items():
+        if key in SCALAR_FIELDS:
+            try:
+                row[key] = None if value is None else SCALAR_FIELDS[key][1](value)
+            except (TypeError, ValueError):
+                other[key] = value
+        elif key in ("labs", "risk"):
+            row[key] = json.dumps(value)
+        elif key == "overall_health":
+            row[key] = None if value is None else str(value)
+        else:
+            other[key] = value
+    row["other"] = json.dumps(other, default=str) if other else None
+    return row
+
+def records_table(records):
+    return pa.Table.from_pylist([_row(record) for record in records], schema=SCHEMA)
+
+def _fingerprint(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class HistoryStore:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._lock = threading.RLock()
+        self._manifests = {}  # user -> (stat signature, manifest)
+
+    def _user_dir(self, user):
+        return self.directory / hashlib.sha256(str(user).encode()).hexdigest()[:24]
+
+    # --- Manifest ---
+    def _manifest(self, user):
+        path = self._user_dir(user) / "manifest.json"
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return {"rows": 0, "profile": None, "segments": []}
+        signature = (st.st_mtime_ns, st.st_size)
+        cached = self._manifests.get(user)
+        if cached and cached[0] == signature:
+            return cached[1]
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        self._manifests[user] = (signature, manifest)
+        return manifest
+
+    def _save_manifest(self, user, manifest):
+        path = self._user_dir(user) / "manifest.json"
+        tmp = path.with_name(f".manifest.{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+        self._manifests.pop(user, None)
+
+    def _write_segment(self, user, table):
+        user_dir = self._user_dir(user)
+        user_dir.mkdir(parents=True, exist_ok=True)
+        name = f"seg-{uuid.uuid4().hex[:12]}.parquet"
+        tmp = user_dir / f".{name}.tmp"
+        pq.write_table(table, tmp, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp, user_dir / name)
+        return {"file": name, "rows": table.num_rows}
+
+    def _drop_segments(self, user, segments):
+        for segment in segments:
+            try:
+                (self._user_dir(user) / segment["file"]).unlink()
+            except FileNotFoundError:
+                pass
+
+    # --- Keeping in step with the store ---
+    def sync(self, user, store):
+        """
+        Bring the user's mirror up to date with the store and return the
+        manifest. Costs two cached store reads when nothing changed.
+        """
+        with self._lock:
+            manifest = self._manifest(user)
+            count = store.record_count(user)
+            profile = _fingerprint(store.profile(user)) if count else None
+            if manifest["rows"] == count and manifest["profile"] == profile:
+                return manifest
+            old = list(manifest["segments"])
+            if 0 < manifest["rows"] < count and manifest["profile"] == profile:
+                # Only new records at the end
+                segments = old + [self._write_segment(user, records_table(store.records_since(user, manifest["rows"])))]
+                old = []
+            elif count:
+                segments = [self._write_segment(user, records_table(store.records(user)))]
+            else:
+                segments = []
+            manifest = {"rows": count, "profile": profile, "segments": segments}
+            self._save_manifest(user, manifest)
+            self._drop_segments(user, old)
+            if len(segments) > MAX_SEGMENTS:
+                manifest = self.compact(user)
+            return manifest
+
+    def compact(self, user):
+        """Merge every segment into one, streaming row group by row group."""
+        with self._lock:
+            manifest = self._manifest(user)
+            old = manifest["segments"]
+            if len(old) <= 1:
+                return manifest
+            user_dir = self._user_dir(user)
+            name = f"seg-{uuid.uuid4().hex[:12]}.parquet"
+            tmp = user_dir / f".{name}.tmp"
+            with pq.ParquetWriter(tmp, SCHEMA) as writer:
+                for batch in self._batches(user, old, ROW_GROUP_SIZE):
+                    writer.write_table(pa.Table.from_batches([batch], schema=SCHEMA), row_group_size=ROW_GROUP_SIZE)
+            os.replace(tmp, user_dir / name)
+            manifest = dict(manifest, segments=[{"file": name, "rows": manifest["rows"]}])
+            self._save_manifest(user, manifest)
+            self._drop_segments(user, old)
+            return manifest
+
+    # --- Reading ---
+    def rows(self, user):
+        return self._manifest(user)["rows"]
+
+    def read(self, user, start, stop, columns=None):
+        """
+        Rows [start, stop) as a DataFrame with only ``columns``, reading
+        just the row groups that overlap the range. JSON columns are
+        decoded for display.
+        """
+        columns = [c for c in (columns or COLUMNS) if c in COLUMNS]
+        with self._lock:
+            tables = self._read_range(user, start, stop, columns)
+        if not tables:
+            return pd.DataFrame(columns=columns)
+        df = pa.concat_tables(tables).to_pandas()
+        for column in ("labs", "risk", "other"):
+            if column in df:
+                df[column] = df[column].map(lambda v: json.loads(v) if isinstance(v, str) else None)
+        return df
+
+    def _read_range(self, user, start, stop, columns):
+        tables = []
+        offset = 0
+        for segment in self._manifest(user)["segments"]:
+            seg_start, seg_stop = offset, offset + segment["rows"]
+            offset = seg_stop
+            if seg_stop <= start or seg_start >= stop:
+                continue
+            parquet = pq.ParquetFile(self._user_dir(user) / segment["file"])
+            groups, group_start, first_group_start = [], seg_start, None
+            for i in range(parquet.num_row_groups):
+                group_stop = group_start + parquet.metadata.row_group(i).num_rows
+                if group_stop > start and group_start < stop:
+                    groups.append(i)
+                    if first_group_start is None:
+                        first_group_start = group_start
+                group_start = group_stop
+            table = parquet.read_row_groups(groups, columns=columns)
+            lo = max(start, seg_start) - first_group_start
+            tables.append(table.slice(lo, min(stop, seg_stop) - max(start, seg_start)))
+        return tables
+
+    def _batches(self, user, segments, batch_size):
+        for segment in segments:
+            parquet = pq.ParquetFile(self._user_dir(user) / segment["file"])
+            yield from parquet.iter_batches(batch_size=batch_size)
+
+    def export(self, user, fmt="csv", columns=None):
+        """
+        Write the user's whole history to a .csv or .parquet file in
+        <directory>/exports, EXPORT_BATCH_ROWS rows at a time, and return
+        its path. The caller deletes it; sweep_exports() removes any that
+        are left behind.
+        """
+        columns = [c for c in (columns or COLUMNS) if c in COLUMNS]
+        schema = pa.schema([SCHEMA.field(c) for c in columns])
+        self.sweep_exports()
+        export_dir = self.directory / "exports"
+        export_dir.mkdir(parents=True, exist_ok=True)
+        # mkstemp creates it readable by this user only
+        fd, path = tempfile.mkstemp(suffix=f".{fmt}", prefix="history-", dir=export_dir)
+        os.close(fd)
+        writer = pa_csv.CSVWriter(path, schema) if fmt == "csv" else pq.ParquetWriter(path, schema)
+        try:
+            # Held throughout so compaction can't delete a segment mid-export
+            with self._lock:
+                for batch in self._batches(user, self._manifest(user)["segments"], EXPORT_BATCH_ROWS):
+                    writer.write_table(pa.Table.from_batches([batch]).select(columns))
+        finally:
+            writer.close()
+        return path
+
+    def sweep_exports(self, max_age=EXPORT_MAX_AGE):
+        """Delete export files older than ``max_age`` seconds."""
+        cutoff = time.time() - max_age
+        for path in (self.directory / "exports").glob("history-*"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except FileNotFoundError:
+                pass  # deleted by its session meanwhile
@@ -0,0 +1,364 @@
+"""
+Headless bulk ingestion of lab reports.
+
+Walks a directory of PDFs, images and CSVs, runs each file through the
+same extract_bytes -> parse_lab_values -> check_risks chain as the app,
+and streams one result per file to JSONL or Parquet as files finish. A
+CSV export holding several patients' results gives one row per patient,
+with its id in "patient":
+
+    python ingest.py /data/partner-dump --output results.jsonl --workers 8
+
+Files processed without error are listed in <output>.done, so rerunning
+the same command after an interruption skips them. Failed files get a
+"failed" row and are tried again on the next run; a later row for the
+same path supersedes it.
+
+With --early-stop, PDFs are read one page at a time and parsing stops once
+every analyte check_risks uses (or the ones named) has a value:
+
+    python ingest.py /data/partner-dump --output results.jsonl --early-stop --max-pages 10
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from csv_labs import read_csv_labs
+from extraction import CSV_TYPE, DEFAULT_DPI, MIME_TYPES, extract_bytes, stream_lab_values
+from lab_values import LAB_TESTS, parse_lab_values
+from metrics import track_rss
+from preprocess import DEFAULT_PREPROCESS
+from risk import check_risks
+
+STAGES = ["read", "extract", "parse", "risk"]
+
+# Analytes check_risks reads; --early-stop with no names waits for these
+RISK_ANALYTES = ["Glucose", "Hemoglobin", "Systolic_BP", "Diastolic_BP", "TSH", "ALT", "AST", "Creatinine", "Urea"]
+
+# Used where a report doesn't carry the value, same defaults as the app's inputs
+DEFAULT_VITALS = {
+    "glucose": 90.0,
+    "hemoglobin": 14.0,
+    "systolic_bp": 120.0,
+    "diastolic_bp": 80.0,
+    "weight": 70.0,
+    "height_cm": 170.0,
+    "age": 25,
+    "sex": "Male",
+}
+
+
+# --- Per-file work (runs in pool workers) ---
+def assess(labs, vitals=DEFAULT_VITALS):
+    """check_risks on parsed lab values, falling back to default vitals like main_app_ui."""
+    bmi = round(vitals["weight"] / ((vitals["height_cm"] / 100) ** 2), 2)
+    risk, doctors, advice, overall_health = check_risks(
+        glucose=float(labs.get("Glucose", vitals["glucose"])),
+        hb=float(labs.get("Hemoglobin", vitals["hemoglobin"])),
+        bmi=bmi,
+        systolic_bp=float(labs.get("Systolic_BP", vitals["systolic_bp"])),
+        diastolic_bp=float(labs.get("Diastolic_BP", vitals["diastolic_bp"])),
+        labs=labs,
+        age=vitals["age"],
+        sex=vitals["sex"],
+    )
+    return {"risk": risk, "doctors": sorted(doctors), "advice": advice, "overall_health": overall_health}
+
+def process_file(path, options, vitals=DEFAULT_VITALS, stream=None):
+    """
+    Extract, parse and score one report. Returns its rows: one, or one per
+    patient for a CSV lab table. Never raises: errors end up in the row.
+    ``stream`` (targets / max_pages / max_seconds) switches to page-by-page
+    extraction with early stopping; parsing then counts as extract time.
+    Every row of a file carries the file's timings.
+    """
+    timings = dict.fromkeys(STAGES, 0.0)
+    row = {"path": str(path), "patient": None, "status": "ok", "error": None, "labs": {}, "risk": [],
+           "doctors": [], "advice": [], "overall_health": None, "pages": None, "stopped": None}
+    rows = [row]
+    with track_rss() as rss:
+        try:
+            start = time.perf_counter()
+            data = Path(path).read_bytes()
+            timings["read"] = time.perf_counter() - start
+            row["bytes"] = len(data)
+            mime_type = MIME_TYPES[Path(path).suffix.lower()]
+
+            patients = None
+            if mime_type == CSV_TYPE:
+                # Lab tables are read column-wise, per patient; anything else
+                # goes through extract_bytes to the text parser
+                start = time.perf_counter()
+                patients = read_csv_labs(data)
+                timings["extract"] = time.perf_counter() - start
+            if patients:
+                del data
+                rows = [dict(row, patient=str(patient) or None, labs=labs) for patient, labs in patients.items()]
+            elif stream is not None:
+                start = time.perf_counter()
+                _, row["labs"], report = stream_lab_values(data, mime_type, **stream, **options)
+                timings["extract"] = time.perf_counter() - start
+                row["pages"], row["stopped"] = report["pages"], report["stopped"]
+                del data
+            else:
+                start = time.perf_counter()
+                text = extract_bytes(data, mime_type, **options)
+                timings["extract"] = time.perf_counter() - start
+                del data
+
+                start = time.perf_counter()
+                row["labs"] = parse_lab_values(text)
+                timings["parse"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for each in rows:
+                each.update(assess(each["labs"], vitals))
+            timings["risk"] = time.perf_counter() - start
+        except Exception as e:
+            rows = [row]
+            row["status"] = "failed"
+            row["error"] = f"{type(e).__name__}: {e}"
+    for each in rows:
+        each["timings"] = dict(timings)
+        # The worker's RSS while it handled this file, not its lifetime peak
+        each["peak_rss_mb"] = rss["peak_mb"]
+    return rows
+
+
+# --- Discovery and resume ---
+def iter_reports(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if Path(name).suffix.lower() in MIME_TYPES:
+                yield Path(dirpath) / name
+
+def _done_key(path):
+    st = path.stat()
+    return f"{path}\t{st.st_size}\t{st.st_mtime_ns}"
+
+def load_done(manifest):
+    if not manifest.exists():
+        return set()
+    with open(manifest, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+# --- Output ---
+class JsonlSink:
+    def __init__(self, output):
+        self.f = open(output, "a", encoding="utf-8")
+
+    def write(self, row):
+        self.f.write(json.dumps(row) + "\n")
+        self.f.flush()
+        return True  # durable as soon as it's written
+
+    def close(self):
+        self.f.close()
+        return True
+
+class ParquetSink:
+    """
+    One part file per run inside the output directory, written in row
+    groups of ``row_group_size``. Rows only count as done once their row
+    group is on disk.
+    """
+
+    def __init__(self, output, row_group_size=1000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ("path", pa.string()),
+            ("patient", pa.string()),
+            ("status", pa.string()),
+            ("error", pa.string()),
+            ("bytes", pa.int64()),
+            ("labs", pa.string()),  # JSON object: analytes differ per report
+            ("risk", pa.list_(pa.string())),
+            ("doctors", pa.list_(pa.string())),
+            ("advice", pa.list_(pa.string())),
+            ("overall_health", pa.string()),
+            ("pages", pa.int64()),
+            ("stopped", pa.string()),
+            ("peak_rss_mb", pa.float64()),
+        ] + [(f"{stage}_s", pa.float64()) for stage in STAGES])
+        self.pq = pq
+        self.output = Path(output)
+        self.writer = None  # opened on the first row group, so resumed no-op runs leave no empty parts
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    def write(self, row):
+        flat = dict(row, labs=json.dumps(row["labs"]))
+        for stage, seconds in flat.pop("timings").items():
+            flat[f"{stage}_s"] = seconds
+        self.rows.append(flat)
+        if len(self.rows) >= self.row_group_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if self.rows:
+            if self.writer is None:
+                self.output.mkdir(parents=True, exist_ok=True)
+                path = self.output / f"part-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.parquet"
+                self.writer = self.pq.ParquetWriter(path, self.schema)
+            self.writer.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+        return True
+
+
+# --- Driver ---
+def ingest(root, output, fmt="jsonl", workers=None, max_in_flight=None, options=None, vitals=DEFAULT_VITALS,
+           row_group_size=1000, stream=None):
+    """
+    Process every report under ``root`` not already listed in the manifest
+    of successfully processed files.
+    At most ``max_in_flight`` files are queued at once, so memory stays
+    bounded no matter how large the directory is. ``stream`` is passed to
+    process_file. Returns a stats dict.
+    """
+    output = Path(output)
+    manifest = Path(str(output) + ".done")
+    done = load_done(manifest)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    options = dict(options or {}, ocr_workers=1)  # parallel across files, not pages
+
+    sink = ParquetSink(output, row_group_size) if fmt == "parquet" else JsonlSink(output)
+    pending_done = []
+    stats = {"files": 0, "rows": 0, "failed": 0, "skipped": 0, "bytes": 0, "stages": dict.fromkeys(STAGES, 0.0),
+             "pages": 0, "stopped_early": 0, "peak_rss_mb": None}
+    start = time.perf_counter()
+
+    def finish(future, key):
+        rows = future.result()
+        row = rows[0]  # file-level fields are the same on every row
+        stats["files"] += 1
+        stats["rows"] += len(rows)
+        stats["failed"] += row["status"] != "ok"
+        stats["bytes"] += row.get("bytes", 0)
+        stats["pages"] += row["pages"] or 0
+        stats["stopped_early"] += row["stopped"] is not None
+        if row["peak_rss_mb"] is not None:
+            stats["peak_rss_mb"] = max(stats["peak_rss_mb"] or 0.0, row["peak_rss_mb"])
+        for stage, seconds in row["timings"].items():
+            stats["stages"][stage] += seconds
+        for each in rows:
+            flushed = sink.write(each)
+        # A flush after the file's last row covers all of them
+        if row["status"] == "ok":
+            pending_done.append(key)
+        if flushed:
+            _mark_done(manifest, pending_done)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = {}
+        try:
+            for path in iter_reports(root):
+                key = _done_key(path)
+                if key in done:
+                    stats["skipped"] += 1
+                    continue
+                if len(in_flight) >= max_in_flight:
+                    finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        finish(future, in_flight.pop(future))
+                in_flight[pool.submit(process_file, path, options, vitals, stream)] = key
+            for future in list(in_flight):
+                finish(future, in_flight.pop(future))
+        finally:
+            if sink.close():
+                _mark_done(manifest, pending_done)
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+def _mark_done(manifest, keys):
+    if keys:
+        with open(manifest, "a", encoding="utf-8") as f:
+            f.writelines(key + "\n" for key in keys)
+        keys.clear()
+
+def print_stats(stats):
+    seconds = stats["seconds"] or 1e-9
+    print(f"Processed {stats['files']} files ({stats['failed']} failed and left for the next run, "
+          f"{stats['skipped']} skipped as done) "
+          f"in {seconds:.1f} s: {stats['files'] / seconds:.2f} files/s, "
+          f"{stats['bytes'] / seconds / 1024 / 1024:.2f} MB/s")
+    if stats["rows"] != stats["files"]:
+        print(f"  {stats['rows']} rows: multi-patient CSVs give one per patient")
+    if stats["pages"]:
+        print(f"  {stats['pages']} pages read, {stats['stopped_early']} files stopped early")
+    if stats["peak_rss_mb"] is not None:
+        print(f"  peak worker memory {stats['peak_rss_mb']:.0f} MB")
+    total = sum(stats["stages"].values()) or 1e-9
+    for stage, spent in stats["stages"].items():
+        mean_ms = spent / stats["files"] * 1000 if stats["files"] else 0.0
+        print(f"  {stage:<8} {spent:9.2f} s worker time  {mean_ms:8.1f} ms/file  {spent / total:6.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", type=Path, help="directory of reports (searched recursively)")
+    parser.add_argument("--output", type=Path, required=True,
+                        help="JSONL file, or directory of part files for --format parquet")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="files queued at once (default: 2x workers)")
+    parser.add_argument("--row-group-size", type=int, default=1000, help="Parquet rows per row group")
+    parser.add_argument("--poppler-path", default=os.getenv("POPPLER_PATH"))
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI)
+    parser.add_argument("--no-preprocess", action="store_true", help="OCR raw page images")
+    parser.add_argument("--adaptive", action="store_true", help="OCR at low DPI first, redo low-confidence pages")
+    parser.add_argument("--early-stop", nargs="*", metavar="ANALYTE",
+                        help="read PDFs page by page and stop once these analytes (default: all that "
+                             "check_risks uses) are found")
+    parser.add_argument("--max-pages", type=int, default=None, help="page budget per PDF (implies streaming)")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="time budget per PDF, checked between pages (implies streaming)")
+    parser.add_argument("--age", type=int, default=DEFAULT_VITALS["age"])
+    parser.add_argument("--sex", choices=["Male", "Female"], default=DEFAULT_VITALS["sex"])
+    args = parser.parse_args(argv)
+
+    if not args.root.is_dir():
+        parser.error(f"{args.root} is not a directory")
+    vitals = dict(DEFAULT_VITALS, age=args.age, sex=args.sex)
+    preprocess = None if args.no_preprocess else dict(DEFAULT_PREPROCESS, adaptive=args.adaptive)
+    unknown = set(args.early_stop or ()) - {test.name for test in LAB_TESTS}
+    if unknown:
+        parser.error(f"unknown analytes for --early-stop: {', '.join(sorted(unknown))}")
+    stream = None
+    if args.early_stop is not None or args.max_pages or args.max_seconds:
+        targets = None if args.early_stop is None else (args.early_stop or RISK_ANALYTES)
+        stream = {"targets": targets, "max_pages": args.max_pages, "max_seconds": args.max_seconds}
+    stats = ingest(
+        args.root,
+        args.output,
+        fmt=args.format,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        options={"poppler_path": args.poppler_path, "dpi": args.dpi, "preprocess": preprocess},
+        vitals=vitals,
+        row_group_size=args.row_group_size,
+        stream=stream,
+    )
+    print_stats(stats)
+    return 0 if not stats["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""
+Durable background job queue for report extraction.
+
+Jobs and their upload bytes live in a SQLite database, so a queued or
+half-finished job survives reruns, browser refreshes and app restarts.
+A small pool of worker threads claims jobs oldest first and reports
+per-page progress while they run:
+
+    queue = JobQueue("jobs.db", handler, workers=2)
+    job_id = queue.submit(owner, "report.pdf", "application/pdf", data, options={...})
+    queue.get(job_id)  # {"status": "running", "pages_done": 3, "pages_total": 12, ...}
+
+``handler(job, data, progress)`` does the work and returns the result
+text; it calls ``progress(done, total)`` as pages complete. The heavy
+lifting happens in tesseract/Poppler subprocesses, so threads are enough.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import metrics
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# A running job whose worker hasn't checked in for this long is assumed
+# dead (app restart, crash) and goes back to the queue
+STALE_AFTER = 60
+HEARTBEAT_INTERVAL = 10
+# Jobs that kill their worker this many times are failed instead of retried
+MAX_ATTEMPTS = 3
+# Idle workers also poll, for jobs submitted by other processes
+POLL_INTERVAL = 1.0
+
+JOB_FIELDS = ["id", "owner", "name", "mime", "cache_key", "options", "status", "pages_done", "pages_total",
+              "result", "error", "attempts", "created", "started", "finished", "dismissed"]
+
+
+class JobQueue:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            name TEXT NOT NULL,
+            mime TEXT,
+            cache_key TEXT,
+            options TEXT NOT NULL,
+            status TEXT NOT NULL,
+            pages_done INTEGER NOT NULL DEFAULT 0,
+            pages_total INTEGER,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            runner TEXT,
+            heartbeat REAL,
+            created REAL NOT NULL,
+            started REAL,
+            finished REAL,
+            dismissed INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created);
+        CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, dismissed);
+        -- Upload bytes, kept apart so status polls never page them in
+        CREATE TABLE IF NOT EXISTS payloads (
+            job_id TEXT PRIMARY KEY,
+            data BLOB NOT NULL
+        );
+    """
+
+    def __init__(self, db_path, handler, workers=2):
+        self.db_path = Path(db_path)
+        self.handler = handler
+        # Identifies this process's workers in the heartbeat column
+        self.runner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._local = threading.local()
+        self._wake = threading.Condition()
+        self._stop = threading.Event()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+        self.requeue_stale()
+        self._threads = [threading.Thread(target=self._heartbeat_loop, name="jobs-heartbeat", daemon=True)]
+        self._threads += [threading.Thread(target=self._work_loop, name=f"jobs-worker-{i}", daemon=True)
+                          for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # --- Submitting and reading ---
+    def submit(self, owner, name, mime, data, options=None, cache_key=None):
+        job_id = uuid.uuid4().hex
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, owner, name, mime, cache_key, options, status, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, owner, name, mime, cache_key, json.dumps(options or {}), QUEUED, time.time()),
+            )
+            conn.execute("INSERT INTO payloads (job_id, data) VALUES (?, ?)", (job_id, data))
+        with self._wake:
+            self._wake.notify()
+        return job_id
+
+    def get(self, job_id):
+        row = self._conn().execute(
+            f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return _job(row) if row else None
+
+    def jobs_for(self, owner, include_dismissed=False):
+        """The owner's jobs, oldest first, with their queue position while queued."""
+        rows = self._conn().execute(
+            f"SELECT {', '.join(JOB_FIELDS)}, "
+            "(SELECT COUNT(*) FROM jobs q WHERE q.status = 'queued' AND q.created <= jobs.created) AS position "
+            "FROM jobs WHERE owner = ? AND (dismissed = 0 OR ?) ORDER BY created",
+            (owner, include_dismissed),
+        ).fetchall()
+        return [_job(row) for row in rows]
+
+    def dismiss_finished(self, owner):
+        """Hide the owner's done/failed jobs and drop their stored results."""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET dismissed = 1, result = NULL WHERE owner = ? AND status IN (?, ?)",
+                (owner, DONE, FAILED),
+            )
+
+    def stats(self, window=200):
+        """Queue depth, running count, oldest wait and wait/run times of the last ``window`` jobs."""
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        oldest = conn.execute("SELECT MIN(created) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        recent = conn.execute(
+            "SELECT started - created, finished - started FROM jobs WHERE finished IS NOT NULL "
+            "ORDER BY finished DESC LIMIT ?",
+            (window,),
+        ).fetchall()
+        waits = sorted(w for w, _ in recent if w is not None)
+        runs = sorted(r for _, r in recent if r is not None)
+        return {
+            "depth": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "oldest_wait_s": time.time() - oldest if oldest else 0.0,
+            "wait_p50_s": _percentile(waits, 0.5),
+            "wait_p95_s": _percentile(waits, 0.95),
+            "run_p50_s": _percentile(runs, 0.5),
+            "run_p95_s": _percentile(runs, 0.95),
+            "workers": len(self._threads) - 1,
+        }
+
+    # --- Recovery ---
+    def requeue_stale(self):
+        """Put running jobs whose worker stopped checking in back in the queue (or fail them)."""
+        with self._conn() as conn:
+            cutoff = time.time() - STALE_AFTER
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished = ?, error = 'Worker died on every attempt' "
+                "WHERE status = ? AND heartbeat < ? AND attempts >= ?",
+                (FAILED, time.time(), RUNNING, cutoff, MAX_ATTEMPTS),
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, runner = NULL, pages_done = 0 "
+                "WHERE status = ? AND heartbeat < ?",
+                (QUEUED, RUNNING, cutoff),
+            )
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                with self._conn() as conn:
+                    conn.execute("UPDATE jobs SET heartbeat = ? WHERE runner = ? AND status = ?",
+                                 (time.time(), self.runner, RUNNING))
+                self.requeue_stale()
+            except sqlite3.Error as e:
+                print(f"⚠️ Job heartbeat failed: {e}")
+
+    # --- Workers ---
+    def _claim(self):
+        conn = self._conn()
+        # IMMEDIATE takes the write lock first, so two workers (or two
+        # processes) can't claim the same job
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE status = ? ORDER BY created LIMIT 1",
+                (QUEUED,),
+            ).fetchone()
+            if row is None:
+                conn.rollback()
+                return None, None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, runner = ?, heartbeat = ?, started = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (RUNNING, self.runner, now, now, row["id"]),
+            )
+            data = conn.execute("SELECT data FROM payloads WHERE job_id = ?", (row["id"],)).fetchone()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        job = _job(row)
+        metrics.record("job_wait", now - job["created"])
+        return job, data[0] if data else None
+
+    def _work_loop(self):
+        while not self._stop.is_set():
+            try:
+                job, data = self._claim()
+            except sqlite3.Error as e:
+                print(f"⚠️ Job claim failed: {e}")
+                job = None
+            if job is None:
+                with self._wake:
+                    self._wake.wait(POLL_INTERVAL)
+                continue
+            self._run(job, data)
+
+    def _run(self, job, data):
+        def progress(done, total=None):
+            with self._conn() as conn:
+                conn.execute(
+                    "UPDATE jobs SET pages_done = ?, pages_total = COALESCE(?, pages_total), heartbeat = ? "
+                    "WHERE id = ?",
+                    (done, total, time.time(), job["id"]),
+                )
+
+        status, result, error = DONE, None, None
+        try:
+            if data is None:
+                raise RuntimeError("Upload data is missing")
+            with metrics.timed("job_run", mime=job["mime"]):
+                result = self.handler(job, data, progress)
+        except Exception as e:
+            status, error = FAILED, f"{type(e).__name__}: {e}"
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, "
+                "pages_done = COALESCE(pages_total, pages_done) WHERE id = ?",
+                (status, result, error, time.time(), job["id"]),
+            )
+            conn.execute("DELETE FROM payloads WHERE job_id = ?", (job["id"],))
+        metrics.count("jobs", status=status)
+
+    def close(self, timeout=None):
+        """Stop taking jobs; running jobs finish (or are requeued after a restart)."""
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+
+def _job(row):
+    job = {field: row[field] for field in row.keys()}
+    job["options"] = json.loads(job["options"])
+    job["dismissed"] = bool(job["dismissed"])
+    return job
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
@@ -0,0 +1,166 @@
+import re
+from collections import namedtuple
+
+from metrics import timed
+
+# --- Lab test registry ---
+# name: key used in lab_data / records; aliases: spellings seen in reports
+# (spaces match any whitespace); integer: value has no decimals (BP).
+LabTest = namedtuple("LabTest", "name aliases integer")
+
+LAB_TESTS = [
+    LabTest("Glucose", ["Glucose", "GLU"], False),
+    LabTest("Hemoglobin", ["Hemoglobin", "Haemoglobin", "Hb", "H B"], False),
+    LabTest("Systolic_BP", ["Systolic", "Sys"], True),
+    LabTest("Diastolic_BP", ["Diastolic", "Dia"], True),
+    LabTest("TSH", ["TSH", "Thyroid"], False),
+    LabTest("ALT", ["ALT", "SGPT"], False),
+    LabTest("AST", ["AST", "SGOT"], False),
+    LabTest("Creatinine", ["Creatinine", "CREA"], False),
+    LabTest("Urea", ["Urea", "BUN"], False),
+    # Blood counts
+    LabTest("WBC", ["WBC", "WBC count"], False),
+    LabTest("RBC", ["RBC", "RBC count"], False),
+    LabTest("Platelets", ["PLT", "Platelet", "Platelets"], False),
+    LabTest("MCV", ["MCV"], False),
+    LabTest("MCH", ["MCH"], False),
+    LabTest("MCHC", ["MCHC"], False),
+    # Electrolytes
+    LabTest("Sodium", ["Sodium", "Na"], False),
+    LabTest("Potassium", ["Potassium", "K"], False),
+    LabTest("Chloride", ["Chloride", "Cl"], False),
+    # Lipid Profile
+    LabTest("Total Cholesterol", ["Total Cholesterol", "Cholesterol"], False),
+    LabTest("LDL", ["LDL", "LDL Cholesterol"], False),
+    LabTest("HDL", ["HDL", "HDL Cholesterol"], False),
+    LabTest("Triglycerides", ["Triglycerides"], False),
+]
+
+UNITS = [
+    "mg/dL", "g/dL", "g/L", "mmHg", "mmol/L", "mEq/L", "µIU/mL", "uIU/mL", "mIU/L", "IU/L", "U/L",
+    "ng/mL", "fL", "pg", "%", "x10^3/µL", "x10^6/µL", "10^3/µL", "10^6/µL", "/µL", "/uL",
+    "cells/cumm", "lakhs/cumm", "million/cumm", "/cumm",
+]
+
+LabMatch = namedtuple("LabMatch", "analyte value unit start end")
+
+
+def _norm_alias(alias):
+    return re.sub(r"\s+", "", alias).lower()
+
+def _trie_pattern(aliases):
+    """
+    One regex for all aliases, factored by shared prefixes. sre tries
+    alternatives one by one, so "m(?:ch(?:c)?|cv)" is much cheaper to
+    reject than "mchc|mch|mcv" at each of the millions of positions in an
+    OCR dump. Optional suffixes are greedy, so the longest alias wins.
+    """
+    trie = {}
+    for alias in aliases:
+        node = trie
+        for ch in " ".join(alias.lower().split()):
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        branches = [
+            (r"\s*" if ch == " " else re.escape(ch)) + build(child)
+            for ch, child in sorted(node.items()) if ch
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return build(trie)
+
+
+class LabScanner:
+    """
+    Finds every lab value in a text in one regex pass.
+
+    All aliases go into a single prefix-factored alternation where the
+    longest alias wins, so "MCHC" beats "MCH" and "LDL Cholesterol" beats
+    "Cholesterol". Aliases must stand alone as words, which keeps "Na"
+    out of "Name" and "K" out of ordinary words. Values may be followed
+    by a known unit.
+    """
+
+    def __init__(self, tests=LAB_TESTS, units=UNITS):
+        self.tests = {test.name: test for test in tests}
+        self._by_alias = {}
+        for test in tests:
+            for alias in test.aliases:
+                self._by_alias[_norm_alias(alias)] = test
+        aliases = [alias for test in tests for alias in test.aliases]
+        units = sorted(units, key=len, reverse=True)
+        self.pattern = re.compile(
+            r"(?<![A-Za-z])(?P<alias>" + _trie_pattern(aliases) + r")"
+            r"[+\-.]?(?![A-Za-z])"        # Na+, Cl-, Sys.
+            r"\s*[:=]?\s*"
+            r"(?P<value>\d+(?:\.\d+)?)"
+            r"(?:\s*(?P<unit>" + "|".join(re.escape(u) for u in units) + r")(?![A-Za-z]))?",
+            re.IGNORECASE,
+        )
+
+    def finditer(self, text):
+        for m in self.pattern.finditer(text):
+            test = self._by_alias[_norm_alias(m.group("alias"))]
+            value = m.group("value")
+            if test.integer:
+                # Matches the old "[\d]+" patterns: 120.5 mmHg reads as 120
+                value = value.split(".")[0]
+            yield LabMatch(test.name, float(value), m.group("unit"), m.start(), m.end())
+
+    def scan(self, text):
+        return list(self.finditer(text))
+
+
+_scanner = LabScanner()
+
+def scan_lab_values(text):
+    """Every lab value occurrence in ``text``, in order, with positions and units."""
+    return _scanner.scan(text)
+
+def parse_lab_values(text):
+    """First value found for each analyte, e.g. {"Glucose": 110.0}."""
+    lab_data = {}
+    with timed("parse_lab_values", chars=len(text)):
+        for match in _scanner.finditer(text):
+            lab_data.setdefault(match.analyte, match.value)
+    return lab_data
+
+class LabCollector:
+    """
+    parse_lab_values for text that arrives a page at a time: feed() each
+    page in order and ``values`` matches parsing the pages joined with
+    newlines. The last line of the previous page is carried over so a
+    label and its value split by a page break are still read.
+    ``targets`` (analyte names) makes ``complete`` true once all are found.
+    """
+
+    def __init__(self, targets=None):
+        self.values = {}
+        self.targets = set(targets or ())
+        self._carry = ""
+
+    def feed(self, text):
+        buffer = self._carry + "\n" + text if self._carry else text
+        seen = len(self._carry)
+        with timed("parse_lab_values", chars=len(text)):
+            for match in _scanner.finditer(buffer):
+                # Matches ending inside the carried line were counted last time
+                if match.end > seen:
+                    self.values.setdefault(match.analyte, match.value)
+        tail = text.rstrip()
+        if tail:
+            self._carry = tail[tail.rfind("\n") + 1:]
+        return self.values
+
+    @property
+    def complete(self):
+        return bool(self.targets) and self.targets <= self.values.keys()
+
+    @property
+    def missing(self):
+        return sorted(self.targets - self.values.keys())
@@ -0,0 +1,224 @@
+"""
+In-process timings and counters for the extraction pipeline.
+
+    with timed("tabula", bytes=len(pdf_bytes)) as call:
+        ...
+        call["pages"] = 3
+
+Every call adds to a summary per name and label set: call count, errors,
+total and max seconds, histogram buckets, and running totals of numeric
+fields (pages, bytes). String fields are labels, so keep them to a few
+values (mime type, store operation). Summaries export as Prometheus text
+or JSON; everything lives in this process only.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # optional; /proc covers Linux without it
+    psutil = None
+
+PREFIX = "doctor_buddy"
+RSS_SAMPLE_SECONDS = 0.02
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RECENT_CALLS = 200
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+_recent = deque(maxlen=RECENT_CALLS)
+_started = time.time()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+# --- Recording ---
+@contextmanager
+def timed(name, **fields):
+    """
+    Time the block as one call of ``name``. The yielded dict holds
+    ``fields`` and may be filled in inside the block; an exception marks
+    the call as an error and is re-raised.
+    """
+    call = dict(fields)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield call
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record(name, time.perf_counter() - start, status, **call)
+
+def record(name, seconds, status="ok", **fields):
+    totals = {k: v for k, v in fields.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+    labels = {k: v for k, v in fields.items() if k not in totals and v is not None}
+    with _lock:
+        timer = _timers.get(_key(name, labels))
+        if timer is None:
+            timer = _timers[_key(name, labels)] = {
+                "count": 0, "errors": 0, "seconds": 0.0, "max": 0.0,
+                "buckets": [0] * (len(BUCKETS) + 1), "totals": {},
+            }
+        timer["count"] += 1
+        timer["errors"] += status != "ok"
+        timer["seconds"] += seconds
+        timer["max"] = max(timer["max"], seconds)
+        timer["buckets"][sum(1 for bound in BUCKETS if seconds > bound)] += 1
+        for field, value in totals.items():
+            timer["totals"][field] = timer["totals"].get(field, 0) + value
+        _recent.append(dict(fields, name=name, seconds=seconds, status=status, at=time.time()))
+
+def count(name, n=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _counters[key] = _counters.get(key, 0) + n
+
+def reset():
+    global _started
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+        _recent.clear()
+        _started = time.time()
+
+def peak_rss_mb():
+    """
+    High-water mark of this process's resident memory over its whole
+    lifetime in MB, or None where unsupported. It never goes down, so use
+    track_rss() for the peak of one piece of work.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def rss_mb():
+    """Current resident memory of this process in MB, or None where unsupported."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+@contextmanager
+def track_rss(interval=RSS_SAMPLE_SECONDS):
+    """
+    Peak resident memory while the block runs, sampled every ``interval``
+    seconds on a helper thread (and at both ends):
+
+        with track_rss() as rss:
+            ...
+        rss["peak_mb"]  # None where RSS can't be read
+
+    It is the whole process's RSS, so other threads' work during the block
+    counts too; child processes (tesseract, the tabula JVM) don't.
+    """
+    out = {"peak_mb": rss_mb()}
+    if out["peak_mb"] is None:
+        yield out
+        return
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(interval):
+            out["peak_mb"] = max(out["peak_mb"], rss_mb() or 0.0)
+
+    sampler = threading.Thread(target=sample, name="rss-sampler", daemon=True)
+    sampler.start()
+    try:
+        yield out
+    finally:
+        done.set()
+        sampler.join()
+        out["peak_mb"] = max(out["peak_mb"], rss_mb() or 0.0)
+
+
+# --- Export ---
+def snapshot():
+    """Plain-dict copy of everything recorded so far, safe to serialize."""
+    with _lock:
+        return {
+            "started": _started,
+            "uptime_s": time.time() - _started,
+            "timers": [dict(timer, name=name, labels=dict(labels), buckets=list(timer["buckets"]),
+                            totals=dict(timer["totals"]))
+                       for (name, labels), timer in sorted(_timers.items())],
+            "counters": [{"name": name, "labels": dict(labels), "value": value}
+                         for (name, labels), value in sorted(_counters.items())],
+            "recent": list(_recent),
+        }
+
+def _prom_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _prom_labels(labels, **extra):
+    labels = dict(labels, **extra)
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_prom_value(v)}"' for k, v in labels.items()) + "}"
+
+def prometheus_text(snap=None):
+    """Prometheus text exposition format (0.0.4)."""
+    snap = snap or snapshot()
+    metric = f"{PREFIX}_stage_seconds"
+    lines = [f"# HELP {metric} Time spent per pipeline stage call.", f"# TYPE {metric} histogram"]
+    for timer in snap["timers"]:
+        labels = dict(timer["labels"], stage=timer["name"])
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ("+Inf",), timer["buckets"]):
+            cumulative += n
+            lines.append(f"{metric}_bucket{_prom_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{metric}_sum{_prom_labels(labels)} {timer['seconds']}")
+        lines.append(f"{metric}_count{_prom_labels(labels)} {timer['count']}")
+    lines.append(f"# TYPE {PREFIX}_stage_errors_total counter")
+    for timer in snap["timers"]:
+        labels = dict(timer["labels"], stage=timer["name"])
+        lines.append(f"{PREFIX}_stage_errors_total{_prom_labels(labels)} {timer['errors']}")
+    fields = sorted({field for timer in snap["timers"] for field in timer["totals"]})
+    for field in fields:
+        lines.append(f"# TYPE {PREFIX}_stage_{field}_total counter")
+        for timer in snap["timers"]:
+            if field in timer["totals"]:
+                labels = dict(timer["labels"], stage=timer["name"])
+                lines.append(f"{PREFIX}_stage_{field}_total{_prom_labels(labels)} {timer['totals'][field]}")
+    for name in sorted({c["name"] for c in snap["counters"]}):
+        lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+        for counter in snap["counters"]:
+            if counter["name"] == name:
+                lines.append(f"{PREFIX}_{name}_total{_prom_labels(counter['labels'])} {counter['value']}")
+    return "\n".join(lines) + "\n"
+
+def write_metrics(path):
+    """
+    Write the current metrics to ``path``: JSON for a .json suffix,
+    Prometheus text otherwise (e.g. for node_exporter's textfile collector).
+    Replaced atomically so a scraper never sees half a file.
+    """
+    path = Path(path)
+    snap = snapshot()
+    body = json.dumps(snap, indent=2) if path.suffix == ".json" else prometheus_text(snap)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(body, encoding="utf-8")
+    os.replace(tmp, path)
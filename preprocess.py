@@ -0,0 +1,116 @@
+"""
+Image cleanup before OCR: grayscale, downscale to a target DPI, Otsu
+binarization and deskew. Tesseract's time grows with pixel count, and a
+12-megapixel colour phone photo holds no more text than a 300 DPI page.
+
+Settings travel as a plain dict (JSON-friendly, so they fit in cache keys
+and job options); missing keys fall back to DEFAULT_PREPROCESS.
+"""
+import numpy as np
+from PIL import Image, ImageOps
+
+DEFAULT_PREPROCESS = {
+    "grayscale": True,
+    "target_dpi": 300,   # anything finer is downscaled to this
+    "binarize": True,
+    "deskew": True,
+    # Adaptive OCR: read at low_dpi first and redo at target_dpi only when
+    # tesseract's mean word confidence is below min_conf
+    "adaptive": False,
+    "low_dpi": 150,
+    "min_conf": 75,
+}
+
+# Assumed page height for photos without usable DPI metadata (US Letter / A4)
+PAGE_INCHES = 11
+MAX_SKEW_DEGREES = 5
+# Skew is estimated on a copy this wide; accuracy is limited by the step anyway
+SKEW_SAMPLE_WIDTH = 800
+
+
+def settings(preprocess):
+    return dict(DEFAULT_PREPROCESS, **(preprocess or {}))
+
+def effective_dpi(img, source_dpi=None):
+    """Resolution of a page image: rasterized DPI, sane metadata, or a guess from its size."""
+    if source_dpi:
+        return float(source_dpi)
+    dpi = img.info.get("dpi")
+    if dpi and dpi[0] >= 100:  # phone cameras write 72
+        return float(dpi[0])
+    return max(img.size) / PAGE_INCHES
+
+def downscale(img, dpi, target_dpi):
+    """Shrink to ``target_dpi`` if finer; never upscales. Returns (image, new dpi)."""
+    if not target_dpi or dpi <= target_dpi * 1.05:
+        return img, dpi
+    scale = target_dpi / dpi
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    # BOX averages every source pixel, which is both fast and alias-free when shrinking
+    return img.resize(size, Image.BOX), target_dpi
+
+def otsu_threshold(gray):
+    """Grey level that best separates ink from paper (Otsu's method)."""
+    hist = np.array(gray.histogram()[:256], dtype=float)
+    levels = np.arange(256)
+    w0 = np.cumsum(hist)
+    w1 = w0[-1] - w0
+    sum0 = np.cumsum(hist * levels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = w0 * w1 * (sum0 / w0 - (sum0[-1] - sum0) / w1) ** 2
+    return int(np.nanargmax(between)) if np.isfinite(between).any() else 127
+
+def binarize(gray):
+    threshold = otsu_threshold(gray)
+    return gray.point([0 if level <= threshold else 255 for level in range(256)])
+
+def _skew_score(sample, angle):
+    rotated = sample.rotate(angle, resample=Image.NEAREST, fillcolor=0)
+    rows = np.asarray(rotated, dtype=np.int32).sum(axis=1)
+    # Text lines aligned with the rows give sharp peaks between blank gaps
+    return float(np.square(np.diff(rows)).sum())
+
+def estimate_skew(gray, max_angle=MAX_SKEW_DEGREES):
+    """
+    Degrees to rotate the page by to level its text lines (projection
+    profile, coarse then fine search).
+    """
+    sample = gray
+    if gray.width > SKEW_SAMPLE_WIDTH:
+        scale = SKEW_SAMPLE_WIDTH / gray.width
+        sample = gray.resize((SKEW_SAMPLE_WIDTH, max(1, round(gray.height * scale))), Image.BOX)
+    # Ink as 1, paper as 0, so row sums count ink
+    threshold = otsu_threshold(sample)
+    sample = sample.point([1 if level <= threshold else 0 for level in range(256)])
+    best = max(np.arange(-max_angle, max_angle + 0.01, 0.5), key=lambda a: _skew_score(sample, a))
+    best = max(np.arange(best - 0.4, best + 0.41, 0.1), key=lambda a: _skew_score(sample, a))
+    return round(float(best), 1)
+
+def deskew(img):
+    angle = estimate_skew(img)
+    if abs(angle) < 0.1:
+        return img
+    return img.rotate(angle, resample=Image.BICUBIC, fillcolor=255)
+
+def prepare(img, preprocess=None, source_dpi=None):
+    """Grayscale, downscale and deskew; returns (image, dpi) ready for finish()."""
+    opts = settings(preprocess)
+    img = ImageOps.exif_transpose(img)  # phone photos are often stored sideways
+    dpi = effective_dpi(img, source_dpi)
+    if opts["grayscale"] and img.mode != "L":
+        img = img.convert("L")
+    img, dpi = downscale(img, dpi, opts["target_dpi"])
+    # Deskew before thresholding: rotating a binary image leaves jagged strokes
+    if opts["deskew"] and img.mode == "L":
+        img = deskew(img)
+    return img, dpi
+
+def finish(img, preprocess=None):
+    if settings(preprocess)["binarize"] and img.mode == "L":
+        img = binarize(img)
+    return img
+
+def preprocess_image(img, preprocess=None, source_dpi=None):
+    """Apply every enabled step; returns (image, dpi)."""
+    img, dpi = prepare(img, preprocess, source_dpi)
+    return finish(img, preprocess), dpi
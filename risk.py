@@ -0,0 +1,236 @@
+import numpy as np
+import pandas as pd
+
+# --- Thresholds ---
+# Shared by the scalar and batch checkers; pass a modified copy to either
+# to re-score histories under new cut-offs.
+RISK_THRESHOLDS = {
+    "glucose_high": 120,
+    "systolic_high": 140,
+    "diastolic_high": 90,
+    "tsh_high": 5.0,
+    "alt_high": 45,
+    "ast_high": 40,
+    "creatinine_high": 1.3,
+    "urea_high": 50,
+    "hb_low_male": 13.5,
+    "hb_low_female": 12.0,
+    "adult_age": 18,
+    "bmi_under": 18.5,
+    "bmi_over": 25,
+    "bmi_obese": 30,
+}
+
+BMI_CATEGORIES = [
+    ("Check BMI percentile for age & sex", "Consult pediatrician for proper growth assessment."),
+    ("Underweight", "Increase calorie intake & balanced diet."),
+    ("Normal weight", "Maintain healthy lifestyle."),
+    ("Overweight", "Increase physical activity and monitor diet."),
+    ("Obese", "Consult doctor/nutritionist for weight management."),
+]
+FEMALE_BMI_NOTE = " (Women have slightly higher cardiovascular risk at lower BMI.)"
+ANEMIA_ADVICE_MALE = "Iron-rich diet & check for anemia. "
+ANEMIA_ADVICE_FEMALE = "Iron-rich diet & check for anemia ."
+
+
+# --- Risk checker ---
+def bmi_risk(bmi, age, sex, thresholds=RISK_THRESHOLDS):
+    t = thresholds
+    if age < t["adult_age"]:
+        risk, advice = BMI_CATEGORIES[0]
+    else:
+        if bmi < t["bmi_under"]:
+            risk, advice = BMI_CATEGORIES[1]
+        elif t["bmi_under"] <= bmi < t["bmi_over"]:
+            risk, advice = BMI_CATEGORIES[2]
+        elif t["bmi_over"] <= bmi < t["bmi_obese"]:
+            risk, advice = BMI_CATEGORIES[3]
+        else:
+            risk, advice = BMI_CATEGORIES[4]
+    if sex.lower() == "female" and bmi >= t["bmi_over"]:
+        advice += FEMALE_BMI_NOTE
+    return risk, advice
+
+def overall_health_for(risk_count):
+    if risk_count == 0:
+        return "Excellent Health"
+    elif 1 <= risk_count <= 2:
+        return "Please monitor your health"
+    return "Needs medical attention"
+
+def check_risks(glucose, hb, bmi, systolic_bp, diastolic_bp, labs, age=25, sex="Male", thresholds=RISK_THRESHOLDS):
+    t = thresholds
+    risk = []
+    doctors = set()
+    advice_list = []
+
+    if glucose >= t["glucose_high"]: risk.append("High Glucose"); doctors.add("Endocrinologist")
+    bmi_cat, bmi_adv = bmi_risk(bmi, age, sex, thresholds)
+    risk.append(bmi_cat); advice_list.append(bmi_adv)
+    if systolic_bp >= t["systolic_high"] or diastolic_bp >= t["diastolic_high"]: risk.append("High BP"); doctors.add("Cardiologist")
+
+    # Thyroid / TSH
+    if labs.get("TSH", 0) > t["tsh_high"]:
+        risk.append("High TSH")
+        doctors.add("Endocrinologist")
+
+    # Liver enzymes
+    if labs.get("ALT", 0) > t["alt_high"] or labs.get("AST", 0) > t["ast_high"]:
+        risk.append("Liver Enzyme High")
+        doctors.add("Hepatologist")
+
+
+    # Kidney
+    if labs.get("Creatinine",0) > t["creatinine_high"] or labs.get("Urea",0) > t["urea_high"]:
+        risk.append("Kidney function abnormal")
+        doctors.add("Nephrologist")
+
+
+    # Hemoglobin check based on sex
+    hb = labs.get("Hemoglobin", hb)  # Use extracted value if available, else use passed hb
+
+    if hb is not None:
+        if sex.lower() == "male" and hb < t["hb_low_male"]:
+            risk.append("Low Hemoglobin")
+            advice_list.append(ANEMIA_ADVICE_MALE)
+            doctors.add("Hematologist")
+        elif sex.lower() == "female" and hb < t["hb_low_female"]:
+            risk.append("Low Hemoglobin")
+            advice_list.append(ANEMIA_ADVICE_FEMALE)
+            doctors.add("Hematologist")
+
+    return risk, doctors, advice_list, overall_health_for(len(risk))
+
+
+# --- Batch risk engine ---
+# Flag columns in the order check_risks appends them (BMI sits after glucose)
+FLAG_RULES = [
+    ("risk_high_glucose", "High Glucose", "Endocrinologist"),
+    ("risk_high_bp", "High BP", "Cardiologist"),
+    ("risk_high_tsh", "High TSH", "Endocrinologist"),
+    ("risk_liver", "Liver Enzyme High", "Hepatologist"),
+    ("risk_kidney", "Kidney function abnormal", "Nephrologist"),
+    ("risk_low_hb", "Low Hemoglobin", "Hematologist"),
+]
+
+def _column(values, n):
+    if values is None:
+        return np.full(n, np.nan)
+    return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+
+def _outcome(code):
+    """Decode one outcome code into check_risks' (risk, doctors, advice, overall)."""
+    flags = [bool(code >> i & 1) for i in range(len(FLAG_RULES))]
+    bmi_cat, bmi_adv = BMI_CATEGORIES[code >> 6 & 7]
+    if code >> 9 & 1:
+        bmi_adv += FEMALE_BMI_NOTE
+    risk, doctors, advice = [], set(), [bmi_adv]
+    for i, (_, label, doctor) in enumerate(FLAG_RULES):
+        if flags[i]:
+            risk.append(label)
+            doctors.add(doctor)
+        if i == 0:
+            risk.append(bmi_cat)
+    if flags[5]:
+        advice.append(ANEMIA_ADVICE_FEMALE if code >> 10 & 1 else ANEMIA_ADVICE_MALE)
+    return risk, doctors, advice, overall_health_for(len(risk))
+
+def _frozen(value):
+    if isinstance(value, list):
+        return tuple(value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+def check_risks_arrays(glucose, hb, bmi, systolic_bp, diastolic_bp, age, sex, tsh=None, alt=None, ast=None,
+                       creatinine=None, urea=None, lab_hb=None, thresholds=RISK_THRESHOLDS):
+    """
+    Column-wise check_risks over equal-length arrays. Missing lab values
+    are NaN (or pass None for a whole column) and, as with labs.get(...),
+    never raise a flag; lab_hb overrides hb wherever it is present.
+
+    Every rule is a NumPy comparison. Each row's outcome is packed into an
+    integer code, and the results are built once per distinct code (a few
+    dozen at most) and shared by every row with that outcome. They are
+    immutable for that reason: risk and advice come back as tuples and
+    doctors as a frozenset, where check_risks gives lists and a set.
+    """
+    t = thresholds
+    n = len(glucose)
+    glucose = _column(glucose, n)
+    hb, bmi = _column(hb, n), _column(bmi, n)
+    systolic_bp, diastolic_bp, age = _column(systolic_bp, n), _column(diastolic_bp, n), _column(age, n)
+    lab_hb = _column(lab_hb, n)
+    hb = np.where(np.isnan(lab_hb), hb, lab_hb)
+    # Lower-case the handful of distinct spellings, not every row
+    sex_codes, spellings = pd.factorize(pd.Series(sex, dtype=object))
+    spellings = [str(s).lower() for s in spellings]
+    male = np.isin(sex_codes, [i for i, s in enumerate(spellings) if s == "male"])
+    female = np.isin(sex_codes, [i for i, s in enumerate(spellings) if s == "female"])
+
+    with np.errstate(invalid="ignore"):
+        flags = [
+            glucose >= t["glucose_high"],
+            (systolic_bp >= t["systolic_high"]) | (diastolic_bp >= t["diastolic_high"]),
+            _column(tsh, n) > t["tsh_high"],
+            (_column(alt, n) > t["alt_high"]) | (_column(ast, n) > t["ast_high"]),
+            (_column(creatinine, n) > t["creatinine_high"]) | (_column(urea, n) > t["urea_high"]),
+            (male & (hb < t["hb_low_male"])) | (female & (hb < t["hb_low_female"])),
+        ]
+        # NaN BMI falls through every comparison to "Obese", as in bmi_risk
+        bmi_cat = np.select(
+            [age < t["adult_age"], bmi < t["bmi_under"], bmi < t["bmi_over"], bmi < t["bmi_obese"]],
+            [0, 1, 2, 3],
+            default=4,
+        )
+        female_note = female & (bmi >= t["bmi_over"])
+
+    code = bmi_cat.astype(np.int64) << 6 | female_note.astype(np.int64) << 9 | (female & flags[5]).astype(np.int64) << 10
+    for i, flag in enumerate(flags):
+        code |= flag.astype(np.int64) << i
+    codes, inverse = np.unique(code, return_inverse=True)
+    outcomes = [_outcome(int(c)) for c in codes]
+
+    result = {name: flag for (name, _, _), flag in zip(FLAG_RULES, flags)}
+    result["bmi_category"] = np.array([cat for cat, _ in BMI_CATEGORIES], dtype=object)[bmi_cat]
+    for j, name in enumerate(["risk", "doctors", "advice", "overall_health"]):
+        column = np.empty(len(outcomes), dtype=object)
+        column[:] = [_frozen(outcome[j]) for outcome in outcomes]
+        result[name] = column[inverse.reshape(-1)]
+    return result
+
+# Record field / lab key -> check_risks_arrays argument
+FRAME_COLUMNS = {
+    "glucose": "glucose",
+    "hemoglobin": "hb",
+    "bmi": "bmi",
+    "systolic_bp": "systolic_bp",
+    "diastolic_bp": "diastolic_bp",
+    "age": "age",
+    "sex": "sex",
+    "labs.TSH": "tsh",
+    "labs.ALT": "alt",
+    "labs.AST": "ast",
+    "labs.Creatinine": "creatinine",
+    "labs.Urea": "urea",
+    "labs.Hemoglobin": "lab_hb",
+}
+
+def records_frame(records):
+    """Flatten stored records (labs dict included) into a DataFrame, labs as "labs.<name>" columns."""
+    return pd.json_normalize(records, max_level=1)
+
+def check_risks_frame(df, thresholds=RISK_THRESHOLDS):
+    """
+    Batch check_risks over a DataFrame shaped like records_frame() output.
+    Missing age/sex columns use check_risks' defaults (25, "Male").
+    Returns a DataFrame on the same index with the flag columns,
+    bmi_category, risk, doctors, advice and overall_health.
+    """
+    n = len(df)
+    kwargs = {arg: (df[col] if col in df else None) for col, arg in FRAME_COLUMNS.items()}
+    if kwargs["age"] is None:
+        kwargs["age"] = np.full(n, 25)
+    if kwargs["sex"] is None:
+        kwargs["sex"] = np.full(n, "Male", dtype=object)
+    return pd.DataFrame(check_risks_arrays(thresholds=thresholds, **kwargs), index=df.index)
@@ -0,0 +1,133 @@
+"""
+Spoken results summaries, rendered to WAV off the script thread.
+
+pyttsx3 engines are slow to start and not thread-safe, so each process
+runs one engine in one worker thread and queues texts to it. Rendered
+audio goes into a DiskCache keyed by text, voice and rate; the risk and
+advice strings from check_risks repeat a lot, so most summaries are
+already on disk and play back immediately:
+
+    speech = SpeechRenderer(DiskCache(".cache/speech", suffix=".wav"), rate=120)
+    wav = speech.audio(text)  # bytes, or None while it renders
+    speech.done(text)         # poll until True, then call audio() again
+
+Works offline: on Linux pyttsx3 drives espeak (apt install espeak-ng),
+on Windows SAPI5 and on macOS NSSpeechSynthesizer.
+"""
+import os
+import queue
+import tempfile
+import threading
+
+from disk_cache import content_key
+
+
+class SpeechError(Exception):
+    pass
+
+
+def summary_text(overall_health, risk, doctors, advice):
+    """What the Results Summary says, as one script for the speech engine."""
+    parts = [f"Overall health: {overall_health}."]
+    if risk:
+        parts.append("Risks: " + ", ".join(risk) + ".")
+    if doctors:
+        # doctors is a set; sorted so the same results give the same cache key
+        parts.append("See specialists: " + ", ".join(sorted(doctors)) + ".")
+    parts.extend(str(a).strip() for a in advice if str(a).strip())
+    return " ".join(parts)
+
+
+class SpeechRenderer:
+    def __init__(self, cache, voice=None, rate=150):
+        self.cache = cache
+        self.voice = voice  # voice id or part of its name; None for the engine's default
+        self.rate = rate
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = set()  # keys queued or rendering
+        self._errors = {}  # key -> message
+        self._thread = None
+
+    def key(self, text):
+        return content_key(text.encode("utf-8"), voice=self.voice, rate=self.rate, engine="pyttsx3")
+
+    def audio(self, text):
+        """
+        WAV bytes for ``text`` if rendered, else queue it (once) and return
+        None. Raises SpeechError if rendering it failed.
+        """
+        key = self.key(text)
+        data = self.cache.get_bytes(key)
+        if data is not None:
+            return data
+        with self._lock:
+            if key in self._errors:
+                raise SpeechError(self._errors[key])
+            if key not in self._pending:
+                self._pending.add(key)
+                self._queue.put((key, text))
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._work_loop, name="speech", daemon=True)
+                    self._thread.start()
+        return None
+
+    def done(self, text):
+        """True once ``text`` has finished rendering, successfully or not."""
+        with self._lock:
+            return self.key(text) not in self._pending
+
+    def _engine(self):
+        try:
+            import pyttsx3
+        except ImportError:
+            raise SpeechError("pyttsx3 is not installed")
+        try:
+            # SAPI5 needs COM set up in the thread that uses it
+            import pythoncom
+            pythoncom.CoInitialize()
+        except ImportError:
+            pass
+        try:
+            engine = pyttsx3.init()
+        except Exception as e:  # espeak/SAPI missing: RuntimeError, OSError, ...
+            raise SpeechError(f"No speech engine available: {e}")
+        if self.voice:
+            wanted = self.voice.lower()
+            for voice in engine.getProperty("voices"):
+                if voice.id == self.voice or wanted in (voice.name or "").lower():
+                    engine.setProperty("voice", voice.id)
+                    break
+        engine.setProperty("rate", self.rate)
+        return engine
+
+    def _work_loop(self):
+        try:
+            engine = self._engine()
+        except SpeechError as e:
+            engine, failure = None, str(e)
+        while True:
+            key, text = self._queue.get()
+            try:
+                if engine is None:
+                    raise SpeechError(failure)
+                self._render(engine, key, text)
+            except Exception as e:
+                with self._lock:
+                    self._errors[key] = str(e) or type(e).__name__
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def _render(self, engine, key, text):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache.directory, suffix=".wav.tmp")
+        os.close(fd)
+        try:
+            engine.save_to_file(text, tmp_path)
+            engine.runAndWait()
+            if os.path.getsize(tmp_path) == 0:
+                raise SpeechError("The speech engine produced no audio")
+            self.cache.put_file(key, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,504 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from config import cached_config
+from metrics import record, timed
+
+
+# --- Disk I/O counters ---
+# Totals for the process, plus per-thread counts so a Streamlit rerun
+# (one script thread) can see exactly what it cost.
+_io_lock = threading.Lock()
+_io_totals = {"reads": 0, "writes": 0}
+_io_local = threading.local()
+
+def count_io(kind, n=1):
+    with _io_lock:
+        _io_totals[kind] += n
+    counts = getattr(_io_local, "counts", None)
+    if counts is None:
+        counts = _io_local.counts = {"reads": 0, "writes": 0}
+    counts[kind] += n
+
+def io_counters(thread=False):
+    if thread:
+        return dict(getattr(_io_local, "counts", {"reads": 0, "writes": 0}))
+    with _io_lock:
+        return dict(_io_totals)
+
+
+# --- Load/save JSON ---
+def load_json(path, default):
+    """
+    Contents of ``path``, or ``default`` if it is missing or empty. A file
+    that doesn't parse raises ValueError rather than reading as empty, so
+    nothing gets written back over it.
+    """
+    if path.exists():
+        count_io("reads")
+        with open(path, "r", encoding="utf-8") as f:
+            content = f.read().strip()
+        if not content:
+            return default
+        try:
+            return json.loads(content)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path} is not valid JSON ({e}); fix or restore it before continuing") from e
+    return default
+
+def save_json(path, data):
+    # Write a temp file and rename it over the original, so readers in other
+    # processes see either the old file or the new one, never half of it
+    count_io("writes")
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with timed("save_json") as call, open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4)
+            call["bytes"] = f.tell()
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def _signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class _JsonFile:
+    """A JSON file kept in memory, reloaded only when its mtime or size changes."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._data = None
+        self._signature = False  # never loaded
+        self.dirty = False
+
+    def data(self):
+        signature = _signature(self.path)
+        if signature != self._signature:
+            # Forget the old copy first: if the load raises, there is nothing
+            # left that flush() could write back
+            self._data = None
+            self._signature = False
+            self.dirty = False
+            self._data = load_json(self.path, {})
+            self._signature = signature
+        return self._data
+
+    def flush(self):
+        if self.dirty and self._data is not None:
+            save_json(self.path, self._data)
+            self._signature = _signature(self.path)
+            self.dirty = False
+
+
+# --- Record stores ---
+# Both stores expose the same methods. A user's record list keeps the
+# original layout: the first entry is the demographic profile, the rest
+# are "Check Risk" results in the order they were added. Lists are keyed
+# by the account email; older versions of the app saved Check Risk
+# results under the display name, which adopt_name_keys() moves over.
+
+def _name_owners(users):
+    """Display name -> the one email using it, or None when accounts share it."""
+    owners = {}
+    for email, data in users.items():
+        name = (data or {}).get("name")
+        if name:
+            owners[name] = None if name in owners else email
+    return owners
+
+class JsonStore:
+    """
+    The original layout: users.json and patient_data.json. Files are
+    reloaded only when changed on disk, and a write only rewrites the
+    file whose contents actually changed.
+    """
+
+    def __init__(self, user_file, data_file):
+        self.user_file = Path(user_file)
+        self.data_file = Path(data_file)
+        self._lock = threading.RLock()
+        self._users = _JsonFile(self.user_file)
+        self._records = _JsonFile(self.data_file)
+
+    def get_user(self, email):
+        with self._lock:
+            user = self._users.data().get(email)
+            return dict(user) if user is not None else None
+
+    def save_user(self, email, data):
+        with self._lock:
+            users = self._users.data()
+            if users.get(email) != data:
+                users[email] = dict(data)
+                self._users.dirty = True
+            self._users.flush()
+
+    def records(self, user):
+        with self._lock:
+            return list(self._records.data().get(user, []))
+
+    def record_count(self, user):
+        with self._lock:
+            return len(self._records.data().get(user, []))
+
+    def records_since(self, user, start):
+        with self._lock:
+            return list(self._records.data().get(user, [])[start:])
+
+    def profile(self, user):
+        with self._lock:
+            records = self._records.data().get(user)
+            return dict(records[0]) if records else {}
+
+    def ensure_user_records(self, user):
+        with self._lock:
+            records = self._records.data()
+            if not user or user in records:
+                return False
+            records[user] = []
+            self._records.dirty = True
+            self._records.flush()
+            return True
+
+    def replace_records(self, user, records):
+        with self._lock:
+            self._records.data()[user] = list(records)
+            self._records.dirty = True
+            self._records.flush()
+
+    def set_profile(self, user, profile):
+        with self._lock:
+            records = self._records.data().setdefault(user, [])
+            if records:
+                if records[0] != profile:
+                    records[0] = profile
+                    self._records.dirty = True
+            else:
+                records.append(profile)
+                self._records.dirty = True
+            self._records.flush()
+
+    def append_record(self, user, record):
+        with self._lock:
+            self._records.data().setdefault(user, []).append(record)
+            self._records.dirty = True
+            self._records.flush()
+
+    def watch_paths(self):
+        return [self.user_file, self.data_file]
+
+    def adopt_name_keys(self):
+        """
+        Append records kept under a display name to its account's list.
+        Names shared by several accounts are left alone. Returns the number
+        of records moved.
+        """
+        with self._lock:
+            users = self._users.data()
+            records = self._records.data()
+            owners = _name_owners(users)
+            moved = 0
+            for key in [key for key in records if key not in users and owners.get(key)]:
+                rows = records.pop(key)
+                email = owners[key]
+                records[email] = (records.get(email) or [{}]) + rows
+                moved += len(rows)
+                self._records.dirty = True
+            self._records.flush()
+            return moved
+
+
+class SqliteStore:
+    """
+    SQLite in WAL mode. Records are rows, so saving one costs a single
+    indexed insert instead of rewriting every user's history, and
+    concurrent sessions no longer overwrite each other's changes.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            email TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user TEXT NOT NULL,
+            timestamp TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS records_user ON records (user);
+        CREATE INDEX IF NOT EXISTS records_user_timestamp ON records (user, timestamp);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads, and every
+        # Streamlit session runs on its own thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_user(self, email):
+        count_io("reads")
+        row = self._conn().execute("SELECT data FROM users WHERE email = ?", (email,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_user(self, email, data):
+        count_io("writes")
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO users (email, data) VALUES (?, ?) "
+                "ON CONFLICT (email) DO UPDATE SET data = excluded.data",
+                (email, json.dumps(data)),
+            )
+
+    def records(self, user):
+        count_io("reads")
+        rows = self._conn().execute("SELECT data FROM records WHERE user = ? ORDER BY id", (user,))
+        return [json.loads(data) for data, in rows]
+
+    def record_count(self, user):
+        count_io("reads")
+        return self._conn().execute("SELECT COUNT(*) FROM records WHERE user = ?", (user,)).fetchone()[0]
+
+    def records_since(self, user, start):
+        """Records from position ``start`` on, in the same order as records()."""
+        count_io("reads")
+        rows = self._conn().execute(
+            "SELECT data FROM records WHERE user = ? ORDER BY id LIMIT -1 OFFSET ?", (user, start)
+        )
+        return [json.loads(data) for data, in rows]
+
+    def profile(self, user):
+        count_io("reads")
+        row = self._conn().execute(
+            "SELECT data FROM records WHERE user = ? ORDER BY id LIMIT 1", (user,)
+        ).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def ensure_user_records(self, user):
+        # An empty history is simply no rows
+        return False
+
+    def replace_records(self, user, records):
+        count_io("writes")
+        with self._conn() as conn:
+            conn.execute("DELETE FROM records WHERE user = ?", (user,))
+            self._insert(conn, user, records)
+
+    def set_profile(self, user, profile):
+        count_io("writes")
+        with self._conn() as conn:
+            updated = conn.execute(
+                "UPDATE records SET data = ? WHERE id = (SELECT MIN(id) FROM records WHERE user = ?)",
+                (json.dumps(profile), user),
+            ).rowcount
+            if not updated:
+                self._insert(conn, user, [profile])
+
+    def append_record(self, user, record):
+        count_io("writes")
+        with self._conn() as conn:
+            self._insert(conn, user, [record])
+
+    def watch_paths(self):
+        # Every commit touches the WAL (or the main file after a checkpoint)
+        return [self.db_path, Path(str(self.db_path) + "-wal")]
+
+    def adopt_name_keys(self):
+        """
+        Move records kept under a display name to its account. Names shared
+        by several accounts are left alone. Returns the number of records moved.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            users = {email: json.loads(data) for email, data in conn.execute("SELECT email, data FROM users")}
+            owners = _name_owners(users)
+            moved = 0
+            for (key,) in conn.execute("SELECT DISTINCT user FROM records").fetchall():
+                email = owners.get(key)
+                if key in users or not email:
+                    continue
+                if conn.execute("SELECT 1 FROM records WHERE user = ? LIMIT 1", (email,)).fetchone():
+                    moved += conn.execute("UPDATE records SET user = ? WHERE user = ?", (email, key)).rowcount
+                else:
+                    # No profile row yet: one has to come first
+                    rows = [json.loads(data) for (data,) in conn.execute(
+                        "SELECT data FROM records WHERE user = ? ORDER BY id", (key,))]
+                    conn.execute("DELETE FROM records WHERE user = ?", (key,))
+                    self._insert(conn, email, [{}] + rows)
+                    moved += len(rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return moved
+
+    def _insert(self, conn, user, records):
+        conn.executemany(
+            "INSERT INTO records (user, timestamp, data) VALUES (?, ?, ?)",
+            [(user, record.get("timestamp"), json.dumps(record)) for record in records],
+        )
+
+    def migrate_from_json(self, user_file, data_file):
+        """
+        One-shot import of users.json / patient_data.json into an empty
+        database. Returns the number of records imported (0 if skipped).
+        """
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front, so two processes starting
+        # together can't both import
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_json'").fetchone():
+                conn.rollback()
+                return 0
+            count = 0
+            if not conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+                users = load_json(Path(user_file), {})
+                records = load_json(Path(data_file), {})
+                conn.executemany(
+                    "INSERT INTO users (email, data) VALUES (?, ?)",
+                    [(email, json.dumps(data)) for email, data in users.items()],
+                )
+                for user, user_records in records.items():
+                    self._insert(conn, user, user_records)
+                    count += len(user_records)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_json', datetime('now'))")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return count
+
+
+class CachedStore:
+    """
+    Process-wide read cache in front of a store, shared by every session.
+
+    Reads are served from memory until one of the store's files changes
+    on disk (checked with a stat, no read), so reruns that only display
+    data cost no disk I/O. Writes go straight through and drop the cache.
+    Callers get deep copies and may mutate them freely.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.RLock()
+        self._cache = {}
+        self._signature = None
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def _signatures(self):
+        return tuple(_signature(path) for path in self.store.watch_paths())
+
+    @contextmanager
+    def _locked(self, method):
+        # Time spent queued behind other sessions' reads and writes
+        start = time.perf_counter()
+        with self._lock:
+            record("store_lock_wait", time.perf_counter() - start, op=method)
+            yield
+
+    def _read(self, method, *args):
+        with self._locked(method):
+            signature = self._signatures()
+            if signature != self._signature:
+                self._cache.clear()
+                self._signature = signature
+            if (method, args) not in self._cache:
+                self._cache[(method, args)] = getattr(self.store, method)(*args)
+            return copy.deepcopy(self._cache[(method, args)])
+
+    def _write(self, method, *args):
+        with self._locked(method), timed("store_write", op=method):
+            getattr(self.store, method)(*args)
+            self._cache.clear()
+            self._signature = None
+
+    def get_user(self, email):
+        return self._read("get_user", email)
+
+    def records(self, user):
+        return self._read("records", user)
+
+    def profile(self, user):
+        return self._read("profile", user)
+
+    def record_count(self, user):
+        return self._read("record_count", user)
+
+    def records_since(self, user, start):
+        return self._read("records_since", user, start)
+
+    def save_user(self, email, data):
+        self._write("save_user", email, data)
+
+    def ensure_user_records(self, user):
+        # Called on every rerun; only drop the cache if it actually wrote
+        with self._lock:
+            if self.store.ensure_user_records(user):
+                self._cache.clear()
+                self._signature = None
+
+    def replace_records(self, user, records):
+        self._write("replace_records", user, records)
+
+    def set_profile(self, user, profile):
+        self._write("set_profile", user, profile)
+
+    def append_record(self, user, record):
+        self._write("append_record", user, record)
+
+
+def open_store(base_dir, backend=None, db_path=None):
+    """
+    Record store selected by ``backend`` or the storage_backend setting
+    ("sqlite" by default, or "json" for the original files), wrapped in a
+    CachedStore. SQLite picks up existing JSON data the first time it opens,
+    and records saved under a display name move to the account's email.
+    """
+    base_dir = Path(base_dir)
+    config = cached_config()
+    backend = backend or config["storage_backend"]
+    db_path = db_path or config["db_path"] or base_dir / "doctor_buddy.db"
+    user_file = base_dir / "users.json"
+    data_file = base_dir / "patient_data.json"
+    if backend == "json":
+        store = JsonStore(user_file, data_file)
+    elif backend == "sqlite":
+        store = SqliteStore(db_path)
+        store.migrate_from_json(user_file, data_file)
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    store.adopt_name_keys()
+    return CachedStore(store)
@@ -0,0 +1,52 @@
+"""
+Records the app used to save under a display name move to the account's
+email when the store opens:
+
+    python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage import JsonStore, SqliteStore  # noqa: E402
+
+PROFILE = {"age": 54, "sex": "Female", "weight": 70.0, "height_cm": 170.0}
+
+
+def check(i):
+    return {"timestamp": f"2025-01-0{i}T09:00:00", "glucose": 100.0 + i}
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "json":
+        return JsonStore(tmp_path / "users.json", tmp_path / "patient_data.json")
+    return SqliteStore(tmp_path / "doctor_buddy.db")
+
+
+def test_name_keyed_records_follow_the_account(store):
+    store.save_user("alice@example.com", {"name": "Alice"})
+    store.replace_records("alice@example.com", [PROFILE, check(3)])
+    store.replace_records("Alice", [check(1), check(2)])
+    # Registered without a profile row: one is added ahead of the moved records
+    store.save_user("bob@example.com", {"name": "Bob"})
+    store.replace_records("Bob", [check(4)])
+
+    assert store.adopt_name_keys() == 3
+    assert store.records("alice@example.com") == [PROFILE, check(3), check(1), check(2)]
+    assert store.records("bob@example.com") == [{}, check(4)]
+    assert store.record_count("Alice") == store.record_count("Bob") == 0
+    assert store.adopt_name_keys() == 0
+
+def test_shared_names_are_left_alone(store):
+    store.save_user("a@example.com", {"name": "Sam"})
+    store.save_user("b@example.com", {"name": "Sam"})
+    store.replace_records("Sam", [check(1)])
+    store.replace_records("pat@example.com", [PROFILE, check(2)])  # records with no account
+
+    assert store.adopt_name_keys() == 0
+    assert store.records("Sam") == [check(1)]
+    assert store.records("pat@example.com") == [PROFILE, check(2)]
@@ -0,0 +1,131 @@
+"""
+Incremental trend aggregates must match a full recompute after appends,
+edits and rebuilds:
+
+    python -m pytest tests
+"""
+import datetime
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import trends  # noqa: E402
+from storage import JsonStore, SqliteStore  # noqa: E402
+
+USER = "alice@example.com"
+START = datetime.datetime(2025, 1, 6, 9, 0)
+
+
+def make_record(i, rng):
+    """A Check Risk record a few days after the previous one, some with lab values."""
+    record = {
+        "timestamp": (START + datetime.timedelta(days=3 * i, hours=rng.randint(0, 10))).isoformat(),
+        "age": 54,
+        "sex": rng.choice(["Male", "Female"]),
+        "weight": round(rng.uniform(60, 95), 1),
+        "height_cm": 170.0,
+        "glucose": round(rng.uniform(70, 220), 1),
+        "bmi": round(rng.uniform(18, 34), 2),
+        "systolic_bp": float(rng.randint(100, 170)),
+        "diastolic_bp": float(rng.randint(60, 105)),
+        "hemoglobin": round(rng.uniform(10, 17), 1),
+        "labs": {},
+        "overall_health": "Please monitor your health",
+        "risk": [],
+    }
+    if i % 3 == 0:
+        record["labs"] = {"TSH": round(rng.uniform(0.3, 6), 2), "Glucose": 999.0}  # record field wins
+    return record
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "json":
+        store = JsonStore(tmp_path / "users.json", tmp_path / "patient_data.json")
+    else:
+        store = SqliteStore(tmp_path / "doctor_buddy.db")
+    # The profile comes first, as after registration
+    store.replace_records(USER, [{"age": 54, "sex": "Female", "weight": 70.0, "height_cm": 170.0}])
+    return store
+
+@pytest.fixture
+def trend_store(tmp_path):
+    return trends.TrendStore(tmp_path / "trends")
+
+
+def assert_matches_recompute(trend_store, store, state):
+    assert trends.verify(state, trends.build(store.records(USER))) == []
+    assert trend_store.verify(USER, store) == []
+
+
+def test_appends_match_recompute(store, trend_store):
+    rng = random.Random(1)
+    # Past the rolling window, so the ring buffer wraps
+    for i in range(3 * trends.ROLLING_WINDOW + 2):
+        store.append_record(USER, make_record(i, rng))
+        state = trend_store.sync(USER, store)
+        assert state["rows"] == i + 2
+        assert_matches_recompute(trend_store, store, state)
+
+def test_batched_appends_match_recompute(store, trend_store):
+    rng = random.Random(2)
+    trend_store.sync(USER, store)
+    for i in range(12):
+        store.append_record(USER, make_record(i, rng))
+    assert_matches_recompute(trend_store, store, trend_store.sync(USER, store))
+
+def test_edited_last_record_is_rebuilt(store, trend_store):
+    rng = random.Random(3)
+    for i in range(8):
+        store.append_record(USER, make_record(i, rng))
+    trend_store.sync(USER, store)
+
+    # Rewrite the newest record and add one after it: the tail no longer matches
+    records = store.records(USER)
+    records[-1]["glucose"] = 400.0
+    store.replace_records(USER, records)
+    store.append_record(USER, make_record(8, rng))
+    state = trend_store.sync(USER, store)
+    assert state["analytes"]["Glucose"]["max"] == 400.0
+    assert_matches_recompute(trend_store, store, state)
+
+def test_deleted_records_are_rebuilt(store, trend_store):
+    rng = random.Random(4)
+    for i in range(10):
+        store.append_record(USER, make_record(i, rng))
+    trend_store.sync(USER, store)
+
+    store.replace_records(USER, store.records(USER)[:5])
+    state = trend_store.sync(USER, store)
+    assert state["rows"] == 5
+    assert_matches_recompute(trend_store, store, state)
+
+def test_rebuild_matches_recompute(store, trend_store):
+    rng = random.Random(5)
+    for i in range(7):
+        store.append_record(USER, make_record(i, rng))
+    assert_matches_recompute(trend_store, store, trend_store.rebuild(USER, store))
+
+def test_verify_reports_drift(store, trend_store):
+    rng = random.Random(6)
+    for i in range(4):
+        store.append_record(USER, make_record(i, rng))
+    state = trend_store.sync(USER, store)
+    drifted = trends.build(store.records(USER))
+    drifted["analytes"]["Glucose"]["sum"] += 1.0
+    assert any(problem.startswith("Glucose.sum") for problem in trends.verify(state, drifted))
+
+def test_instances_sharing_a_directory_stay_in_step(store, tmp_path):
+    # Two app processes: each folds in what the other hasn't, from the same database
+    rng = random.Random(7)
+    first, second = trends.TrendStore(tmp_path / "trends"), trends.TrendStore(tmp_path / "trends")
+    for i in range(12):
+        store.append_record(USER, make_record(i, rng))
+        state = (first if i % 3 else second).sync(USER, store)
+        assert state["rows"] == i + 2
+    assert_matches_recompute(first, store, second.sync(USER, store))
+    assert_matches_recompute(second, store, first.sync(USER, store))
@@ -0,0 +1,394 @@
+"""
+Per-user trend aggregates for each analyte (glucose, hemoglobin, BP, BMI,
+weight and every lab value), kept up to date as records are appended.
+
+Each record folds into the summary in O(1): running count/sum/min/max, a
+ring buffer of the last ROLLING_WINDOW readings for the rolling mean,
+the latest abnormal reading, and count/sum/min/max buckets per ISO week
+and calendar month for charts. Like the history mirror, the store stays
+the source of truth: sync() folds in only the records appended since the
+last call and rebuilds from scratch when the history was rewritten.
+build() is the full recompute and verify() compares the two. TrendStore
+keeps the aggregates in SQLite and writes only what a record changed.
+"""
+import datetime
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+from pathlib import Path
+
+from risk import RISK_THRESHOLDS
+
+# Rolling mean over the last N readings (check-ins are irregular, so
+# readings rather than days)
+ROLLING_WINDOW = 5
+
+# Record field -> analyte; these win over the same analyte in "labs"
+RECORD_FIELDS = {
+    "glucose": "Glucose",
+    "hemoglobin": "Hemoglobin",
+    "systolic_bp": "Systolic_BP",
+    "diastolic_bp": "Diastolic_BP",
+    "bmi": "BMI",
+    "weight": "Weight",
+}
+
+def _hb_low(value, record, t):
+    sex = str(record.get("sex", "")).lower()
+    if sex == "male":
+        return value < t["hb_low_male"]
+    if sex == "female":
+        return value < t["hb_low_female"]
+    return False
+
+def _bmi_off(value, record, t):
+    try:
+        adult = float(record.get("age", t["adult_age"])) >= t["adult_age"]
+    except (TypeError, ValueError):
+        adult = True
+    return adult and not t["bmi_under"] <= value < t["bmi_over"]
+
+# Same cut-offs as check_risks; analytes without a rule are never abnormal
+ABNORMAL = {
+    "Glucose": lambda v, r, t: v >= t["glucose_high"],
+    "Systolic_BP": lambda v, r, t: v >= t["systolic_high"],
+    "Diastolic_BP": lambda v, r, t: v >= t["diastolic_high"],
+    "TSH": lambda v, r, t: v > t["tsh_high"],
+    "ALT": lambda v, r, t: v > t["alt_high"],
+    "AST": lambda v, r, t: v > t["ast_high"],
+    "Creatinine": lambda v, r, t: v > t["creatinine_high"],
+    "Urea": lambda v, r, t: v > t["urea_high"],
+    "Hemoglobin": _hb_low,
+    "BMI": _bmi_off,
+}
+
+
+# --- Folding records in ---
+def _timestamp(record):
+    try:
+        return datetime.datetime.fromisoformat(record["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return None  # the profile row, or a hand-edited record
+
+def _number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value) if math.isfinite(value) else None
+
+def record_values(record):
+    """{analyte: value} for the numeric readings in one record."""
+    values = {}
+    labs = record.get("labs")
+    if isinstance(labs, dict):
+        for name, value in labs.items():
+            values[name] = _number(value)
+    for field, name in RECORD_FIELDS.items():
+        if field in record:
+            values[name] = _number(record[field])
+    return {name: value for name, value in values.items() if value is not None}
+
+def _period_keys(when):
+    year, week, _ = when.isocalendar()
+    return f"{year}-W{week:02d}", f"{when.year}-{when.month:02d}"
+
+def _bucket_add(buckets, key, value):
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = [1, value, value, value]
+    else:
+        bucket[0] += 1
+        bucket[1] += value
+        bucket[2] = min(bucket[2], value)
+        bucket[3] = max(bucket[3], value)
+
+def _new_analyte():
+    return {
+        "count": 0, "sum": 0.0, "min": None, "max": None,
+        "first": None, "last": None, "last_value": None,
+        "ring": [], "head": 0, "ring_sum": 0.0,
+        "last_abnormal": None, "last_abnormal_value": None,
+        "weeks": {}, "months": {},
+    }
+
+def empty_state():
+    return {"rows": 0, "tail": None, "analytes": {}}
+
+def update(state, record, thresholds=RISK_THRESHOLDS):
+    """Fold one appended record into ``state`` (in place). O(1) per analyte."""
+    state["rows"] += 1
+    state["tail"] = _fingerprint(record)
+    when = _timestamp(record)
+    if when is None:
+        return state
+    stamp = when.isoformat()
+    week, month = _period_keys(when)
+    for name, value in record_values(record).items():
+        a = state["analytes"].get(name)
+        if a is None:
+            a = state["analytes"][name] = _new_analyte()
+        a["count"] += 1
+        a["sum"] += value
+        a["min"] = value if a["min"] is None else min(a["min"], value)
+        a["max"] = value if a["max"] is None else max(a["max"], value)
+        a["first"] = a["first"] or stamp
+        a["last"], a["last_value"] = stamp, value
+        # Ring buffer: overwrite the oldest reading once full
+        ring = a["ring"]
+        if len(ring) < ROLLING_WINDOW:
+            ring.append(value)
+        else:
+            a["ring_sum"] -= ring[a["head"]]
+            ring[a["head"]] = value
+            a["head"] = (a["head"] + 1) % ROLLING_WINDOW
+        a["ring_sum"] += value
+        rule = ABNORMAL.get(name)
+        if rule and rule(value, record, thresholds):
+            a["last_abnormal"], a["last_abnormal_value"] = stamp, value
+        _bucket_add(a["weeks"], week, value)
+        _bucket_add(a["months"], month, value)
+    return state
+
+def build(records, thresholds=RISK_THRESHOLDS):
+    """Full recompute from raw history."""
+    state = empty_state()
+    for record in records:
+        update(state, record, thresholds)
+    return state
+
+def _fingerprint(record):
+    return hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+# --- Reading ---
+def rolling_mean(a):
+    return a["ring_sum"] / len(a["ring"]) if a["ring"] else None
+
+def days_since(stamp, now=None):
+    if not stamp:
+        return None
+    now = now or datetime.datetime.now()
+    return (now - datetime.datetime.fromisoformat(stamp)).days
+
+def summary(state, now=None):
+    """One row per analyte for display, most-measured first."""
+    rows = []
+    for name, a in state["analytes"].items():
+        rows.append({
+            "Analyte": name,
+            "Readings": a["count"],
+            "Mean": round(a["sum"] / a["count"], 2),
+            f"Last {ROLLING_WINDOW} mean": round(rolling_mean(a), 2),
+            "Min": a["min"],
+            "Max": a["max"],
+            "Latest": a["last_value"],
+            "Days since abnormal": days_since(a["last_abnormal"], now),
+        })
+    return sorted(rows, key=lambda row: (-row["Readings"], row["Analyte"]))
+
+def buckets(state, analyte, period="weeks"):
+    """[(bucket, count, mean, min, max)] in time order; period is "weeks" or "months"."""
+    a = state["analytes"].get(analyte)
+    if not a:
+        return []
+    return [(key, n, total / n, lo, hi) for key, (n, total, lo, hi) in sorted(a[period].items())]
+
+
+# --- Checking against a full recompute ---
+def _close(x, y):
+    if isinstance(x, float) and isinstance(y, float):
+        return math.isclose(x, y, rel_tol=1e-9, abs_tol=1e-9)
+    return x == y
+
+def verify(state, expected):
+    """
+    Differences between incrementally maintained ``state`` and ``expected``
+    (normally build(records)), as readable strings; empty when they agree.
+    Sums are compared with a float tolerance.
+    """
+    problems = []
+    if state["rows"] != expected["rows"]:
+        problems.append(f"rows: {state['rows']} != {expected['rows']}")
+    for name in sorted(set(state["analytes"]) | set(expected["analytes"])):
+        a, b = state["analytes"].get(name), expected["analytes"].get(name)
+        if a is None or b is None:
+            problems.append(f"{name}: missing from {'state' if a is None else 'recompute'}")
+            continue
+        for field in ("count", "sum", "min", "max", "first", "last", "last_value", "last_abnormal",
+                      "last_abnormal_value"):
+            if not _close(a[field], b[field]):
+                problems.append(f"{name}.{field}: {a[field]!r} != {b[field]!r}")
+        # Same readings in the window, whatever the ring's rotation
+        if sorted(a["ring"]) != sorted(b["ring"]) or not _close(rolling_mean(a), rolling_mean(b)):
+            problems.append(f"{name}.rolling: {a['ring']!r} != {b['ring']!r}")
+        for period in ("weeks", "months"):
+            if a[period].keys() != b[period].keys():
+                problems.append(f"{name}.{period}: buckets differ")
+                continue
+            for key, bucket in a[period].items():
+                if not all(_close(x, y) for x, y in zip(bucket, b[period][key])):
+                    problems.append(f"{name}.{period}[{key}]: {bucket!r} != {b[period][key]!r}")
+    return problems
+
+
+class TrendStore:
+    """
+    Every user's aggregates in one SQLite file (trends.db), synced from the
+    record store. A user's totals and ring buffer are one row per analyte
+    and each week/month bucket is a row of its own, so folding in a record
+    writes only the analytes and buckets it touched. States stay cached in
+    memory and are updated in place while the stored row count and tail
+    still match.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS trend_users (
+            user TEXT PRIMARY KEY,
+            rows INTEGER NOT NULL,
+            tail TEXT
+        );
+        CREATE TABLE IF NOT EXISTS trend_analytes (
+            user TEXT NOT NULL,
+            analyte TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (user, analyte)
+        );
+        CREATE TABLE IF NOT EXISTS trend_buckets (
+            user TEXT NOT NULL,
+            analyte TEXT NOT NULL,
+            period TEXT NOT NULL,
+            key TEXT NOT NULL,
+            n INTEGER NOT NULL,
+            total REAL NOT NULL,
+            lo REAL NOT NULL,
+            hi REAL NOT NULL,
+            PRIMARY KEY (user, analyte, period, key)
+        );
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.directory / "trends.db"
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._states = {}  # user -> state, valid while trend_users still has its rows and tail
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _load(self, user):
+        conn = self._conn()
+        head = conn.execute("SELECT rows, tail FROM trend_users WHERE user = ?", (user,)).fetchone()
+        if head is None:
+            self._states.pop(user, None)
+            return empty_state()
+        cached = self._states.get(user)
+        if cached is not None and (cached["rows"], cached["tail"]) == head:
+            return cached
+        state = {"rows": head[0], "tail": head[1], "analytes": {}}
+        for name, data in conn.execute("SELECT analyte, data FROM trend_analytes WHERE user = ?", (user,)):
+            state["analytes"][name] = dict(json.loads(data), weeks={}, months={})
+        for name, period, key, n, total, lo, hi in conn.execute(
+            "SELECT analyte, period, key, n, total, lo, hi FROM trend_buckets WHERE user = ?", (user,)
+        ):
+            state["analytes"][name][period][key] = [n, total, lo, hi]
+        self._states[user] = state
+        return state
+
+    def _write(self, conn, user, state, names, keys=None):
+        """Upsert the head, ``names``' totals and their buckets (only ``keys`` when given)."""
+        conn.execute("INSERT OR REPLACE INTO trend_users (user, rows, tail) VALUES (?, ?, ?)",
+                     (user, state["rows"], state["tail"]))
+        for name in names:
+            a = state["analytes"][name]
+            totals = {field: value for field, value in a.items() if field not in ("weeks", "months")}
+            conn.execute("INSERT OR REPLACE INTO trend_analytes (user, analyte, data) VALUES (?, ?, ?)",
+                         (user, name, json.dumps(totals)))
+            conn.executemany(
+                "INSERT OR REPLACE INTO trend_buckets (user, analyte, period, key, n, total, lo, hi) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(user, name, period, key, *a[period][key])
+                 for period in ("weeks", "months")
+                 for key in (a[period] if keys is None else [keys[period]])],
+            )
+
+    def _append(self, user, state, records):
+        """
+        Fold ``records`` into the cached ``state`` and persist just what they
+        touched. False, with nothing changed, if another process moved the
+        user's aggregates on in the meantime.
+        """
+        conn = self._conn()
+        # IMMEDIATE takes the write lock before the check, so two processes
+        # can't both fold in the same records
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            head = conn.execute("SELECT rows, tail FROM trend_users WHERE user = ?", (user,)).fetchone()
+            if head != (state["rows"], state["tail"]):
+                conn.rollback()
+                self._states.pop(user, None)
+                return False
+            for record in records:
+                update(state, record)
+                when = _timestamp(record)
+                if when is not None:
+                    week, month = _period_keys(when)
+                    self._write(conn, user, state, record_values(record), {"weeks": week, "months": month})
+            self._write(conn, user, state, [])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            self._states.pop(user, None)  # folded in memory but not on disk
+            raise
+        return True
+
+    def sync(self, user, store):
+        """
+        Fold in records appended since the last sync and return the state.
+        One cached count when nothing changed; a rebuild when the history
+        shrank or the last record seen was rewritten.
+        """
+        with self._lock:
+            while True:
+                state = self._load(user)
+                count = store.record_count(user)
+                if count == state["rows"]:
+                    return state
+                if not 0 < state["rows"] < count:
+                    break
+                # Re-read the last record already folded in, to notice rewrites
+                new = store.records_since(user, state["rows"] - 1)
+                if _fingerprint(new[0]) != state["tail"]:
+                    break
+                if self._append(user, state, new[1:]):
+                    return state
+                # Another process got there first: start again from its state
+            return self.rebuild(user, store)
+
+    def rebuild(self, user, store):
+        with self._lock:
+            state = build(store.records(user))
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM trend_analytes WHERE user = ?", (user,))
+                conn.execute("DELETE FROM trend_buckets WHERE user = ?", (user,))
+                self._write(conn, user, state, state["analytes"])
+            self._states[user] = state
+            return state
+
+    def verify(self, user, store):
+        """verify() of the stored aggregates against a recompute from the store."""
+        with self._lock:
+            self._states.pop(user, None)  # what is on disk, not the cached copy
+            return verify(self._load(user), build(store.records(user)))
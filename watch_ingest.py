@@ -0,0 +1,436 @@
+"""
+Watch-folder ingestion: process lab reports as they are dropped into
+per-user folders and append the results to each user's records.
+
+    python watch_ingest.py /srv/lab-drop --workers 4
+
+Layout is <root>/<user>/.../report.pdf, where <user> is a login email
+or an existing records key. Records are stored under that key, and the
+age, sex, weight and height come from the profile saved under it at
+registration. Files are
+picked up from filesystem events rather than directory listings, and a
+file is only processed once its size and mtime have held still for
+--settle seconds, so half-copied uploads are never read. Each report goes
+through ingest.process_file (extract_bytes -> parse_lab_values ->
+check_risks) in a pool of --workers processes, with at most
+--max-in-flight files queued. A CSV export with several patients'
+results adds one record per patient, tagged with its id.
+
+Every processed file is kept in an SQLite index (path, size, mtime, hash).
+On start the tree is listed once and only files whose size or mtime
+differ from the index are queued; a changed mtime with the same content
+hash (a re-copy, a touch) is not processed again. Use --polling for
+network shares that don't deliver change notifications.
+
+Failures are kept in a separate table and retried with backoff, up to
+MAX_ATTEMPTS times per version of the file, and again after a restart. If
+a worker process dies, the pool is replaced and its files are retried.
+"""
+import argparse
+import datetime
+import hashlib
+import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
+
+from extraction import DEFAULT_DPI, MIME_TYPES
+from ingest import DEFAULT_VITALS, RISK_ANALYTES, process_file
+from preprocess import DEFAULT_PREPROCESS
+from storage import open_store
+
+# Quiet time before a file counts as fully written
+SETTLE_SECONDS = 2.0
+TICK_SECONDS = 0.5
+# Failed files: first retry after RETRY_SECONDS, doubling each time
+RETRY_SECONDS = 30.0
+MAX_ATTEMPTS = 5
+
+
+# --- Index of processed files ---
+class FileIndex:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT,
+            user TEXT,
+            status TEXT NOT NULL,
+            error TEXT,
+            processed TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS failures (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            user TEXT,
+            attempts INTEGER NOT NULL,
+            error TEXT,
+            retry_at REAL,
+            failed TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(str(db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(self.SCHEMA)
+        with self.conn:
+            # Older indexes kept failures in files, where they counted as done
+            self.conn.execute("DELETE FROM files WHERE status = 'failed'")
+
+    def get(self, path):
+        row = self.conn.execute("SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (path,)).fetchone()
+        return None if row is None else {"size": row[0], "mtime_ns": row[1], "sha256": row[2]}
+
+    def put(self, path, size, mtime_ns, sha256, user, status, error=None):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256, user, status, error, processed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, sha256, user, status, error, datetime.datetime.now().isoformat()),
+            )
+
+    def put_failure(self, path, size, mtime_ns, user, error):
+        """Record a failed attempt and schedule the next; returns the attempt count."""
+        row = self.conn.execute("SELECT size, mtime_ns, attempts FROM failures WHERE path = ?", (path,)).fetchone()
+        # A new version of the file starts over
+        attempts = row[2] + 1 if row and (row[0], row[1]) == (size, mtime_ns) else 1
+        retry_at = time.time() + RETRY_SECONDS * 2 ** (attempts - 1) if attempts < MAX_ATTEMPTS else None
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO failures (path, size, mtime_ns, user, attempts, error, retry_at, failed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (path, size, mtime_ns, user, attempts, error, retry_at, datetime.datetime.now().isoformat()),
+            )
+        return attempts
+
+    def clear_failure(self, path):
+        with self.conn:
+            self.conn.execute("DELETE FROM failures WHERE path = ?", (path,))
+
+    def take_due_retries(self, now=None):
+        """Paths whose retry time has come; each is handed out once per failure."""
+        now = time.time() if now is None else now
+        with self.conn:
+            paths = [path for path, in self.conn.execute(
+                "SELECT path FROM failures WHERE retry_at IS NOT NULL AND retry_at <= ?", (now,)
+            )]
+            self.conn.executemany("UPDATE failures SET retry_at = NULL WHERE path = ?", [(p,) for p in paths])
+        return paths
+
+    def close(self):
+        self.conn.close()
+
+
+# --- Per-file work (runs in pool workers) ---
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def process_report(path, options, vitals, stream, known_hash):
+    """process_file's rows, unless the content hash says it was already done."""
+    sha256 = file_hash(path)
+    if sha256 == known_hash:
+        return [{"status": "unchanged", "sha256": sha256}]
+    rows = process_file(path, options, vitals, stream)
+    for row in rows:
+        row["sha256"] = sha256
+    return rows
+
+def record_for(row, vitals, source):
+    """A record shaped like the ones main_app_ui saves, from a process_file row."""
+    labs = row["labs"]
+    bmi = round(vitals["weight"] / ((vitals["height_cm"] / 100) ** 2), 2)
+    record = {
+        "timestamp": datetime.datetime.now().isoformat(),
+        "age": vitals["age"],
+        "sex": vitals["sex"],
+        "weight": vitals["weight"],
+        "height_cm": vitals["height_cm"],
+        "glucose": float(labs.get("Glucose", vitals["glucose"])),
+        "bmi": bmi,
+        "systolic_bp": float(labs.get("Systolic_BP", vitals["systolic_bp"])),
+        "diastolic_bp": float(labs.get("Diastolic_BP", vitals["diastolic_bp"])),
+        "hemoglobin": float(labs.get("Hemoglobin", vitals["hemoglobin"])),
+        "labs": labs,
+        "overall_health": row["overall_health"],
+        "risk": row["risk"],
+        "source": source,
+    }
+    if row.get("patient"):
+        record["patient"] = row["patient"]
+    return record
+
+
+# --- Events ---
+class _Pending(FileSystemEventHandler):
+    """Remembers when each report path last changed; the service loop decides when it has settled."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = {}  # path -> [time of last event, last stat seen or None]
+
+    def add(self, path):
+        if Path(path).suffix.lower() in MIME_TYPES and not Path(path).name.startswith("."):
+            with self.lock:
+                self.paths[path] = [time.monotonic(), None]
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.add(os.fsdecode(event.src_path))
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.add(os.fsdecode(event.src_path))
+
+    def on_closed(self, event):
+        if not event.is_directory:
+            self.add(os.fsdecode(event.src_path))
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.discard(os.fsdecode(event.src_path))
+            self.add(os.fsdecode(event.dest_path))
+
+    def on_deleted(self, event):
+        self.discard(os.fsdecode(event.src_path))
+
+    def discard(self, path):
+        with self.lock:
+            self.paths.pop(path, None)
+
+
+# --- Service ---
+class WatchIngest:
+    def __init__(self, root, store, index, workers=None, max_in_flight=None, options=None, stream=None,
+                 settle=SETTLE_SECONDS, polling=False):
+        self.root = Path(root).resolve()
+        self.store = store
+        self.index = index
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight or self.workers * 2
+        self.options = dict(options or {}, ocr_workers=1)  # parallel across files, not pages
+        self.stream = stream
+        self.settle = settle
+        self.pending = _Pending()
+        self.observer = PollingObserver() if polling else Observer()
+        self.in_flight = {}  # future -> (path, stat, user, vitals)
+        self.stats = {"ok": 0, "failed": 0, "retried": 0, "unchanged": 0, "skipped": 0, "unknown_user": 0}
+        self._stop = threading.Event()
+
+    def stop(self, *_):
+        self._stop.set()
+
+    # A file's user folder and the records it goes to
+    def user_for(self, path):
+        """
+        The records key for ``path``: its folder, if that is a login email or
+        already has records. Display names aren't unique, so never those.
+        """
+        parts = Path(path).relative_to(self.root).parts
+        if len(parts) < 2:
+            return None
+        folder = parts[0]
+        if self.store.get_user(folder) or self.store.record_count(folder):
+            return folder
+        return None
+
+    def vitals_for(self, user):
+        # Registration and the profile page keep the profile under the email
+        profile = self.store.profile(user)
+        vitals = dict(DEFAULT_VITALS)
+        for key in ("age", "sex", "weight", "height_cm"):
+            if profile.get(key) is not None:
+                vitals[key] = profile[key]
+        return vitals
+
+    def _unchanged(self, path, st):
+        known = self.index.get(path)
+        return known is not None and known["size"] == st.st_size and known["mtime_ns"] == st.st_mtime_ns
+
+    def initial_scan(self):
+        """Queue files added or changed while the service was down; stats only, no reads."""
+        queued = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if Path(name).suffix.lower() in MIME_TYPES and not self._unchanged(path, st):
+                    self.pending.add(path)
+                    queued += 1
+        return queued
+
+    def _settled(self):
+        """Paths whose size and mtime held still for the settle time, oldest event first."""
+        now = time.monotonic()
+        ready = []
+        busy = {path for path, _, _, _ in self.in_flight.values()}
+        with self.pending.lock:
+            for path, entry in sorted(self.pending.paths.items(), key=lambda item: item[1][0]):
+                if now - entry[0] < self.settle or path in busy:
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    del self.pending.paths[path]
+                    continue
+                signature = (st.st_size, st.st_mtime_ns)
+                if entry[1] != signature:
+                    # Still being written (or first look): wait another settle period
+                    entry[0], entry[1] = now, signature
+                    continue
+                ready.append((path, st))
+        return ready
+
+    def _queue_retries(self):
+        for path in self.index.take_due_retries():
+            if os.path.exists(path):
+                self.pending.add(path)
+                self.stats["retried"] += 1
+
+    def _submit(self, pool):
+        """Raises BrokenProcessPool, with the file put back, if the pool has died."""
+        for path, st in self._settled():
+            if len(self.in_flight) >= self.max_in_flight:
+                break
+            self.pending.discard(path)
+            if self._unchanged(path, st):
+                self.stats["skipped"] += 1
+                continue
+            user = self.user_for(path)
+            if user is None:
+                self.stats["unknown_user"] += 1
+                print(f"skip  {self._name(path)}: no user for this folder", flush=True)
+                continue
+            known = self.index.get(path)
+            vitals = self.vitals_for(user)
+            try:
+                future = pool.submit(process_report, path, self.options, vitals, self.stream,
+                                     known["sha256"] if known else None)
+            except BrokenProcessPool:
+                self.pending.add(path)
+                raise
+            self.in_flight[future] = (path, st, user, vitals)
+
+    def _collect(self, wait=False):
+        for future in [f for f in self.in_flight if wait or f.done()]:
+            path, st, user, vitals = self.in_flight.pop(future)
+            try:
+                rows = future.result()
+            except Exception as e:  # worker died
+                rows = [{"status": "failed", "error": f"{type(e).__name__}: {e}", "sha256": None}]
+            row = rows[0]  # status and hash are per file
+            self.stats[row["status"]] += 1
+            if row["status"] == "failed":
+                # Not indexed as processed, so nothing stops the retry
+                attempts = self.index.put_failure(path, st.st_size, st.st_mtime_ns, user, row["error"])
+                retry = "will retry" if attempts < MAX_ATTEMPTS else "giving up until it changes"
+                print(f"fail  {self._name(path)} (attempt {attempts}, {retry}): {row['error']}", flush=True)
+                continue
+            if row["status"] == "ok":
+                for each in rows:
+                    self.store.append_record(user, record_for(each, vitals, self._name(path)))
+                    patient = f" (patient {each['patient']})" if each.get("patient") else ""
+                    print(f"ok    {self._name(path)}{patient} -> {user}: {each['overall_health']}", flush=True)
+            # Indexed with the stat seen at submission: a file changed since gets picked up again
+            self.index.put(path, st.st_size, st.st_mtime_ns, row["sha256"], user, row["status"])
+            self.index.clear_failure(path)
+
+    def _name(self, path):
+        return Path(path).relative_to(self.root).as_posix()
+
+    def run(self, initial_scan=True):
+        self.observer.schedule(self.pending, str(self.root), recursive=True)
+        self.observer.start()
+        try:
+            if initial_scan:
+                print(f"{self.initial_scan()} new or changed files found at start", flush=True)
+            pool = ProcessPoolExecutor(max_workers=self.workers)
+            try:
+                while not self._stop.is_set():
+                    self._collect()
+                    self._queue_retries()
+                    try:
+                        self._submit(pool)
+                    except BrokenProcessPool:
+                        # A worker died (out of memory, a crash in a native
+                        # library): its files fail and are retried on a new pool
+                        print("worker pool broke; starting a new one", flush=True)
+                        self._collect(wait=True)
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        pool = ProcessPoolExecutor(max_workers=self.workers)
+                    self._stop.wait(TICK_SECONDS)
+                self._collect(wait=True)
+            finally:
+                pool.shutdown()
+        finally:
+            self.observer.stop()
+            self.observer.join()
+        return self.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", type=Path, help="drop folder with one subfolder per user")
+    parser.add_argument("--base-dir", type=Path, default=Path.cwd(), help="directory holding the record store")
+    parser.add_argument("--index", type=Path, default=None, help="file index (default: <base-dir>/watch_index.db)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="files queued at once (default: 2x workers)")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="seconds a file must stay unchanged before it is read")
+    parser.add_argument("--polling", action="store_true", help="poll for changes (network shares)")
+    parser.add_argument("--no-initial-scan", action="store_true", help="only react to events from now on")
+    parser.add_argument("--poppler-path", default=os.getenv("POPPLER_PATH"))
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI)
+    parser.add_argument("--no-preprocess", action="store_true", help="OCR raw page images")
+    parser.add_argument("--early-stop", action="store_true",
+                        help="read PDFs page by page and stop once check_risks has every analyte it uses")
+    args = parser.parse_args(argv)
+
+    if not args.root.is_dir():
+        parser.error(f"{args.root} is not a directory")
+    preprocess = None if args.no_preprocess else dict(DEFAULT_PREPROCESS)
+    stream = {"targets": RISK_ANALYTES, "max_pages": None, "max_seconds": None} if args.early_stop else None
+    index = FileIndex(args.index or args.base_dir / "watch_index.db")
+    service = WatchIngest(
+        args.root,
+        open_store(args.base_dir),
+        index,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        options={"poppler_path": args.poppler_path, "dpi": args.dpi, "preprocess": preprocess},
+        stream=stream,
+        settle=args.settle,
+        polling=args.polling,
+    )
+    signal.signal(signal.SIGINT, service.stop)
+    signal.signal(signal.SIGTERM, service.stop)
+    print(f"Watching {service.root} (Ctrl+C to stop)", flush=True)
+    try:
+        stats = service.run(initial_scan=not args.no_initial_scan)
+    finally:
+        index.close()
+    print(", ".join(f"{count} {name.replace('_', ' ')}" for name, count in stats.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())